@@ -24,7 +24,7 @@ class UserInline(admin.TabularInline):
 # ---------- ORGANIZATION ADMIN ----------
 @admin.register(Organization)
 class OrganizationAdmin(admin.ModelAdmin):
-    list_display = ("name", "domain")
+    list_display = ("name", "domain", "archive_closed_after_days")
     search_fields = ("name", "domain")
 
     # ⭐ This enables inline users
@@ -41,3 +41,46 @@ class PlanAdmin(admin.ModelAdmin):
 class SubscriptionAdmin(admin.ModelAdmin):
     # list_display = ("organization", "plan", "start_date", "end_date")
     list_display = ("organization", "plan")
+
+
+from .models import Job
+
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ("id", "name", "status", "attempts", "progress", "organization", "run_after", "finished_at")
+    list_filter = ("status", "name")
+    search_fields = ("name", "last_error")
+    readonly_fields = ("locked_by", "locked_at", "started_at", "finished_at", "created_at")
+
+
+from .models import OutboxEmail
+
+
+@admin.register(OutboxEmail)
+class OutboxEmailAdmin(admin.ModelAdmin):
+    list_display = ("id", "to_email", "subject", "status", "attempts", "organization", "created_at", "sent_at")
+    list_filter = ("status",)
+    search_fields = ("to_email", "subject", "provider_message_id")
+    readonly_fields = ("provider_message_id", "last_error", "locked_at", "created_at", "sent_at")
+
+
+from .models import OrganizationUsage
+
+
+@admin.register(OrganizationUsage)
+class OrganizationUsageAdmin(admin.ModelAdmin):
+    list_display = ("organization", "observations", "users", "updated_at")
+    search_fields = ("organization__name",)
+    readonly_fields = ("observations", "users", "updated_at")
+
+
+from .models import ApiToken
+
+
+@admin.register(ApiToken)
+class ApiTokenAdmin(admin.ModelAdmin):
+    list_display = ("name", "prefix", "user", "organization", "rate_limit", "last_used_at", "revoked_at")
+    list_filter = ("revoked_at",)
+    search_fields = ("name", "prefix", "user__email")
+    readonly_fields = ("prefix", "key_hash", "created_at", "last_used_at")
@@ -0,0 +1,253 @@
+# core/api.py
+"""
+Plumbing of the versioned JSON API (``/api/v1/``, routes in core/api_urls.py).
+
+Every endpoint is a plain view wrapped in ``api_view``, which
+
+* authenticates the ``Authorization: Bearer <key>`` header against ApiToken
+  and sets ``request.user``, ``request.tenant`` and ``request.organization``
+  the way OrganizationMiddleware does for browser sessions;
+* applies the token's rate limit (a per-minute counter in the "shared"
+  cache, which every worker sees);
+* turns ApiError into a JSON error response.
+
+The helpers below are shared by the endpoints: sparse field selection
+(``?fields=``), keyset pagination with opaque cursors, and ETags so that
+polling clients get a cheap 304 Not Modified.
+"""
+import hashlib
+import json
+import secrets
+from datetime import timedelta
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpResponse, JsonResponse
+from django.utils import timezone
+from django.views.decorators.csrf import csrf_exempt
+
+from observations.pagination import KeysetPaginator
+
+from . import tenant
+from .models import ApiToken
+
+API_CACHE_ALIAS = getattr(settings, "API_CACHE_ALIAS", "shared")
+# Requests per minute per token, unless the token sets its own.
+API_RATE_LIMIT = getattr(settings, "API_RATE_LIMIT", 120)
+
+API_PAGE_SIZE = 50
+API_MAX_PAGE_SIZE = 200
+
+TOKEN_PREFIX = "sop_"
+# last_used_at is written at most this often per token.
+LAST_USED_RESOLUTION = timedelta(minutes=1)
+
+
+class ApiError(Exception):
+    def __init__(self, status, message, errors=None, headers=None):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+        self.errors = errors
+        self.headers = headers or {}
+
+
+def error_response(status, message, errors=None, headers=None):
+    body = {"error": message}
+    if errors:
+        body["errors"] = errors
+    response = JsonResponse(body, status=status)
+    for name, value in (headers or {}).items():
+        response[name] = value
+    return response
+
+
+# ---------------------------------------------------------------------------
+# Tokens
+# ---------------------------------------------------------------------------
+
+def hash_key(key):
+    return hashlib.sha256(key.encode()).hexdigest()
+
+
+def create_token(user, name, rate_limit=None):
+    """Create a token for ``user``. Returns ``(token, key)``; the key is not stored."""
+    key = TOKEN_PREFIX + secrets.token_urlsafe(32)
+    token = ApiToken.objects.create(
+        user=user,
+        organization_id=user.organization_id,
+        name=name,
+        prefix=key[:len(TOKEN_PREFIX) + 6],
+        key_hash=hash_key(key),
+        rate_limit=rate_limit,
+    )
+    return token, key
+
+
+def authenticate(request):
+    header = request.headers.get("Authorization", "")
+    scheme, _, key = header.partition(" ")
+    if scheme.lower() not in ("bearer", "token") or not key.strip():
+        raise ApiError(401, "Authentication credentials were not provided.",
+                       headers={"WWW-Authenticate": "Bearer"})
+    token = (
+        ApiToken.objects
+        .select_related("user")
+        .filter(key_hash=hash_key(key.strip()), revoked_at__isnull=True)
+        .first()
+    )
+    if token is None or not token.user.is_active or token.user.organization_id != token.organization_id:
+        raise ApiError(401, "Invalid or revoked token.", headers={"WWW-Authenticate": "Bearer"})
+
+    now = timezone.now()
+    if token.last_used_at is None or token.last_used_at < now - LAST_USED_RESOLUTION:
+        ApiToken.objects.filter(pk=token.pk).update(last_used_at=now)
+    return token
+
+
+def throttle(token):
+    """
+    Count one request against the token's per-minute limit. Returns
+    ``(limit, remaining, reset_seconds)``; raises ApiError(429) over the limit.
+    """
+    limit = token.rate_limit or API_RATE_LIMIT
+    now = int(timezone.now().timestamp())
+    window = now // 60
+    reset = 60 - now % 60
+    key = f"api:rate:{token.pk}:{window}"
+    cache = caches[API_CACHE_ALIAS]
+    cache.add(key, 0, timeout=61)
+    try:
+        count = cache.incr(key)
+    except ValueError:
+        # Expired between add() and incr().
+        cache.set(key, 1, timeout=61)
+        count = 1
+    if count > limit:
+        raise ApiError(429, "Rate limit exceeded.", headers={
+            "Retry-After": str(reset),
+            "X-RateLimit-Limit": str(limit),
+            "X-RateLimit-Remaining": "0",
+        })
+    return limit, limit - count, reset
+
+
+def api_view(*methods):
+    """Make ``view`` a token-authenticated, rate-limited JSON endpoint accepting ``methods``."""
+    def decorator(view):
+        @csrf_exempt
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            try:
+                token = authenticate(request)
+                limit, remaining, reset = throttle(token)
+                if request.method not in methods:
+                    raise ApiError(405, f"Method {request.method} not allowed.",
+                                   headers={"Allow": ", ".join(methods)})
+                request.api_token = token
+                request.user = token.user
+                request.tenant = tenant.resolve(token.user)
+                if request.tenant is None:
+                    raise ApiError(403, "The token's user has no organization.")
+                request.organization = request.tenant.organization
+                response = view(request, *args, **kwargs)
+            except ApiError as e:
+                return error_response(e.status, e.message, e.errors, e.headers)
+            response["X-RateLimit-Limit"] = str(limit)
+            response["X-RateLimit-Remaining"] = str(remaining)
+            response["X-RateLimit-Reset"] = str(reset)
+            return response
+        return wrapper
+    return decorator
+
+
+# ---------------------------------------------------------------------------
+# Request and response helpers
+# ---------------------------------------------------------------------------
+
+def read_json(request):
+    """The JSON object in the request body."""
+    try:
+        data = json.loads(request.body or b"{}")
+    except (ValueError, UnicodeDecodeError):
+        raise ApiError(400, "The request body is not valid JSON.")
+    if not isinstance(data, dict):
+        raise ApiError(400, "The request body must be a JSON object.")
+    return data
+
+
+def select_fields(request, available, default=None):
+    """The ``?fields=a,b`` of the request, checked against ``available``."""
+    raw = request.GET.get("fields", "").strip()
+    if not raw:
+        return list(default or available)
+    fields = [name.strip() for name in raw.split(",") if name.strip()]
+    unknown = [name for name in fields if name not in available]
+    if unknown:
+        raise ApiError(400, f"Unknown fields: {', '.join(unknown)}.",
+                       errors={"fields": sorted(available)})
+    return fields
+
+
+def page_size(request):
+    try:
+        size = int(request.GET.get("limit", API_PAGE_SIZE))
+    except ValueError:
+        raise ApiError(400, "limit must be an integer.")
+    return max(1, min(size, API_MAX_PAGE_SIZE))
+
+
+def _page_url(request, cursor):
+    params = request.GET.copy()
+    params["cursor"] = cursor
+    return request.build_absolute_uri(f"{request.path}?{params.urlencode()}")
+
+
+def paginate(request, queryset, serialize, ordering=("-id",)):
+    """
+    One page of ``queryset`` (rows may be model instances or ``values()``
+    dicts) as ``{"results": [...], "next": url, "previous": url}``.
+    """
+    page = KeysetPaginator(queryset, ordering=ordering, per_page=page_size(request)).get_page(
+        request.GET.get("cursor")
+    )
+    return {
+        "results": [serialize(row) for row in page],
+        "next": _page_url(request, page.next_cursor) if page.has_next() else None,
+        "previous": _page_url(request, page.previous_cursor) if page.has_previous() else None,
+    }
+
+
+def make_etag(*parts):
+    return '"%s"' % hashlib.sha1(":".join(str(part) for part in parts).encode()).hexdigest()
+
+
+def etag_matches(request, etag):
+    header = request.headers.get("If-None-Match", "")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    candidates = [value.strip() for value in header.split(",")]
+    return etag in candidates or f"W/{etag}" in candidates
+
+
+def not_modified(etag):
+    response = HttpResponse(status=304)
+    response["ETag"] = etag
+    return response
+
+
+def json_response(request, data, status=200, etag=None):
+    """
+    ``data`` as JSON. Without an ``etag`` one is made from the body, which
+    saves the client the transfer (not the query) when nothing changed.
+    """
+    response = JsonResponse(data, status=status)
+    if request.method == "GET" and status == 200:
+        etag = etag or make_etag(hashlib.sha1(response.content).hexdigest())
+        if etag_matches(request, etag):
+            return not_modified(etag)
+        response["ETag"] = etag
+    return response
@@ -0,0 +1,16 @@
+# core/api_urls.py
+"""Routes of version 1 of the JSON API, mounted at /api/v1/."""
+from django.urls import path
+
+from observations import api as observations_api
+from users import api as users_api
+
+app_name = "api_v1"
+
+urlpatterns = [
+    path("observations/", observations_api.observation_list, name="observation_list"),
+    path("observations/<int:pk>/", observations_api.observation_detail, name="observation_detail"),
+    path("observations/sync/", observations_api.observation_sync, name="observation_sync"),
+    path("locations/", observations_api.location_list, name="location_list"),
+    path("users/", users_api.user_list, name="user_list"),
+]
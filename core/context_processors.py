@@ -1,10 +1,8 @@
 def organization_context(request):
-    org = None
-
-    if request.user.is_authenticated:
-        org = getattr(request.user, "organization", None)
+    tenant = getattr(request, "tenant", None)
 
     return {
-        "current_org": org,
+        "current_org": tenant.organization if tenant else None,
+        "current_plan": tenant.plan if tenant else None,
         "current_user": request.user,
     }
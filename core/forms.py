@@ -64,4 +64,21 @@ class AcceptInviteForm(forms.Form):
         cleaned = super().clean()
         if cleaned["password1"] != cleaned["password2"]:
             raise forms.ValidationError("Passwords do not match")
-        return cleaned
\ No newline at end of file
+        return cleaned
+
+class BulkInviteForm(forms.Form):
+    file = forms.FileField(
+        label="CSV file",
+        help_text="One invite per row: email, role (observer, action_owner or manager).",
+    )
+    default_role = forms.ChoiceField(
+        choices=UserInvite._meta.get_field("role").choices,
+        initial="observer",
+        help_text="Used for rows without a role.",
+    )
+
+    def clean_file(self):
+        upload = self.cleaned_data["file"]
+        if upload.size > 1024 * 1024:
+            raise forms.ValidationError("The file is too large (1 MB at most).")
+        return upload
@@ -0,0 +1,233 @@
+# core/invites.py
+"""
+User invitations, one at a time or in bulk from a CSV upload.
+
+Both count open invites against the plan's user limit, like members, and
+both take capacity the way core.quota.reserve does: the organization's
+usage row is locked while the capacity is read and the invites saved, so
+concurrent invitations can't together go over the limit.
+
+A bulk upload is checked as a whole: one query for the plan capacity (read
+from the usage counters, see core/quota.py), one for the members and one
+for the open invites among the uploaded addresses. The accepted rows are
+then saved with one ``bulk_create`` and their emails queued with one
+outbox insert, however many rows the file has.
+"""
+import csv
+import io
+from dataclasses import dataclass
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_email
+from django.db import transaction
+from django.db.models import Count, IntegerField, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce, Lower
+from django.template.loader import render_to_string
+from django.utils import timezone
+
+from users.models import CustomUser
+
+from . import outbox, quota
+from .models import OrganizationUsage, UserInvite
+
+INVITE_SUBJECT = "You're invited to Safety Observation Platform"
+
+# Largest upload accepted in one go.
+BULK_INVITE_MAX_ROWS = 2000
+
+# An invite not accepted within this many days expires and frees its seat.
+INVITE_VALID_DAYS = getattr(settings, "INVITE_VALID_DAYS", 14)
+
+ROLES = dict(UserInvite._meta.get_field("role").choices)
+
+INVITED = "invited"
+MEMBER = "already a member"
+PENDING = "already invited"
+DUPLICATE = "duplicate in file"
+INVALID_EMAIL = "invalid email"
+INVALID_ROLE = "invalid role"
+OVER_LIMIT = "over plan user limit"
+
+
+@dataclass
+class InviteRow:
+    line: int
+    email: str
+    role: str
+    result: str = ""
+
+    @property
+    def ok(self):
+        return self.result == INVITED
+
+
+def parse_role(value, default="observer"):
+    """Accept a role by value or label, in any case ("Action Owner", "manager")."""
+    value = (value or "").strip().lower()
+    if not value:
+        return default
+    for key, label in ROLES.items():
+        if value in (key, label.lower(), key.replace("_", " ")):
+            return key
+    return None
+
+
+def read_csv(fileobj, default_role="observer"):
+    """
+    Parse an uploaded CSV of ``email[,role]`` rows (a header row is optional)
+    into InviteRows. Rows that fail validation already carry their result.
+    """
+    text = io.TextIOWrapper(fileobj, encoding="utf-8-sig", newline="")
+    rows = []
+    for line, record in enumerate(csv.reader(text), start=1):
+        if not record or not any(cell.strip() for cell in record):
+            continue
+        email = record[0].strip()
+        if line == 1 and email.lower() == "email":
+            continue
+        raw_role = record[1] if len(record) > 1 else ""
+        role = parse_role(raw_role, default_role)
+        row = InviteRow(line=line, email=email, role=role or raw_role.strip())
+        try:
+            validate_email(email)
+        except ValidationError:
+            row.result = INVALID_EMAIL
+        else:
+            if role is None:
+                row.result = INVALID_ROLE
+        rows.append(row)
+        if len(rows) > BULK_INVITE_MAX_ROWS:
+            raise ValidationError(f"At most {BULK_INVITE_MAX_ROWS} rows can be invited at once.")
+    return rows
+
+
+def open_invites(now=None):
+    """Q for the invites that still hold a seat: unused and not expired."""
+    now = now or timezone.now()
+    return Q(is_used=False) & (Q(expires_at__isnull=True) | Q(expires_at__gt=now))
+
+
+def _expiry():
+    return timezone.now() + timedelta(days=INVITE_VALID_DAYS)
+
+
+def remaining_capacity(organization, lock=False):
+    """
+    Users that can still be invited under the organization's plan: the plan
+    limit minus the members and the open (unexpired) invites, in one query.
+    With ``lock`` (inside a transaction) the usage row stays locked until the
+    transaction ends, so the invites saved in it are counted by the next
+    caller.
+    """
+    pending = (
+        UserInvite.objects
+        .filter(open_invites(), organization=OuterRef("organization"))
+        .order_by()
+        .values("organization")
+        .annotate(n=Count("pk"))
+        .values("n")
+    )
+    rows = (
+        OrganizationUsage.objects
+        .filter(organization=organization)
+        .annotate(pending=Coalesce(Subquery(pending, output_field=IntegerField()), 0))
+        .values_list("organization__subscription__plan__max_users", "users", "pending")
+    )
+    if lock:
+        rows = rows.select_for_update(of=("self",))
+    row = rows.first()
+    if row is None:
+        quota.ensure_usage(organization)
+        row = rows.first()
+    if row is None or row[0] is None:
+        return 0
+    max_users, members, pending = row
+    return max(max_users - members - pending, 0)
+
+
+def bulk_invite(organization, rows, build_link):
+    """
+    Invite the valid, new addresses in ``rows`` (InviteRows from read_csv)
+    and set every row's result. ``build_link(invite)`` returns the absolute
+    accept URL. Returns the created invites.
+    """
+    candidates = [row for row in rows if not row.result]
+    emails = {row.email.lower() for row in candidates}
+
+    members = set(
+        CustomUser.objects
+        .filter(organization=organization)
+        .annotate(email_lower=Lower("email"))
+        .filter(email_lower__in=emails)
+        .values_list("email_lower", flat=True)
+    )
+    pending = set(
+        UserInvite.objects
+        .filter(open_invites(), organization=organization)
+        .annotate(email_lower=Lower("email"))
+        .filter(email_lower__in=emails)
+        .values_list("email_lower", flat=True)
+    )
+
+    with transaction.atomic():
+        capacity = remaining_capacity(organization, lock=True)
+        seen = set()
+        invites = []
+        for row in candidates:
+            email = row.email.lower()
+            if email in members:
+                row.result = MEMBER
+            elif email in pending:
+                row.result = PENDING
+            elif email in seen:
+                row.result = DUPLICATE
+            elif len(invites) >= capacity:
+                row.result = OVER_LIMIT
+            else:
+                row.result = INVITED
+                invites.append(UserInvite(
+                    organization=organization, email=row.email, role=row.role, expires_at=_expiry(),
+                ))
+            seen.add(email)
+
+        if invites:
+            UserInvite.objects.bulk_create(invites)
+            _queue_emails(organization, invites, build_link)
+    return invites
+
+
+def invite_user(organization, invite, build_link):
+    """
+    Save ``invite`` (an unsaved UserInvite) for ``organization`` and queue
+    its email. Returns False, saving nothing, if the plan has no room left.
+    """
+    with transaction.atomic():
+        if remaining_capacity(organization, lock=True) <= 0:
+            return False
+        invite.organization = organization
+        if invite.expires_at is None:
+            invite.expires_at = _expiry()
+        invite.save()
+        _queue_emails(organization, [invite], build_link)
+    return True
+
+
+def _queue_emails(organization, invites, build_link):
+    # Delivered by the outbox dispatcher so a slow Brevo call doesn't hold
+    # up the request.
+    outbox.queue_emails(
+        (
+            (
+                invite.email,
+                INVITE_SUBJECT,
+                render_to_string(
+                    "emails/invite_user.html",
+                    {"organization": organization, "invite_link": build_link(invite)},
+                ),
+            )
+            for invite in invites
+        ),
+        organization=organization,
+    )
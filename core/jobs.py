@@ -0,0 +1,280 @@
+# core/jobs.py
+"""
+A small database-backed job queue.
+
+Slow work (exports, ...) is recorded as a Job row by the request and
+executed by ``manage.py run_worker``, so it never ties up a gunicorn thread
+and needs no broker besides the database we already have.
+
+Job types are plain functions registered from each app's ``tasks.py``:
+
+    from core.jobs import job
+
+    @job("observations.export_xlsx", concurrency=2, max_attempts=3)
+    def export_xlsx(job):
+        ...
+        job.set_progress(50, "Half way")
+        return {"rows": n}          # stored as job.result
+
+and enqueued with ``core.jobs.enqueue("observations.export_xlsx", {...})``.
+
+Workers claim jobs with ``SELECT ... FOR UPDATE SKIP LOCKED`` where the
+database supports it and always confirm the claim with a conditional UPDATE,
+so a job is only ever run by one worker. Failed jobs are retried with
+exponential backoff until ``max_attempts`` is reached.
+"""
+import logging
+import threading
+import traceback
+from dataclasses import dataclass
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Count, F
+from django.utils import timezone
+from django.utils.module_loading import autodiscover_modules
+
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+# A RUNNING job whose lock has not been refreshed for this long is assumed to
+# belong to a dead worker and is queued again. A live worker refreshes the
+# lock every JOB_HEARTBEAT while the job runs (and on every set_progress).
+JOB_LOCK_TIMEOUT = timedelta(seconds=getattr(settings, "JOB_LOCK_TIMEOUT", 30 * 60))
+JOB_HEARTBEAT = JOB_LOCK_TIMEOUT / 3
+
+
+class WorkerLost(Exception):
+    """The worker running a job stopped refreshing its lock."""
+
+
+@dataclass
+class JobType:
+    name: str
+    func: object
+    concurrency: int = 1
+    max_attempts: int = 5
+    backoff: int = 30  # seconds before the first retry, doubled every attempt
+    on_failure: object = None  # called as on_failure(job, exc) after the last attempt
+
+
+_registry = {}
+
+
+def job(name, concurrency=1, max_attempts=5, backoff=30, on_failure=None):
+    """Register the decorated function as the handler of job type ``name``."""
+    def decorator(func):
+        _registry[name] = JobType(
+            name=name,
+            func=func,
+            concurrency=concurrency,
+            max_attempts=max_attempts,
+            backoff=backoff,
+            on_failure=on_failure,
+        )
+        return func
+    return decorator
+
+
+def autodiscover():
+    """Import every installed app's ``tasks`` module so its job types register."""
+    autodiscover_modules("tasks")
+
+
+def registered_types():
+    return dict(_registry)
+
+
+def enqueue(name, payload=None, organization=None, created_by=None, run_after=None, max_attempts=None):
+    """Record a job for the workers. Returns the Job."""
+    job_type = _registry.get(name)
+    if max_attempts is None:
+        max_attempts = job_type.max_attempts if job_type else 5
+    return Job.objects.create(
+        name=name,
+        payload=payload or {},
+        organization=organization,
+        created_by=created_by,
+        run_after=run_after or timezone.now(),
+        max_attempts=max_attempts,
+    )
+
+
+def requeue_stale(now=None):
+    """
+    Queue again the RUNNING jobs whose lock has expired, with the usual
+    backoff. The lost run counted as an attempt when it was claimed, so a job
+    that has used up ``max_attempts`` is failed instead of run forever.
+    Returns the number of jobs queued again.
+    """
+    now = now or timezone.now()
+    stale = Job.objects.filter(status=Job.STATUS_RUNNING, locked_at__lt=now - JOB_LOCK_TIMEOUT)
+    requeued = 0
+    for job in stale:
+        job_type = _registry.get(job.name)
+        exc = WorkerLost(f"Worker {job.locked_by or '?'} lost the job (lock expired at {job.locked_at}).")
+        # The conditional update skips a job whose worker came back to life.
+        current = Job.objects.filter(pk=job.pk, status=Job.STATUS_RUNNING, locked_at=job.locked_at)
+        if job.attempts < job.max_attempts:
+            backoff = job_type.backoff if job_type else JobType.backoff
+            requeued += current.update(
+                status=Job.STATUS_QUEUED,
+                run_after=now + timedelta(seconds=backoff * 2 ** max(job.attempts - 1, 0)),
+                last_error=str(exc),
+                locked_by="",
+                locked_at=None,
+            )
+            continue
+        failed = current.update(
+            status=Job.STATUS_FAILED,
+            last_error=str(exc),
+            finished_at=now,
+            locked_by="",
+            locked_at=None,
+        )
+        if failed:
+            logger.error("Job %s failed: %s", job, exc)
+            _call_on_failure(job, job_type, exc)
+    return requeued
+
+
+def _running_counts(names):
+    return dict(
+        Job.objects
+        .filter(status=Job.STATUS_RUNNING, name__in=names)
+        .values_list("name")
+        .annotate(n=Count("id"))
+        .order_by()
+    )
+
+
+def claim_next(worker_id, names=None, batch=10):
+    """
+    Claim the next runnable job for ``worker_id`` and mark it RUNNING.
+    Only job types that are registered and below their concurrency limit are
+    considered. Returns the Job or None.
+    """
+    names = [name for name in (names or _registry) if name in _registry]
+    if not names:
+        return None
+
+    running = _running_counts(names)
+    available = [n for n in names if running.get(n, 0) < _registry[n].concurrency]
+    if not available:
+        return None
+
+    now = timezone.now()
+    with transaction.atomic():
+        candidates = list(
+            Job.objects
+            .select_for_update(skip_locked=True)
+            .filter(status=Job.STATUS_QUEUED, run_after__lte=now, name__in=available)
+            .order_by("run_after", "id")
+            .values_list("pk", "name")[:batch]
+        )
+        for pk, name in candidates:
+            claimed = Job.objects.filter(pk=pk, status=Job.STATUS_QUEUED).update(
+                status=Job.STATUS_RUNNING,
+                locked_by=worker_id,
+                locked_at=now,
+                started_at=now,
+                attempts=F("attempts") + 1,
+            )
+            if not claimed:
+                continue
+            # Another worker may have claimed a job of the same type at the
+            # same time; give ours back if that pushed us over the limit.
+            if _running_counts([name]).get(name, 0) > _registry[name].concurrency:
+                Job.objects.filter(pk=pk).update(
+                    status=Job.STATUS_QUEUED,
+                    locked_by="",
+                    locked_at=None,
+                    attempts=F("attempts") - 1,
+                )
+                continue
+            return Job.objects.get(pk=pk)
+    return None
+
+
+class _Heartbeat(threading.Thread):
+    """Refreshes the lock of a running job until stopped."""
+
+    def __init__(self, job, interval=None):
+        super().__init__(name=f"job-{job.pk}-heartbeat", daemon=True)
+        self.job = job
+        self.interval = (interval or JOB_HEARTBEAT).total_seconds()
+        self.stopping = threading.Event()
+
+    def run(self):
+        try:
+            while not self.stopping.wait(self.interval):
+                Job.objects.filter(
+                    pk=self.job.pk, status=Job.STATUS_RUNNING, locked_by=self.job.locked_by
+                ).update(locked_at=timezone.now())
+        except Exception:
+            logger.exception("Heartbeat of job %s failed", self.job)
+        finally:
+            connection.close()
+
+    def stop(self):
+        self.stopping.set()
+        self.join()
+
+
+def run(job):
+    """Execute a claimed job and record its outcome."""
+    job_type = _registry[job.name]
+    heartbeat = _Heartbeat(job)
+    heartbeat.start()
+    try:
+        result = job_type.func(job)
+    except Exception as exc:
+        logger.exception("Job %s failed (attempt %s/%s)", job, job.attempts, job.max_attempts)
+        heartbeat.stop()
+        _record_failure(job, job_type, exc)
+        return False
+    heartbeat.stop()
+
+    Job.objects.filter(pk=job.pk).update(
+        status=Job.STATUS_SUCCEEDED,
+        progress=100,
+        result=result,
+        finished_at=timezone.now(),
+        locked_by="",
+        locked_at=None,
+    )
+    return True
+
+
+def _record_failure(job, job_type, exc):
+    error = "".join(traceback.format_exception(exc))[-10000:]
+    now = timezone.now()
+    if job.attempts < job.max_attempts:
+        delay = job_type.backoff * 2 ** (job.attempts - 1)
+        Job.objects.filter(pk=job.pk).update(
+            status=Job.STATUS_QUEUED,
+            run_after=now + timedelta(seconds=delay),
+            last_error=error,
+            locked_by="",
+            locked_at=None,
+        )
+        return
+
+    Job.objects.filter(pk=job.pk).update(
+        status=Job.STATUS_FAILED,
+        last_error=error,
+        finished_at=now,
+        locked_by="",
+        locked_at=None,
+    )
+    _call_on_failure(job, job_type, exc)
+
+
+def _call_on_failure(job, job_type, exc):
+    if job_type is not None and job_type.on_failure is not None:
+        try:
+            job_type.on_failure(job, exc)
+        except Exception:
+            logger.exception("on_failure handler of %s failed", job)
@@ -0,0 +1,57 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from core.session_benchmark import run_profile
+from users.models import CustomUser
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare request latency and database writes per request of the "
+        "session/message storage profiles (settings.SESSION_PROFILES) on a "
+        "flash-message-and-redirect round trip. Nothing is kept: every "
+        "profile runs in a rolled back transaction."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--user",
+            help="Email of the user to log in as (default: the first user with an organization).",
+        )
+        parser.add_argument(
+            "--page", default="/observations/",
+            help="Page the flash message is shown on.",
+        )
+        parser.add_argument("--requests", type=int, default=50, help="Round trips per profile.")
+        parser.add_argument(
+            "--profile", action="append", choices=sorted(settings.SESSION_PROFILES),
+            help="Profile to measure; repeat for several (default: all).",
+        )
+
+    def handle(self, *args, **options):
+        users = CustomUser.objects.filter(is_active=True)
+        if options["user"]:
+            user = users.filter(email=options["user"]).first()
+        else:
+            user = users.filter(organization__isnull=False).order_by("pk").first()
+        if user is None:
+            raise CommandError("No user to log in as; pass --user.")
+
+        names = options["profile"] or list(settings.SESSION_PROFILES)
+        self.stdout.write(
+            f"{options['requests']} round trips to {options['page']} as {user.email} "
+            f"(current profile: {settings.SESSION_PROFILE})\n"
+        )
+        self.stdout.write(f"{'profile':<16}{'median ms':>10}{'p95 ms':>10}{'queries':>10}{'writes':>10}")
+        for name in names:
+            try:
+                result = run_profile(
+                    settings.SESSION_PROFILES[name], user, options["page"], options["requests"]
+                )
+            except RuntimeError as e:
+                raise CommandError(f"{name}: {e}")
+            self.stdout.write(
+                f"{name:<16}{result['median_ms']:>10.1f}{result['p95_ms']:>10.1f}"
+                f"{result['queries_per_request']:>10.1f}{result['writes_per_request']:>10.2f}"
+            )
+        self.stdout.write("\nqueries and writes are per request.")
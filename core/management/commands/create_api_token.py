@@ -0,0 +1,30 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from core import api
+
+
+class Command(BaseCommand):
+    help = "Create a JSON API token for a user and print its key (shown only once)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("email", help="Email of the user the token acts as.")
+        parser.add_argument("--name", default="API token", help="Label shown in the admin.")
+        parser.add_argument(
+            "--rate-limit",
+            type=int,
+            help="Requests per minute (default: settings.API_RATE_LIMIT).",
+        )
+
+    def handle(self, *args, **options):
+        User = get_user_model()
+        try:
+            user = User.objects.get(email__iexact=options["email"])
+        except User.DoesNotExist:
+            raise CommandError(f"No user with email {options['email']}.")
+        if user.organization_id is None:
+            raise CommandError(f"{user.email} does not belong to an organization.")
+
+        token, key = api.create_token(user, options["name"], rate_limit=options["rate_limit"])
+        self.stdout.write(self.style.SUCCESS(f"Created token {token.prefix}… for {user.email}."))
+        self.stdout.write(key)
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from core import outbox
+
+
+class Command(BaseCommand):
+    help = "Send every due message in the email outbox (run_worker also does this)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=outbox.OUTBOX_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        sent, failed = outbox.dispatch_all(options["batch_size"])
+        self.stdout.write(self.style.SUCCESS(f"{sent} sent, {failed} failed"))
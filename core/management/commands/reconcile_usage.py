@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from core import quota
+from core.models import Organization
+
+
+class Command(BaseCommand):
+    help = "Recompute the per-organization usage counters from the tables."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--organization",
+            type=int,
+            help="Only reconcile this organization id.",
+        )
+
+    def handle(self, *args, **options):
+        organization = None
+        if options["organization"] is not None:
+            try:
+                organization = Organization.objects.get(pk=options["organization"])
+            except Organization.DoesNotExist:
+                raise CommandError(f"Organization {options['organization']} does not exist.")
+
+        drift = quota.reconcile(organization)
+        for organization_id, resource, stored, actual in drift:
+            self.stdout.write(self.style.WARNING(
+                f"Organization {organization_id}: {resource} was {stored}, is {actual}"
+            ))
+        self.stdout.write(self.style.SUCCESS(f"Reconciled usage, {len(drift)} counter(s) corrected."))
@@ -0,0 +1,88 @@
+import os
+import signal
+import socket
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from core import jobs, outbox
+
+
+class Command(BaseCommand):
+    help = "Run a background job worker (see core/jobs.py)."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--once", action="store_true",
+            help="Run every job that is due, then exit instead of polling.",
+        )
+        parser.add_argument(
+            "--sleep", type=float, default=2.0,
+            help="Seconds to wait between polls when the queue is empty.",
+        )
+        parser.add_argument(
+            "--max-jobs", type=int, default=0,
+            help="Exit after this many jobs (0 = no limit), e.g. to recycle memory.",
+        )
+        parser.add_argument(
+            "--only", action="append", dest="names",
+            help="Only run jobs of this type (repeatable).",
+        )
+        parser.add_argument(
+            "--no-email", action="store_true",
+            help="Don't send queued outbox email from this worker.",
+        )
+        parser.add_argument(
+            "--worker-id", default=f"{socket.gethostname()}:{os.getpid()}",
+        )
+
+    def handle(self, *args, **options):
+        jobs.autodiscover()
+        worker_id = options["worker_id"]
+        names = options["names"]
+        self._stopping = False
+        signal.signal(signal.SIGTERM, self._stop)
+        signal.signal(signal.SIGINT, self._stop)
+
+        self.stdout.write(
+            f"Worker {worker_id} started ({', '.join(sorted(names or jobs.registered_types()))})"
+        )
+        done = 0
+        while not self._stopping:
+            close_old_connections()
+            requeued = jobs.requeue_stale()
+            if requeued:
+                self.stdout.write(self.style.WARNING(f"Requeued {requeued} stale job(s)"))
+
+            emails = 0
+            if not options["no_email"]:
+                sent, failed = outbox.dispatch()
+                emails = sent + failed
+                if emails:
+                    self.stdout.write(f"Email: {sent} sent, {failed} failed")
+
+            job = jobs.claim_next(worker_id, names)
+            if job is None:
+                if emails:
+                    continue
+                if options["once"]:
+                    break
+                time.sleep(options["sleep"])
+                continue
+
+            started = time.monotonic()
+            ok = jobs.run(job)
+            elapsed = time.monotonic() - started
+            outcome = self.style.SUCCESS("ok") if ok else self.style.ERROR("failed")
+            self.stdout.write(f"{job.name} #{job.pk} {outcome} in {elapsed:.2f}s")
+
+            done += 1
+            if options["max_jobs"] and done >= options["max_jobs"]:
+                break
+
+        self.stdout.write(f"Worker {worker_id} stopped after {done} job(s)")
+
+    def _stop(self, signum, frame):
+        # Finish the current job, then exit.
+        self._stopping = True
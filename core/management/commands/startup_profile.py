@@ -0,0 +1,134 @@
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# Optional stacks that should only be imported on first use (see
+# core.utils.lazy). If one of them shows up at worker startup, every worker
+# pays for it.
+HEAVY_MODULES = ("pandas", "numpy", "plotly", "openpyxl", "PIL")
+
+# Runs in a fresh interpreter so the measurement is a real cold start:
+# settings + app registry, then the URLconf, which imports every view module
+# the way the first request to a gunicorn worker does.
+PROBE = r"""
+import importlib, json, sys, time
+
+def rss_kb():
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    import resource
+    usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return usage // 1024 if sys.platform == "darwin" else usage
+
+args = json.loads(sys.argv[1])
+result = {"rss_start_kb": rss_kb()}
+
+t0 = time.perf_counter()
+import django
+django.setup()
+result["setup_ms"] = (time.perf_counter() - t0) * 1000
+
+t0 = time.perf_counter()
+from django.urls import get_resolver
+get_resolver().url_patterns
+result["urls_ms"] = (time.perf_counter() - t0) * 1000
+result["rss_boot_kb"] = rss_kb()
+result["heavy_at_boot"] = [m for m in args["heavy"] if m in sys.modules]
+
+result["on_demand"] = {}
+for name in args["heavy"]:
+    if name in sys.modules:
+        continue
+    before = rss_kb()
+    t0 = time.perf_counter()
+    try:
+        importlib.import_module(name)
+    except ImportError:
+        continue
+    result["on_demand"][name] = {
+        "ms": (time.perf_counter() - t0) * 1000,
+        "rss_kb": rss_kb() - before,
+    }
+
+print(json.dumps(result))
+"""
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure worker cold-start cost: import time and resident memory of a "
+        "fresh process after loading settings and all URLs/views, and what the "
+        "lazily imported analytics stacks would add on first use."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--repeat", type=int, default=3,
+            help="Number of fresh processes to measure (median is reported).",
+        )
+        parser.add_argument(
+            "--memory-budget", type=int,
+            help="Memory available to workers, in MB; reports how many fit.",
+        )
+        parser.add_argument(
+            "--fail-on-heavy", action="store_true",
+            help="Exit with an error if any heavy module is imported at startup.",
+        )
+
+    def handle(self, *args, **options):
+        runs = [self._probe() for _ in range(max(1, options["repeat"]))]
+
+        setup_ms = statistics.median(r["setup_ms"] for r in runs)
+        urls_ms = statistics.median(r["urls_ms"] for r in runs)
+        rss_mb = statistics.median(r["rss_boot_kb"] for r in runs) / 1024
+        heavy_at_boot = sorted({m for r in runs for m in r["heavy_at_boot"]})
+
+        self.stdout.write(f"django.setup():        {setup_ms:8.1f} ms")
+        self.stdout.write(f"URLconf + views:       {urls_ms:8.1f} ms")
+        self.stdout.write(f"Cold start total:      {setup_ms + urls_ms:8.1f} ms")
+        self.stdout.write(f"Worker RSS after boot: {rss_mb:8.1f} MB")
+
+        on_demand = runs[-1]["on_demand"]
+        if on_demand:
+            self.stdout.write("\nLoaded on first use:")
+            for name, cost in sorted(on_demand.items()):
+                self.stdout.write(
+                    f"  {name:<10} +{cost['ms']:8.1f} ms  +{cost['rss_kb'] / 1024:6.1f} MB"
+                )
+
+        if options["memory_budget"]:
+            workers = int(options["memory_budget"] // rss_mb) if rss_mb else 0
+            self.stdout.write(
+                f"\n{workers} workers fit in {options['memory_budget']} MB at boot size."
+            )
+
+        if heavy_at_boot:
+            message = f"Imported at startup: {', '.join(heavy_at_boot)}"
+            if options["fail_on_heavy"]:
+                raise CommandError(message)
+            self.stdout.write(self.style.WARNING(message))
+        else:
+            self.stdout.write(self.style.SUCCESS("\nNo heavy modules imported at startup."))
+
+    def _probe(self):
+        env = dict(os.environ, DJANGO_SETTINGS_MODULE=settings.SETTINGS_MODULE)
+        completed = subprocess.run(
+            [sys.executable, "-c", PROBE, json.dumps({"heavy": HEAVY_MODULES})],
+            cwd=settings.BASE_DIR,
+            env=env,
+            capture_output=True,
+            text=True,
+        )
+        if completed.returncode != 0:
+            raise CommandError(f"Startup probe failed:\n{completed.stderr}")
+        return json.loads(completed.stdout.strip().splitlines()[-1])
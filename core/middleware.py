@@ -1,14 +1,20 @@
 from django.shortcuts import redirect
 from django.urls import reverse
 
+from . import tenant
+
 # core/middleware.py
 class OrganizationMiddleware:
     def __init__(self, get_response):
         self.get_response = get_response
 
     def __call__(self, request):
+        request.tenant = None
+        request.organization = None
         if request.user.is_authenticated:
-            request.organization = request.user.organization
-        else:
-            request.organization = None
+            request.tenant = tenant.resolve(request.user)
+            if request.tenant is not None:
+                request.organization = request.tenant.organization
+                # Saves the lazy query for code that goes through the user.
+                request.user.organization = request.organization
         return self.get_response(request)
@@ -0,0 +1,53 @@
+# Generated by Django 5.1 on 2026-10-18 11:01
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def count_usage(apps, schema_editor):
+    Organization = apps.get_model('core', 'Organization')
+    OrganizationUsage = apps.get_model('core', 'OrganizationUsage')
+    Observation = apps.get_model('observations', 'Observation')
+    CustomUser = apps.get_model('users', 'CustomUser')
+
+    observations = dict(
+        Observation.objects.values_list('organization').annotate(n=Count('id')).order_by()
+    )
+    users = dict(
+        CustomUser.objects.exclude(organization=None)
+        .values_list('organization').annotate(n=Count('id')).order_by()
+    )
+    OrganizationUsage.objects.bulk_create(
+        [
+            OrganizationUsage(
+                organization_id=pk,
+                observations=observations.get(pk, 0),
+                users=users.get(pk, 0),
+            )
+            for pk in Organization.objects.values_list('pk', flat=True)
+        ],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_outboxemail'),
+        ('observations', '0010_mediablob'),
+        ('users', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OrganizationUsage',
+            fields=[
+                ('organization', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='usage', serialize=False, to='core.organization')),
+                ('observations', models.IntegerField(default=0)),
+                ('users', models.IntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.RunPython(count_usage, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1 on 2026-10-18 11:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_organizationusage'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='organization',
+            name='archive_closed_after_days',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+    ]
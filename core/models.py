@@ -51,6 +51,11 @@ class Organization(models.Model):
     name = models.CharField(max_length=255)
     domain = models.CharField(max_length=255, unique=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    # Bumped on every observation write; used to version cached dashboard data.
+    data_version = models.PositiveIntegerField(default=0, editable=False)
+    # Retention: closed observations are archived this many days after they
+    # were closed (see observations/retention.py). Empty keeps them active.
+    archive_closed_after_days = models.PositiveIntegerField(null=True, blank=True)
 
     def __str__(self):
         return self.name
@@ -86,3 +91,178 @@ class Subscription(models.Model):
     def __str__(self):
         return f"{self.organization} — {self.plan}"
 
+
+
+# Plan usage counters (see core/quota.py)
+class OrganizationUsage(models.Model):
+    """
+    Running totals of what an organization has used against its plan
+    limits, so a limit check reads one row instead of counting tables.
+    Kept up to date with F() updates by core.quota; recompute with
+    ``manage.py reconcile_usage``.
+    """
+    organization = models.OneToOneField(
+        Organization,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name="usage",
+    )
+    observations = models.IntegerField(default=0)
+    users = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.organization}: {self.observations} observations, {self.users} users"
+
+
+# Background jobs (see core/jobs.py)
+class Job(models.Model):
+    STATUS_QUEUED = "QUEUED"
+    STATUS_RUNNING = "RUNNING"
+    STATUS_SUCCEEDED = "SUCCEEDED"
+    STATUS_FAILED = "FAILED"
+
+    STATUS_CHOICES = [
+        (STATUS_QUEUED, "Queued"),
+        (STATUS_RUNNING, "Running"),
+        (STATUS_SUCCEEDED, "Succeeded"),
+        (STATUS_FAILED, "Failed"),
+    ]
+
+    name = models.CharField(max_length=100)
+    payload = models.JSONField(default=dict, blank=True)
+    organization = models.ForeignKey(
+        Organization,
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name="jobs",
+    )
+    created_by = models.ForeignKey(
+        "users.CustomUser",
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="+",
+    )
+
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_QUEUED)
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=5)
+    run_after = models.DateTimeField(default=timezone.now)
+
+    locked_by = models.CharField(max_length=100, blank=True)
+    locked_at = models.DateTimeField(null=True, blank=True)
+
+    progress = models.PositiveSmallIntegerField(default=0)
+    progress_message = models.CharField(max_length=255, blank=True)
+    result = models.JSONField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # Claim query: next runnable job
+            models.Index(fields=["status", "run_after"], name="job_status_run_after_idx"),
+            # Per-type concurrency counts
+            models.Index(fields=["name", "status"], name="job_name_status_idx"),
+        ]
+
+    @property
+    def is_finished(self):
+        return self.status in (self.STATUS_SUCCEEDED, self.STATUS_FAILED)
+
+    def set_progress(self, percent, message=""):
+        """
+        Record progress (0-100) without touching the rest of the row. Also
+        refreshes the lock, so a job reporting progress is never taken for
+        one whose worker died.
+        """
+        self.progress = max(0, min(100, int(percent)))
+        self.progress_message = message[:255]
+        updates = {"progress": self.progress, "progress_message": self.progress_message}
+        if self.status == self.STATUS_RUNNING:
+            self.locked_at = updates["locked_at"] = timezone.now()
+        Job.objects.filter(pk=self.pk).update(**updates)
+
+    def __str__(self):
+        return f"{self.name} #{self.pk} ({self.status})"
+
+
+# Transactional email outbox (see core/outbox.py)
+class OutboxEmail(models.Model):
+    STATUS_QUEUED = "QUEUED"
+    STATUS_SENDING = "SENDING"
+    STATUS_SENT = "SENT"
+    STATUS_FAILED = "FAILED"
+
+    STATUS_CHOICES = [
+        (STATUS_QUEUED, "Queued"),
+        (STATUS_SENDING, "Sending"),
+        (STATUS_SENT, "Sent"),
+        (STATUS_FAILED, "Failed"),
+    ]
+
+    organization = models.ForeignKey(
+        Organization,
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name="outbox_emails",
+    )
+    to_email = models.EmailField()
+    subject = models.CharField(max_length=255)
+    html_content = models.TextField()
+
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_QUEUED)
+    attempts = models.PositiveIntegerField(default=0)
+    send_after = models.DateTimeField(default=timezone.now)
+    locked_at = models.DateTimeField(null=True, blank=True)
+
+    provider_message_id = models.CharField(max_length=255, blank=True)
+    last_error = models.TextField(blank=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # Dispatcher: next batch of due messages
+            models.Index(fields=["status", "send_after"], name="outbox_status_send_after_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.subject} -> {self.to_email} ({self.status})"
+
+
+# JSON API tokens (see core/api.py)
+class ApiToken(models.Model):
+    """
+    A bearer token of the JSON API. Only the SHA-256 of the key is stored;
+    the key itself is shown once, when the token is created.
+    """
+    user = models.ForeignKey(
+        "users.CustomUser",
+        on_delete=models.CASCADE,
+        related_name="api_tokens",
+    )
+    organization = models.ForeignKey(
+        Organization,
+        on_delete=models.CASCADE,
+        related_name="api_tokens",
+    )
+    name = models.CharField(max_length=100)
+    prefix = models.CharField(max_length=12, editable=False)
+    key_hash = models.CharField(max_length=64, unique=True, editable=False)
+    # Requests per minute; empty uses settings.API_RATE_LIMIT.
+    rate_limit = models.PositiveIntegerField(null=True, blank=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    last_used_at = models.DateTimeField(null=True, blank=True, editable=False)
+    revoked_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.name} ({self.prefix}…)"
@@ -0,0 +1,156 @@
+# core/outbox.py
+"""
+Transactional email outbox.
+
+Requests never talk to the email provider: ``queue_email`` writes a single
+OutboxEmail row (in the request's transaction, so a rolled back invite sends
+nothing) and ``dispatch`` - run by ``manage.py run_worker`` between jobs, or
+by ``manage.py dispatch_email`` - sends due messages in batches through one
+pooled transport client.
+
+Messages that fail are retried with exponential backoff; after
+``OUTBOX_MAX_ATTEMPTS`` tries, or on a permanent error such as a rejected
+address, they are marked FAILED with the error kept on the row.
+"""
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import OutboxEmail
+from .utils.email import EmailDeliveryError, get_transport
+
+logger = logging.getLogger(__name__)
+
+OUTBOX_BATCH_SIZE = getattr(settings, "OUTBOX_BATCH_SIZE", 50)
+OUTBOX_MAX_ATTEMPTS = getattr(settings, "OUTBOX_MAX_ATTEMPTS", 5)
+OUTBOX_RETRY_DELAY = 60  # seconds before the first retry, doubled every attempt
+
+# A message left SENDING this long belongs to a worker that died mid-batch.
+OUTBOX_LOCK_TIMEOUT = timedelta(minutes=10)
+
+
+def queue_email(to_email, subject, html_content, organization=None):
+    """Record a message for delivery. Returns the OutboxEmail."""
+    return OutboxEmail.objects.create(
+        organization=organization,
+        to_email=to_email,
+        subject=subject,
+        html_content=html_content,
+    )
+
+
+def queue_emails(messages, organization=None):
+    """
+    Record many messages with one INSERT. ``messages`` is an iterable of
+    (to_email, subject, html_content) tuples.
+    """
+    return OutboxEmail.objects.bulk_create(
+        OutboxEmail(
+            organization=organization,
+            to_email=to_email,
+            subject=subject,
+            html_content=html_content,
+        )
+        for to_email, subject, html_content in messages
+    )
+
+
+def requeue_stale(now=None):
+    now = now or timezone.now()
+    return OutboxEmail.objects.filter(
+        status=OutboxEmail.STATUS_SENDING, locked_at__lt=now - OUTBOX_LOCK_TIMEOUT
+    ).update(status=OutboxEmail.STATUS_QUEUED, locked_at=None)
+
+
+def claim_batch(size=OUTBOX_BATCH_SIZE, now=None):
+    """Mark up to ``size`` due messages SENDING and return them."""
+    now = now or timezone.now()
+    with transaction.atomic():
+        ids = list(
+            OutboxEmail.objects
+            .select_for_update(skip_locked=True)
+            .filter(status=OutboxEmail.STATUS_QUEUED, send_after__lte=now)
+            .order_by("send_after", "id")
+            .values_list("pk", flat=True)[:size]
+        )
+        if not ids:
+            return []
+        # The status condition keeps two dispatchers on a database without
+        # SKIP LOCKED from claiming the same rows.
+        OutboxEmail.objects.filter(pk__in=ids, status=OutboxEmail.STATUS_QUEUED).update(
+            status=OutboxEmail.STATUS_SENDING,
+            locked_at=now,
+            attempts=F("attempts") + 1,
+        )
+    return list(
+        OutboxEmail.objects.filter(pk__in=ids, status=OutboxEmail.STATUS_SENDING, locked_at=now)
+    )
+
+
+def _failed(message, error, permanent, now):
+    if permanent or message.attempts >= OUTBOX_MAX_ATTEMPTS:
+        OutboxEmail.objects.filter(pk=message.pk).update(
+            status=OutboxEmail.STATUS_FAILED, last_error=error, locked_at=None
+        )
+        return
+    delay = OUTBOX_RETRY_DELAY * 2 ** (message.attempts - 1)
+    OutboxEmail.objects.filter(pk=message.pk).update(
+        status=OutboxEmail.STATUS_QUEUED,
+        send_after=now + timedelta(seconds=delay),
+        last_error=error,
+        locked_at=None,
+    )
+
+
+def dispatch(batch_size=OUTBOX_BATCH_SIZE, transport=None):
+    """
+    Send one batch of due messages. Returns ``(sent, failed)``, where failed
+    counts both retried and given-up messages.
+    """
+    requeue_stale()
+    batch = claim_batch(batch_size)
+    if not batch:
+        return 0, 0
+
+    transport = transport or get_transport()
+    sent = failed = 0
+    for message in batch:
+        now = timezone.now()
+        try:
+            message_id = transport.send(message.to_email, message.subject, message.html_content)
+        except EmailDeliveryError as e:
+            logger.warning("Email %s to %s failed: %s", message.pk, message.to_email, e)
+            _failed(message, str(e), e.permanent, now)
+            failed += 1
+            continue
+        except Exception as e:
+            logger.exception("Email %s to %s failed", message.pk, message.to_email)
+            _failed(message, str(e), False, now)
+            failed += 1
+            continue
+
+        OutboxEmail.objects.filter(pk=message.pk).update(
+            status=OutboxEmail.STATUS_SENT,
+            provider_message_id=message_id or "",
+            last_error="",
+            sent_at=now,
+            locked_at=None,
+        )
+        sent += 1
+    return sent, failed
+
+
+def dispatch_all(batch_size=OUTBOX_BATCH_SIZE, transport=None):
+    """Dispatch batches until nothing is due. Returns ``(sent, failed)``."""
+    transport = transport or get_transport()
+    total_sent = total_failed = 0
+    while True:
+        sent, failed = dispatch(batch_size, transport)
+        if not sent and not failed:
+            return total_sent, total_failed
+        total_sent += sent
+        total_failed += failed
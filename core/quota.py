@@ -0,0 +1,178 @@
+# core/quota.py
+"""
+Plan limits backed by per-organization usage counters.
+
+Counting the observations or users of an organization on every form view
+is O(n) and racy: two requests can both see "one left" and both create.
+Instead OrganizationUsage keeps running totals:
+
+* ``remaining(org, OBSERVATIONS)`` answers a limit check with one
+  single-row query (usage joined to the plan limit);
+* ``reserve(org, OBSERVATIONS)`` takes capacity with a conditional UPDATE
+  (``... SET observations = observations + 1 WHERE observations + 1 <= limit``),
+  so concurrent requests can never overshoot the limit. Call it inside the
+  transaction that creates the row, and mark the instance as reserved so
+  the signal doesn't count it twice;
+* ``add(org, resource, n)`` adjusts a counter (signals call it on create
+  and delete; bulk paths call it themselves).
+
+A missing usage row is created from real counts the first time it's needed.
+"""
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from .models import OrganizationUsage, Subscription
+
+OBSERVATIONS = "observations"
+USERS = "users"
+
+PLAN_LIMIT_FIELDS = {
+    OBSERVATIONS: "max_observations",
+    USERS: "max_users",
+}
+
+# Set on a model instance whose capacity was taken with reserve().
+RESERVED_ATTR = "_quota_reserved"
+
+
+class QuotaExceeded(Exception):
+    def __init__(self, resource, limit):
+        super().__init__(f"The plan allows {limit} {resource}.")
+        self.resource = resource
+        self.limit = limit
+
+
+def _organization_id(organization):
+    return getattr(organization, "pk", organization)
+
+
+def count_usage(organization_id):
+    """Actual usage, counted from the tables."""
+    from observations.models import ArchivedObservation, Observation
+    from users.models import CustomUser
+
+    return {
+        # Archived observations (both tiers) count against the plan too.
+        OBSERVATIONS: (
+            Observation.objects.filter(organization_id=organization_id).count()
+            + ArchivedObservation.objects.filter(organization_id=organization_id).count()
+        ),
+        USERS: CustomUser.objects.filter(organization_id=organization_id).count(),
+    }
+
+
+def ensure_usage(organization):
+    """The usage row of ``organization``, created from real counts if missing."""
+    organization_id = _organization_id(organization)
+    usage = OrganizationUsage.objects.filter(organization_id=organization_id).first()
+    if usage is not None:
+        return usage
+    try:
+        with transaction.atomic():
+            return OrganizationUsage.objects.create(
+                organization_id=organization_id, **count_usage(organization_id)
+            )
+    except IntegrityError:
+        return OrganizationUsage.objects.get(organization_id=organization_id)
+
+
+def usage_and_limit(organization, resource):
+    """``(used, limit)`` in one query; limit is None without a subscription."""
+    organization_id = _organization_id(organization)
+    limit_path = f"organization__subscription__plan__{PLAN_LIMIT_FIELDS[resource]}"
+    row = (
+        OrganizationUsage.objects
+        .filter(organization_id=organization_id)
+        .values_list(resource, limit_path)
+        .first()
+    )
+    if row is None:
+        usage = ensure_usage(organization_id)
+        return getattr(usage, resource), _plan_limit(organization_id, resource)
+    return row
+
+
+def _plan_limit(organization_id, resource):
+    return (
+        Subscription.objects
+        .filter(organization_id=organization_id)
+        .values_list(f"plan__{PLAN_LIMIT_FIELDS[resource]}", flat=True)
+        .first()
+    )
+
+
+def remaining(organization, resource):
+    """How many more ``resource`` the plan allows (0 without a subscription)."""
+    used, limit = usage_and_limit(organization, resource)
+    if limit is None:
+        return 0
+    return max(limit - used, 0)
+
+
+def reserve(organization, resource, amount=1):
+    """
+    Take ``amount`` of ``resource`` or raise QuotaExceeded. Atomic against
+    concurrent reservations; rolled back with the surrounding transaction.
+    """
+    organization_id = _organization_id(organization)
+    ensure_usage(organization_id)
+    limit = _plan_limit(organization_id, resource)
+    if limit is None:
+        raise QuotaExceeded(resource, 0)
+    taken = OrganizationUsage.objects.filter(
+        organization_id=organization_id, **{f"{resource}__lte": limit - amount}
+    ).update(**{resource: F(resource) + amount, "updated_at": timezone.now()})
+    if not taken:
+        raise QuotaExceeded(resource, limit)
+
+
+def add(organization, resource, amount):
+    """Adjust a counter by ``amount`` (negative to release), never below zero."""
+    organization_id = _organization_id(organization)
+    if organization_id is None or not amount:
+        return
+    updated = OrganizationUsage.objects.filter(organization_id=organization_id).update(
+        **{resource: Greatest(F(resource) + amount, 0), "updated_at": timezone.now()}
+    )
+    if not updated and amount > 0:
+        # Counted from the tables, which already include this change. (Not
+        # on release: the organization itself may be being deleted.)
+        ensure_usage(organization_id)
+
+
+def reconcile(organization=None):
+    """
+    Recompute the counters from the tables. Returns a list of
+    ``(organization_id, resource, stored, actual)`` for the counters that
+    had drifted.
+    """
+    from .models import Organization
+
+    organizations = Organization.objects.all()
+    if organization is not None:
+        organizations = organizations.filter(pk=_organization_id(organization))
+
+    drift = []
+    for organization_id in organizations.values_list("pk", flat=True).iterator():
+        ensure_usage(organization_id)
+        with transaction.atomic():
+            # Lock the row while counting: a create committed before the
+            # count has already bumped it, one committing after waits for us.
+            usage = OrganizationUsage.objects.select_for_update().get(pk=organization_id)
+            actual = count_usage(organization_id)
+            changed = {
+                resource: count
+                for resource, count in actual.items()
+                if getattr(usage, resource) != count
+            }
+            if changed:
+                drift += [
+                    (organization_id, resource, getattr(usage, resource), count)
+                    for resource, count in changed.items()
+                ]
+                OrganizationUsage.objects.filter(pk=organization_id).update(
+                    **changed, updated_at=timezone.now()
+                )
+    return drift
@@ -0,0 +1,81 @@
+# core/session_benchmark.py
+"""
+Request latency and database writes per session/message storage profile
+(settings.SESSION_PROFILES), for ``manage.py benchmark_sessions``.
+
+Each round trip is the common "do something, flash a message, redirect"
+pattern: a request that adds a message and redirects, then the page that
+shows it. Both go through the full middleware stack with the test client,
+logged in as a real user, inside a transaction that is rolled back, so
+nothing the benchmark writes is kept.
+"""
+import statistics
+import time
+
+from django.contrib import messages
+from django.db import connection, transaction
+from django.shortcuts import redirect
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import include, path
+
+FLASH_PATH = "/_benchmark/flash/"
+
+WRITE_STATEMENTS = ("INSERT", "UPDATE", "DELETE", "REPLACE")
+
+
+def flash(request):
+    messages.success(request, "Benchmark message.")
+    return redirect(request.GET.get("next", "/"))
+
+
+# The project URLs plus the flash view; used as ROOT_URLCONF while measuring.
+urlpatterns = [
+    path(FLASH_PATH.strip("/") + "/", flash),
+    path("", include("safety_inspection.urls")),
+]
+
+
+def _is_write(sql):
+    return sql.lstrip().split(" ", 1)[0].upper() in WRITE_STATEMENTS
+
+
+def _request(client, url, results):
+    with CaptureQueriesContext(connection) as queries:
+        started = time.perf_counter()
+        response = client.get(url)
+        elapsed = (time.perf_counter() - started) * 1000
+    if response.status_code >= 400:
+        raise RuntimeError(f"GET {url} returned {response.status_code}")
+    results["ms"].append(elapsed)
+    results["queries"].append(len(queries))
+    results["writes"].append(sum(_is_write(q["sql"]) for q in queries.captured_queries))
+    return response
+
+
+def run_profile(profile, user, page, requests=50, warmup=5):
+    """
+    Measure ``requests`` round trips to ``page`` under ``profile`` (a dict
+    of settings). Returns per-request medians and totals.
+    """
+    results = {"ms": [], "queries": [], "writes": []}
+    with override_settings(ROOT_URLCONF=__name__, **profile), transaction.atomic():
+        client = Client()
+        client.force_login(user)
+        target = f"{FLASH_PATH}?next={page}"
+        for _ in range(warmup):
+            client.get(target, follow=True)
+        for _ in range(requests):
+            response = _request(client, target, results)
+            _request(client, response["Location"], results)
+        transaction.set_rollback(True)
+
+    ms = sorted(results["ms"])
+    count = len(ms)
+    return {
+        "requests": count,
+        "median_ms": statistics.median(ms),
+        "p95_ms": ms[min(count - 1, int(count * 0.95))],
+        "queries_per_request": sum(results["queries"]) / count,
+        "writes_per_request": sum(results["writes"]) / count,
+    }
@@ -1,15 +1,58 @@
-from django.db.models.signals import post_save
+# core/signals.py
+from django.conf import settings
+from django.db.models.signals import post_delete, post_save, pre_save
 from django.dispatch import receiver
-from .models import Organization, Subscription, Plan
 
+from . import quota, tenant
+from .models import Organization, Plan, Subscription
 
-@receiver(post_save, sender=Organization)
-def create_subscription(sender, instance, created, **kwargs):
+
+@receiver(pre_save, sender=settings.AUTH_USER_MODEL)
+def capture_user_organization(sender, instance, raw=False, update_fields=None, **kwargs):
+    """Remember the organization a user belonged to before this save."""
+    if raw or instance.pk is None or (update_fields is not None and "organization" not in update_fields):
+        instance._organization_before = instance.organization_id
+        return
+    instance._organization_before = (
+        sender.objects.filter(pk=instance.pk).values_list("organization_id", flat=True).first()
+    )
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def count_user(sender, instance, created=False, raw=False, **kwargs):
+    if raw:
+        return
     if created:
-        free_plan, _ = Plan.objects.get_or_create(name="Free")
+        if not getattr(instance, quota.RESERVED_ATTR, False):
+            quota.add(instance.organization_id, quota.USERS, 1)
+        return
+    before = getattr(instance, "_organization_before", instance.organization_id)
+    if before != instance.organization_id:
+        quota.add(before, quota.USERS, -1)
+        quota.add(instance.organization_id, quota.USERS, 1)
+    instance._organization_before = instance.organization_id
+
+
+@receiver(post_delete, sender=settings.AUTH_USER_MODEL)
+def uncount_user(sender, instance, **kwargs):
+    quota.add(instance.organization_id, quota.USERS, -1)
+
+
+@receiver(post_save, sender=Organization)
+@receiver(post_delete, sender=Organization)
+def invalidate_organization_tenant(sender, instance, **kwargs):
+    tenant.invalidate(instance.pk)
+
+
+@receiver(post_save, sender=Subscription)
+@receiver(post_delete, sender=Subscription)
+def invalidate_subscription_tenant(sender, instance, **kwargs):
+    tenant.invalidate(instance.organization_id)
+
 
-        Subscription.objects.create(
-            organization=instance,
-            defaults = {
-                "plan": free_plan}
-        )
+@receiver(post_save, sender=Plan)
+@receiver(post_delete, sender=Plan)
+def invalidate_plan_tenants(sender, instance, **kwargs):
+    tenant.invalidate(
+        *Subscription.objects.filter(plan=instance).values_list("organization_id", flat=True)
+    )
@@ -0,0 +1,99 @@
+# core/tenant.py
+"""
+The tenant of a request: the user's organization with its subscription and
+plan.
+
+OrganizationMiddleware resolves it once per request and exposes it as
+``request.tenant`` (``request.organization`` is kept for existing code).
+The three rows are loaded with one joined query and, when the shared cache
+is Redis, kept in it for TENANT_CACHE_TIMEOUT seconds, so most requests
+don't query them at all.
+Saving or deleting an organization, subscription or plan drops the cached
+entries it affects (see core.signals). The cache is the "shared" alias, so
+the entry is dropped for every worker, and it is dropped again when the
+transaction commits, in case another request cached the old rows meanwhile.
+
+Nothing that must be exact is read from the cached objects: usage counters
+(core.quota) and ``Organization.data_version`` (observations.cache) are
+always read from the database.
+"""
+from dataclasses import dataclass
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+from .models import Organization, Plan, Subscription
+
+TENANT_CACHE_ALIAS = getattr(settings, "TENANT_CACHE_ALIAS", "shared")
+# Seconds; 0 (the default) disables the cache.
+TENANT_CACHE_TIMEOUT = getattr(settings, "TENANT_CACHE_TIMEOUT", 0)
+
+
+@dataclass(frozen=True)
+class Tenant:
+    organization: Organization
+    subscription: Subscription = None
+    plan: Plan = None
+
+
+def cache_key(organization_id):
+    return f"tenant:{organization_id}"
+
+
+def load(organization_id):
+    """Build the Tenant of ``organization_id`` with one query (None if it doesn't exist)."""
+    organization = (
+        Organization.objects
+        .select_related("subscription__plan")
+        .filter(pk=organization_id)
+        .first()
+    )
+    if organization is None:
+        return None
+    subscription = getattr(organization, "subscription", None)
+    return Tenant(
+        organization=organization,
+        subscription=subscription,
+        plan=subscription.plan if subscription is not None else None,
+    )
+
+
+def resolve(user):
+    """The Tenant of ``user``, from the cache when possible."""
+    organization_id = getattr(user, "organization_id", None)
+    if organization_id is None:
+        return None
+    if not TENANT_CACHE_TIMEOUT:
+        return load(organization_id)
+
+    cache = caches[TENANT_CACHE_ALIAS]
+    key = cache_key(organization_id)
+    tenant = cache.get(key)
+    if tenant is None:
+        tenant = load(organization_id)
+        if tenant is not None:
+            cache.set(key, tenant, TENANT_CACHE_TIMEOUT)
+    return tenant
+
+
+def invalidate(*organization_ids):
+    """Drop the cached tenants of ``organization_ids``, now and on commit."""
+    keys = [cache_key(pk) for pk in organization_ids]
+    if not keys:
+        return
+    caches[TENANT_CACHE_ALIAS].delete_many(keys)
+    transaction.on_commit(lambda: caches[TENANT_CACHE_ALIAS].delete_many(keys))
+
+
+def ensure_subscription(tenant):
+    """The tenant's subscription, put on the Free plan if it has none."""
+    if tenant.subscription is not None:
+        return tenant.subscription
+    free_plan, _ = Plan.objects.get_or_create(name="Free")
+    subscription, _ = Subscription.objects.get_or_create(
+        organization=tenant.organization,
+        defaults={"plan": free_plan},
+    )
+    # The Subscription post_save signal drops the cached tenant.
+    return subscription
@@ -1,3 +1,368 @@
-from django.test import TestCase
+import importlib
+import io
+import os
+import runpy
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.sessions.models import Session
+from django.core.cache import caches
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import CommandError, call_command
+from django.db import transaction
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from core import invites, jobs, outbox, quota, tenant
+from core.models import Job, Organization, OutboxEmail, Plan, Subscription, UserInvite
+from core.management.commands import startup_profile
+from core.utils.email import EmailDeliveryError, LocmemTransport
+from core.utils.lazy import LazyModule, lazy_import
+from observations import exports, imports
+from observations.models import Location, Observation
+from users.models import CustomUser
+
+
+class RejectingTransport:
+    def send(self, to_email, subject, html_content):
+        raise EmailDeliveryError("invalid address", permanent=True)
+
+
+@override_settings(EMAIL_TRANSPORT="core.utils.email.LocmemTransport")
+class OutboxTests(TestCase):
+    def setUp(self):
+        LocmemTransport.outbox = []
+        LocmemTransport.failing = set()
+
+    def test_queue_email_only_writes_a_row(self):
+        with self.assertNumQueries(1):
+            outbox.queue_email("a@example.com", "Hello", "<p>Hi</p>")
+        self.assertEqual(LocmemTransport.outbox, [])
+        self.assertEqual(OutboxEmail.objects.get().status, OutboxEmail.STATUS_QUEUED)
+
+    def test_dispatch_sends_due_messages_in_batches(self):
+        outbox.queue_emails(
+            (f"user{i}@example.com", "Hello", "<p>Hi</p>") for i in range(5)
+        )
+        self.assertEqual(outbox.dispatch(batch_size=2), (2, 0))
+        self.assertEqual(outbox.dispatch_all(batch_size=2), (3, 0))
+
+        self.assertEqual(len(LocmemTransport.outbox), 5)
+        self.assertFalse(OutboxEmail.objects.exclude(status=OutboxEmail.STATUS_SENT).exists())
+        self.assertTrue(OutboxEmail.objects.filter(provider_message_id="locmem-1").exists())
+
+    def test_transient_failure_is_retried_with_backoff(self):
+        LocmemTransport.failing = {"down@example.com"}
+        email = outbox.queue_email("down@example.com", "Hello", "<p>Hi</p>")
+
+        self.assertEqual(outbox.dispatch(), (0, 1))
+        email.refresh_from_db()
+        self.assertEqual(email.status, OutboxEmail.STATUS_QUEUED)
+        self.assertEqual(email.attempts, 1)
+        self.assertGreater(email.send_after, timezone.now())
+        self.assertIn("unavailable", email.last_error)
+
+        # Not due yet
+        self.assertEqual(outbox.dispatch(), (0, 0))
+
+        LocmemTransport.failing = set()
+        OutboxEmail.objects.update(send_after=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(outbox.dispatch(), (1, 0))
+        email.refresh_from_db()
+        self.assertEqual(email.status, OutboxEmail.STATUS_SENT)
+        self.assertEqual(email.attempts, 2)
+
+    def test_gives_up_after_max_attempts(self):
+        LocmemTransport.failing = {"down@example.com"}
+        email = outbox.queue_email("down@example.com", "Hello", "<p>Hi</p>")
+        for _ in range(outbox.OUTBOX_MAX_ATTEMPTS):
+            OutboxEmail.objects.update(send_after=timezone.now() - timedelta(seconds=1))
+            outbox.dispatch()
+        email.refresh_from_db()
+        self.assertEqual(email.status, OutboxEmail.STATUS_FAILED)
+        self.assertEqual(email.attempts, outbox.OUTBOX_MAX_ATTEMPTS)
+
+    def test_permanent_failure_is_not_retried(self):
+        email = outbox.queue_email("bad@example", "Hello", "<p>Hi</p>")
+        self.assertEqual(outbox.dispatch(transport=RejectingTransport()), (0, 1))
+        email.refresh_from_db()
+        self.assertEqual(email.status, OutboxEmail.STATUS_FAILED)
+        self.assertEqual(email.attempts, 1)
+
+    def test_stale_sending_messages_are_requeued(self):
+        email = outbox.queue_email("a@example.com", "Hello", "<p>Hi</p>")
+        OutboxEmail.objects.update(
+            status=OutboxEmail.STATUS_SENDING,
+            locked_at=timezone.now() - outbox.OUTBOX_LOCK_TIMEOUT - timedelta(minutes=1),
+        )
+        self.assertEqual(outbox.dispatch(), (1, 0))
+        email.refresh_from_db()
+        self.assertEqual(email.status, OutboxEmail.STATUS_SENT)
+
+
+@mock.patch.dict(jobs._registry)
+class JobTests(TestCase):
+    def setUp(self):
+        self.failures = []
+        jobs.job("tests.noop", max_attempts=2, on_failure=lambda job, exc: self.failures.append(exc))(
+            lambda job: job.set_progress(50, "Half way")
+        )
+
+    def claim(self):
+        job = jobs.claim_next("worker-1", ["tests.noop"])
+        self.assertIsNotNone(job)
+        return job
+
+    def expire(self):
+        Job.objects.update(locked_at=timezone.now() - jobs.JOB_LOCK_TIMEOUT - timedelta(minutes=1))
+
+    def test_set_progress_refreshes_the_lock(self):
+        jobs.enqueue("tests.noop")
+        job = self.claim()
+        self.expire()
+        job.set_progress(10)
+        self.assertEqual(jobs.requeue_stale(), 0)
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.STATUS_RUNNING)
+        self.assertEqual(job.progress, 10)
+
+    def test_stale_job_is_requeued_with_backoff(self):
+        jobs.enqueue("tests.noop")
+        self.claim()
+        self.expire()
+        self.assertEqual(jobs.requeue_stale(), 1)
+        job = Job.objects.get()
+        self.assertEqual(job.status, Job.STATUS_QUEUED)
+        self.assertEqual(job.attempts, 1)
+        self.assertEqual(job.locked_by, "")
+        self.assertGreater(job.run_after, timezone.now())
+        self.assertIn("worker-1", job.last_error)
+
+    def test_stale_job_fails_after_max_attempts(self):
+        jobs.enqueue("tests.noop")
+        for _ in range(2):
+            Job.objects.update(run_after=timezone.now() - timedelta(seconds=1))
+            self.claim()
+            self.expire()
+            jobs.requeue_stale()
+        job = Job.objects.get()
+        self.assertEqual(job.status, Job.STATUS_FAILED)
+        self.assertEqual(job.attempts, 2)
+        self.assertIsNotNone(job.finished_at)
+        self.assertEqual(len(self.failures), 1)
+        self.assertIsInstance(self.failures[0], jobs.WorkerLost)
+
+    def test_run_records_success(self):
+        jobs.enqueue("tests.noop")
+        self.assertTrue(jobs.run(self.claim()))
+        job = Job.objects.get()
+        self.assertEqual(job.status, Job.STATUS_SUCCEEDED)
+        self.assertIsNone(job.locked_at)
+
+
+class TenantTests(TestCase):
+    @mock.patch.object(tenant, "TENANT_CACHE_TIMEOUT", 30)
+    def test_plan_change_is_seen_through_the_shared_cache(self):
+        free = Plan.objects.create(name="Free", price_monthly=0, max_users=5, max_observations=50)
+        pro = Plan.objects.create(name="Pro", price_monthly=10, max_users=50, max_observations=5000)
+        org = Organization.objects.create(name="Acme", domain="acme.test")
+        subscription = Subscription.objects.create(organization=org, plan=free)
+        user = type("User", (), {"organization_id": org.pk})()
+
+        self.assertEqual(tenant.resolve(user).plan, free)
+        self.assertIsNotNone(caches[tenant.TENANT_CACHE_ALIAS].get(tenant.cache_key(org.pk)))
+        with self.captureOnCommitCallbacks(execute=True):
+            subscription.plan = pro
+            subscription.save()
+        self.assertEqual(tenant.resolve(user).plan, pro)
+
+    @mock.patch.object(tenant, "TENANT_CACHE_TIMEOUT", 0)
+    def test_no_cache_when_disabled(self):
+        org = Organization.objects.create(name="Acme", domain="acme.test")
+        user = type("User", (), {"organization_id": org.pk})()
+        self.assertEqual(tenant.resolve(user).organization, org)
+        self.assertIsNone(caches[tenant.TENANT_CACHE_ALIAS].get(tenant.cache_key(org.pk)))
+
+
+class InviteTests(TestCase):
+    def setUp(self):
+        plan = Plan.objects.create(name="Team", price_monthly=10, max_users=3, max_observations=100)
+        self.org = Organization.objects.create(name="Acme", domain="acme.test")
+        Subscription.objects.create(organization=self.org, plan=plan)
+        self.manager = CustomUser.objects.create_user("boss@acme.test", "pw", organization=self.org, is_manager=True)
+        UserInvite.objects.create(organization=self.org, email="pending@acme.test", role="observer")
+
+    def link(self, invite):
+        return f"https://example.com/{invite.token}"
+
+    def test_open_invites_count_against_the_limit(self):
+        self.assertEqual(invites.remaining_capacity(self.org), 1)
+        self.assertTrue(invites.invite_user(self.org, UserInvite(email="a@acme.test", role="observer"), self.link))
+        self.assertFalse(invites.invite_user(self.org, UserInvite(email="b@acme.test", role="observer"), self.link))
+        self.assertEqual(UserInvite.objects.filter(organization=self.org).count(), 2)
+        self.assertEqual(OutboxEmail.objects.count(), 1)
+
+    def test_expired_invite_frees_its_seat(self):
+        UserInvite.objects.create(
+            organization=self.org, email="late@acme.test", role="observer",
+            expires_at=timezone.now() - timedelta(minutes=1),
+        )
+        self.assertEqual(invites.remaining_capacity(self.org), 1)
+        UserInvite.objects.filter(email="pending@acme.test").update(expires_at=timezone.now() - timedelta(days=1))
+        self.assertEqual(invites.remaining_capacity(self.org), 2)
+
+        # The address can be invited again.
+        rows = [invites.InviteRow(line=1, email="pending@acme.test", role="observer")]
+        invites.bulk_invite(self.org, rows, self.link)
+        self.assertEqual(rows[0].result, invites.INVITED)
+
+    def test_new_invites_expire(self):
+        invite = UserInvite(email="a@acme.test", role="observer")
+        self.assertTrue(invites.invite_user(self.org, invite, self.link))
+        self.assertAlmostEqual(
+            invite.expires_at, timezone.now() + timedelta(days=invites.INVITE_VALID_DAYS),
+            delta=timedelta(minutes=1),
+        )
+
+    def test_bulk_invite_uses_the_same_capacity(self):
+        rows = [invites.InviteRow(line=i, email=f"user{i}@acme.test", role="observer") for i in range(3)]
+        created = invites.bulk_invite(self.org, rows, self.link)
+        self.assertEqual(len(created), 1)
+        self.assertEqual([row.result for row in rows], [invites.INVITED, invites.OVER_LIMIT, invites.OVER_LIMIT])
+
+    def test_invite_view_refuses_over_the_limit(self):
+        UserInvite.objects.create(organization=self.org, email="other@acme.test", role="observer")
+        self.client.force_login(self.manager)
+        response = self.client.get(reverse("core:invite_user"))
+        self.assertEqual(response.status_code, 200)
+        response = self.client.post(reverse("core:invite_user"), {"email": "new@acme.test", "role": "observer"})
+        self.assertRedirects(response, reverse("core:invite_user"))
+        self.assertFalse(UserInvite.objects.filter(email="new@acme.test").exists())
+
+
+class QuotaTests(TestCase):
+    def setUp(self):
+        self.plan = Plan.objects.create(name="Team", price_monthly=10, max_users=5, max_observations=3)
+        self.org = Organization.objects.create(name="Acme", domain="acme.test")
+        Subscription.objects.create(organization=self.org, plan=self.plan)
+        self.location = Location.objects.create(name="Yard")
+
+    def used(self):
+        return quota.usage_and_limit(self.org, quota.OBSERVATIONS)[0]
+
+    def test_reserve_up_to_the_limit(self):
+        quota.reserve(self.org, quota.OBSERVATIONS, 2)
+        quota.reserve(self.org, quota.OBSERVATIONS)
+        self.assertEqual(quota.usage_and_limit(self.org, quota.OBSERVATIONS), (3, 3))
+        with self.assertRaises(quota.QuotaExceeded):
+            quota.reserve(self.org, quota.OBSERVATIONS)
+        self.assertEqual(self.used(), 3)
+
+    def test_reservation_larger_than_what_is_left_takes_nothing(self):
+        quota.reserve(self.org, quota.OBSERVATIONS, 2)
+        with self.assertRaises(quota.QuotaExceeded):
+            quota.reserve(self.org, quota.OBSERVATIONS, 2)
+        self.assertEqual(quota.remaining(self.org, quota.OBSERVATIONS), 1)
+
+    def test_release_never_goes_below_zero(self):
+        quota.reserve(self.org, quota.OBSERVATIONS, 2)
+        quota.add(self.org, quota.OBSERVATIONS, -1)
+        self.assertEqual(self.used(), 1)
+        quota.add(self.org, quota.OBSERVATIONS, -5)
+        self.assertEqual(self.used(), 0)
+
+    def test_reservation_rolls_back_with_the_transaction(self):
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            quota.reserve(self.org, quota.OBSERVATIONS, 3)
+            raise RuntimeError
+        self.assertEqual(self.used(), 0)
+
+    def test_saving_and_deleting_observations_is_counted(self):
+        observation = Observation.objects.create(
+            organization=self.org, location=self.location, title="Spill", description=""
+        )
+        self.assertEqual(self.used(), 1)
+        observation.delete()
+        self.assertEqual(self.used(), 0)
+
+    def test_no_subscription_means_no_capacity(self):
+        other = Organization.objects.create(name="Other", domain="other.test")
+        self.assertEqual(quota.remaining(other, quota.OBSERVATIONS), 0)
+        with self.assertRaises(quota.QuotaExceeded):
+            quota.reserve(other, quota.OBSERVATIONS)
+
+
+class SessionProfileTests(TestCase):
+    def load_settings(self, **environ):
+        with mock.patch.dict(os.environ, environ):
+            return runpy.run_path(importlib.import_module(settings.SETTINGS_MODULE).__file__)
+
+    def test_cached_db_requires_redis(self):
+        environ = {key: value for key, value in os.environ.items() if key != "REDIS_URL"}
+        with mock.patch.dict(os.environ, environ, clear=True):
+            with self.assertRaisesMessage(ImproperlyConfigured, "set REDIS_URL"):
+                self.load_settings(SESSION_PROFILE="cached_db")
+            self.assertEqual(self.load_settings(SESSION_PROFILE="db")["SESSION_PROFILE"], "db")
+        loaded = self.load_settings(SESSION_PROFILE="cached_db", REDIS_URL="redis://localhost:6379/0")
+        self.assertEqual(loaded["SESSION_ENGINE"], "django.contrib.sessions.backends.cached_db")
+
+    def test_benchmark_runs_on_the_default_profile(self):
+        org = Organization.objects.create(name="Acme", domain="acme.test")
+        user = CustomUser.objects.create_user("ann@acme.test", "pw", organization=org)
+        out = io.StringIO()
+        call_command("benchmark_sessions", "--profile", settings.SESSION_PROFILE, "--requests", "2", stdout=out)
+        self.assertIn(f"as {user.email}", out.getvalue())
+        self.assertRegex(out.getvalue(), rf"\n{settings.SESSION_PROFILE} +\d")
+        self.assertFalse(Session.objects.exists())  # rolled back
+
+
+class LazyImportTests(TestCase):
+    def test_imported_once_on_first_attribute_access(self):
+        with mock.patch("core.utils.lazy.importlib.import_module", wraps=importlib.import_module) as load:
+            module = lazy_import("json")
+            self.assertFalse(module.is_loaded)
+            self.assertIn("not loaded", repr(module))
+            load.assert_not_called()
+
+            self.assertEqual(module.dumps([1]), "[1]")
+            self.assertEqual(module.loads("2"), 2)
+            load.assert_called_once_with("json")
+        self.assertTrue(module.is_loaded)
+
+    def test_missing_module_fails_on_first_use(self):
+        module = lazy_import("no_such_module_for_tests")
+        with self.assertRaises(ModuleNotFoundError):
+            module.anything
+
+    def test_heavy_stacks_are_lazy(self):
+        for module in (exports.openpyxl, imports.openpyxl, imports.pandas):
+            self.assertIsInstance(module, LazyModule)
+
+
+class StartupProfileTests(TestCase):
+    def profile(self, *args):
+        out = io.StringIO()
+        call_command("startup_profile", "--repeat", "1", *args, stdout=out)
+        return out.getvalue()
+
+    def test_no_heavy_modules_at_startup(self):
+        # A real cold start in a fresh interpreter.
+        output = self.profile("--fail-on-heavy", "--memory-budget", "1024")
+        self.assertIn("No heavy modules imported at startup.", output)
+        self.assertRegex(output, r"Worker RSS after boot: +[\d.]+ MB")
+        self.assertRegex(output, r"\d+ workers fit in 1024 MB")
+
+    def test_heavy_module_at_startup(self):
+        probe = {
+            "setup_ms": 300.0, "urls_ms": 50.0, "rss_boot_kb": 100 * 1024,
+            "heavy_at_boot": ["pandas"], "on_demand": {"openpyxl": {"ms": 80.0, "rss_kb": 8 * 1024}},
+        }
+        with mock.patch.object(startup_profile.Command, "_probe", return_value=probe):
+            output = self.profile("--memory-budget", "1000")
+            self.assertIn("Imported at startup: pandas", output)
+            self.assertIn("openpyxl", output)
+            self.assertIn("10 workers fit in 1000 MB", output)
+            with self.assertRaisesMessage(CommandError, "Imported at startup: pandas"):
+                self.profile("--fail-on-heavy")
@@ -6,5 +6,7 @@ urlpatterns = [
     path("request-demo/", request_demo_view, name="request_demo"),
     path("signup/", organization_signup, name="organization_signup"),
     path("invite/", views.invite_user, name="invite_user"),
+    path("invite/bulk/", views.bulk_invite_users, name="bulk_invite_users"),
     path("accept-invite/<uuid:token>/", views.accept_invite, name="accept_invite"),
+    path("jobs/<int:pk>/", views.job_status, name="job_status"),
 ]
@@ -1,24 +1,95 @@
-import sib_api_v3_sdk
-from sib_api_v3_sdk.rest import ApiException
+"""
+Email transports.
+
+Application code does not send email itself: it records an OutboxEmail with
+``core.outbox.queue_email`` and the worker hands queued messages to the
+transport named by the ``EMAIL_TRANSPORT`` setting:
+
+* ``BrevoTransport``   Brevo transactional API over one pooled HTTP client
+* ``LocmemTransport``  keeps messages in memory, for tests and local runs
+"""
+import threading
+
 from django.conf import settings
+from django.utils.module_loading import import_string
 
-def send_brevo_email(to_email, subject, html_content):
-    configuration = sib_api_v3_sdk.Configuration()
-    configuration.api_key['api-key'] = settings.BREVO_API_KEY
+from core.utils.lazy import lazy_import
 
-    api_instance = sib_api_v3_sdk.TransactionalEmailsApi(
-        sib_api_v3_sdk.ApiClient(configuration)
-    )
+sib_api_v3_sdk = lazy_import("sib_api_v3_sdk")
 
-    email = sib_api_v3_sdk.SendSmtpEmail(
-        to=[{"email": to_email}],
-        subject=subject,
-        html_content=html_content,
-        sender={"email": settings.DEFAULT_FROM_EMAIL.split("<")[1].replace(">", "")}
-    )
 
-    try:
-        api_instance.send_transac_email(email)
-    except ApiException as e:
-        raise Exception(f"Brevo email failed: {e}")
+class EmailDeliveryError(Exception):
+    """
+    A message could not be handed to the provider. ``permanent`` errors
+    (e.g. a rejected address) are not retried.
+    """
+
+    def __init__(self, message, permanent=False):
+        super().__init__(message)
+        self.permanent = permanent
+
+
+def sender_address():
+    return settings.DEFAULT_FROM_EMAIL.split("<")[1].replace(">", "")
+
+
+class BrevoTransport:
+    # Building an ApiClient sets up a new urllib3 pool, so one client (and
+    # its keep-alive connections) is shared by every send in the process.
+    _api = None
+    _lock = threading.Lock()
+
+    @classmethod
+    def api(cls):
+        if cls._api is None:
+            with cls._lock:
+                if cls._api is None:
+                    configuration = sib_api_v3_sdk.Configuration()
+                    configuration.api_key["api-key"] = settings.BREVO_API_KEY
+                    cls._api = sib_api_v3_sdk.TransactionalEmailsApi(
+                        sib_api_v3_sdk.ApiClient(configuration)
+                    )
+        return cls._api
 
+    def send(self, to_email, subject, html_content):
+        """Send one message; returns the provider message id."""
+        email = sib_api_v3_sdk.SendSmtpEmail(
+            to=[{"email": to_email}],
+            subject=subject,
+            html_content=html_content,
+            sender={"email": sender_address()},
+        )
+        try:
+            response = self.api().send_transac_email(email)
+        except sib_api_v3_sdk.rest.ApiException as e:
+            # 4xx other than rate limiting means Brevo will never accept it.
+            permanent = e.status is not None and 400 <= e.status < 500 and e.status != 429
+            raise EmailDeliveryError(f"Brevo email failed: {e}", permanent=permanent) from e
+        return getattr(response, "message_id", "") or ""
+
+
+class LocmemTransport:
+    """Fake transport: appends every message to ``LocmemTransport.outbox``."""
+
+    outbox = []
+    # Addresses that fail with a transient error, for testing retries.
+    failing = set()
+
+    def send(self, to_email, subject, html_content):
+        if to_email in self.failing:
+            raise EmailDeliveryError(f"{to_email} is unavailable")
+        self.outbox.append({"to_email": to_email, "subject": subject, "html_content": html_content})
+        return f"locmem-{len(self.outbox)}"
+
+
+def get_transport():
+    path = getattr(settings, "EMAIL_TRANSPORT", "core.utils.email.BrevoTransport")
+    return import_string(path)()
+
+
+def send_brevo_email(to_email, subject, html_content):
+    """Send one message right away. Prefer ``core.outbox.queue_email``."""
+    try:
+        BrevoTransport().send(to_email, subject, html_content)
+    except EmailDeliveryError as e:
+        raise Exception(str(e))
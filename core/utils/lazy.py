@@ -0,0 +1,43 @@
+import importlib
+import threading
+
+
+class LazyModule:
+    """
+    Stand-in for a module that is only imported on first attribute access.
+
+    Heavy optional stacks (openpyxl, pandas, plotly) cost hundreds of
+    milliseconds and tens of MB per worker to import. Importing them lazily
+    keeps them out of workers that never serve the pages that need them:
+
+        openpyxl = lazy_import("openpyxl")
+        ...
+        wb = openpyxl.Workbook()  # imported here, once
+    """
+
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        if self._module is None:
+            with self._lock:
+                if self._module is None:
+                    self._module = importlib.import_module(self._name)
+        return self._module
+
+    @property
+    def is_loaded(self):
+        return self._module is not None
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+    def __repr__(self):
+        state = "loaded" if self.is_loaded else "not loaded"
+        return f"<LazyModule {self._name!r} ({state})>"
+
+
+def lazy_import(name):
+    return LazyModule(name)
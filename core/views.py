@@ -171,13 +171,13 @@ from django.contrib.auth.decorators import login_required
 from django.core.exceptions import PermissionDenied
 from django.shortcuts import render, redirect
 from django.urls import reverse
-from django.template.loader import render_to_string
 
 from .forms import InviteUserForm
 # from core.utils.email import send_email
 
-from core.utils.email import send_brevo_email
-from django.template.loader import render_to_string
+from core import invites, tenant
+from .forms import BulkInviteForm
+from django.core.exceptions import ValidationError
 from django.utils import timezone
 from datetime import timedelta
 
@@ -188,7 +188,6 @@ from django.core.exceptions import PermissionDenied
 from django.contrib import messages
 from django.shortcuts import render, redirect
 from django.urls import reverse
-from django.template.loader import render_to_string
 
 from core.models import Subscription, Plan
 from users.models import CustomUser as User
@@ -197,32 +196,22 @@ from users.models import CustomUser as User
 @login_required
 def invite_user(request):
 
-    if not request.user.is_manager:
+    if not request.user.is_manager or request.tenant is None:
         raise PermissionDenied
 
     # -------------------------------------------------
     # 1️⃣ Ensure subscription exists
     # -------------------------------------------------
-    free_plan, _ = Plan.objects.get_or_create(name="Free")
-
-    subscription, _ = Subscription.objects.get_or_create(
-        organization=request.organization,
-        defaults={"plan": free_plan}
-    )
+    tenant.ensure_subscription(request.tenant)
 
     # -------------------------------------------------
     # 2️⃣ Check user limit BEFORE invite
     # -------------------------------------------------
-    current_users = User.objects.filter(
-        organization=request.organization
-    ).count()
-
-    if current_users >= subscription.plan.max_users:
-        messages.error(
-            request,
-            "User limit reached for current plan. Upgrade to invite more users."
-        )
-        return redirect("core:invite_user")
+    # Open invites count against the limit too, and a POST is checked again
+    # when the invite is saved (see core/invites.py).
+    limit_message = "User limit reached for current plan. Upgrade to invite more users."
+    if request.method != "POST" and invites.remaining_capacity(request.organization) <= 0:
+        messages.error(request, limit_message)
 
     # -------------------------------------------------
     # 3️⃣ Process form
@@ -231,29 +220,17 @@ def invite_user(request):
         form = InviteUserForm(request.POST)
 
         if form.is_valid():
-            invite = form.save(commit=False)
-            invite.organization = request.organization
-            invite.save()
-
-            invite_link = request.build_absolute_uri(
-                reverse("core:accept_invite", args=[invite.token])
+            sent = invites.invite_user(
+                request.organization,
+                form.save(commit=False),
+                lambda invite: request.build_absolute_uri(
+                    reverse("core:accept_invite", args=[invite.token])
+                ),
             )
-
-            html = render_to_string(
-                "emails/invite_user.html",
-                {
-                    "organization": invite.organization,
-                    "invite_link": invite_link,
-                }
-            )
-
-            send_brevo_email(
-                to_email=invite.email,
-                subject="You're invited to Safety Observation Platform",
-                html_content=html,
-            )
-
-            messages.success(request, "Invitation sent successfully.")
+            if sent:
+                messages.success(request, "Invitation sent successfully.")
+            else:
+                messages.error(request, limit_message)
             return redirect("core:invite_user")
 
     else:
@@ -262,6 +239,53 @@ def invite_user(request):
     return render(request, "core/invite_user.html", {"form": form})
 
 
+@login_required
+def bulk_invite_users(request):
+    """Invite many users at once from an uploaded CSV of email/role rows."""
+    if not request.user.is_manager or request.tenant is None:
+        raise PermissionDenied
+
+    tenant.ensure_subscription(request.tenant)
+
+    rows = None
+    if request.method == "POST":
+        form = BulkInviteForm(request.POST, request.FILES)
+        if form.is_valid():
+            try:
+                rows = invites.read_csv(
+                    form.cleaned_data["file"].file,
+                    default_role=form.cleaned_data["default_role"],
+                )
+            except UnicodeDecodeError:
+                form.add_error("file", "The file must be a UTF-8 encoded CSV.")
+            except ValidationError as e:
+                form.add_error("file", e)
+
+        if rows is not None:
+            created = invites.bulk_invite(
+                request.organization,
+                rows,
+                lambda invite: request.build_absolute_uri(
+                    reverse("core:accept_invite", args=[invite.token])
+                ),
+            )
+            skipped = len(rows) - len(created)
+            if created:
+                messages.success(request, f"{len(created)} invitation(s) sent.")
+            if skipped:
+                messages.warning(request, f"{skipped} row(s) skipped, see the report below.")
+            if not rows:
+                messages.warning(request, "The file has no rows.")
+    else:
+        form = BulkInviteForm()
+
+    return render(request, "core/bulk_invite.html", {
+        "form": form,
+        "rows": rows,
+        "capacity": invites.remaining_capacity(request.organization),
+    })
+
+
 
 
 from django.shortcuts import get_object_or_404
@@ -283,9 +307,6 @@ User = get_user_model()
 def accept_invite(request, token):
     invite = get_object_or_404(UserInvite, token=token)
 
-    if invite.is_used or invite.expires_at < timezone.now():
-        return render(request, "core/invite_invalid.html")
-
     if not invite.is_valid():
         return render(request, "core/invite_invalid.html")
 
@@ -329,3 +350,35 @@ def accept_invite(request, token):
 
 
 
+
+
+from django.http import JsonResponse
+from .models import Job
+
+
+@login_required
+def job_status(request, pk):
+    """
+    JSON status of a background job, for the UI to poll. Only jobs of the
+    user's organization (or created by the user) are visible.
+    """
+    job = get_object_or_404(Job, pk=pk)
+    if job.created_by_id != request.user.pk and (
+        job.organization_id is None or job.organization_id != getattr(request.organization, "pk", None)
+    ):
+        raise PermissionDenied
+
+    data = {
+        "id": job.pk,
+        "name": job.name,
+        "status": job.status,
+        "progress": job.progress,
+        "message": job.progress_message,
+        "attempts": job.attempts,
+        "finished": job.is_finished,
+        "created_at": job.created_at,
+        "finished_at": job.finished_at,
+    }
+    if job.status == Job.STATUS_SUCCEEDED:
+        data["result"] = job.result
+    return JsonResponse(data)
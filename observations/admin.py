@@ -17,3 +17,18 @@ class ObservationAdmin(admin.ModelAdmin):
     search_fields = ('title','description')
 
 admin.site.register(Location)
+
+
+from .models import ArchivedObservation
+
+
+@admin.register(ArchivedObservation)
+class ArchivedObservationAdmin(admin.ModelAdmin):
+    def get_queryset(self, request):
+        qs = super().get_queryset(request)
+        if request.user.is_superuser:
+            return qs
+        return qs.filter(organization=request.user.organization)
+    list_display = ('id', 'title', 'location', 'severity', 'status', 'date_closed', 'archived_at')
+    list_filter = ('status', 'severity')
+    search_fields = ('title', 'description')
@@ -0,0 +1,169 @@
+# observations/analytics.py
+"""
+Dashboard analytics for observations.
+
+The dashboard used to fire one query per KPI card and per chart. Everything it
+shows is now derived from a handful of grouped queries:
+
+* an "activity" query over ObservationDailyRollup, grouped by trend period,
+  severity and status (KPI cards, trend, severity and status charts are
+  folded from it in Python), so its cost depends on the number of days with
+  activity rather than the number of observations;
+* an overdue count over active observations (it depends on today's date, so
+  it cannot be pre-aggregated);
+* a "people" query over all of the organization's observations, active and
+  archived (a UNION ALL of both tiers), grouped by observer, action owner
+  and status (the performance charts).
+"""
+from collections import Counter
+from dataclasses import dataclass, field
+from datetime import date
+
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncDay, TruncMonth, TruncWeek
+
+from .models import ArchivedObservation, Observation, ObservationDailyRollup
+
+OPEN_STATUSES = ("OPEN", "IN_PROGRESS")
+CLOSED_STATUS = "CLOSED"
+
+TREND_CHOICES = {
+    "daily": TruncDay,
+    "weekly": TruncWeek,
+    "monthly": TruncMonth,
+}
+DEFAULT_TREND = "monthly"
+
+
+@dataclass
+class Series:
+    """Parallel label/value lists, ready to hand to a chart."""
+    labels: list = field(default_factory=list)
+    values: list = field(default_factory=list)
+
+    @classmethod
+    def from_counter(cls, counter, order=None):
+        """
+        Build a series from a Counter. Ordered by ``order`` (a key function)
+        when given, otherwise by descending count.
+        """
+        if order is None:
+            items = counter.most_common()
+        else:
+            items = sorted(counter.items(), key=lambda item: order(item[0]))
+        return cls(
+            labels=[label for label, _ in items],
+            values=[value for _, value in items],
+        )
+
+
+@dataclass
+class DashboardStats:
+    """Everything the observations dashboard renders."""
+    trend: str
+    total: int = 0
+    open: int = 0
+    closed: int = 0
+    overdue: int = 0
+    trend_series: Series = field(default_factory=Series)
+    severity: Series = field(default_factory=Series)
+    status: Series = field(default_factory=Series)
+    observers: Series = field(default_factory=Series)
+    owners: Series = field(default_factory=Series)
+    managers: Series = field(default_factory=Series)
+
+
+def normalize_trend(trend):
+    return trend if trend in TREND_CHOICES else DEFAULT_TREND
+
+
+def compute_dashboard_stats(organization, trend=DEFAULT_TREND, today=None):
+    """
+    Compute the dashboard KPIs and breakdowns for ``organization``.
+    """
+    trend = normalize_trend(trend)
+    today = today or date.today()
+
+    stats = DashboardStats(trend=trend)
+    _fold_activity(stats, organization, trend, today)
+    _fold_people(stats, organization)
+    return stats
+
+
+def overdue_queryset(organization, today):
+    return Observation.objects.for_organization(organization).overdue(today)
+
+
+def activity_queryset(organization, trend):
+    trunc = TREND_CHOICES[normalize_trend(trend)]
+    return (
+        ObservationDailyRollup.objects
+        .filter(organization=organization)
+        .annotate(period=trunc("day"))
+        .values("period", "severity", "status")
+        .annotate(count=Sum("opened"))
+        .order_by()
+    )
+
+
+def people_queryset(organization):
+    # A person can appear in a row of each tier; _fold_people adds them up.
+    tiers = [
+        model.objects
+        .filter(organization=organization)
+        .values("status", observer_email=F("observer__email"), owner_email=F("assigned_to__email"))
+        .annotate(count=Count("id"))
+        .order_by()
+        for model in (Observation, ArchivedObservation)
+    ]
+    return tiers[0].union(tiers[1], all=True)
+
+
+def _fold_activity(stats, organization, trend, today):
+    stats.overdue = overdue_queryset(organization, today).count()
+    rows = activity_queryset(organization, trend)
+
+    periods = Counter()
+    severities = Counter()
+    statuses = Counter()
+
+    for row in rows:
+        count = row["count"]
+        if not count:
+            continue
+        stats.total += count
+        if row["status"] in OPEN_STATUSES:
+            stats.open += count
+        elif row["status"] == CLOSED_STATUS:
+            stats.closed += count
+
+        periods[row["period"]] += count
+        severities[row["severity"]] += count
+        statuses[row["status"]] += count
+
+    period_series = Series.from_counter(periods, order=lambda period: period)
+    period_series.labels = [p.strftime("%Y-%m-%d") for p in period_series.labels]
+    stats.trend_series = period_series
+    stats.severity = Series.from_counter(severities, order=lambda severity: severity)
+    stats.status = Series.from_counter(statuses, order=lambda status: status)
+
+
+def _fold_people(stats, organization):
+    rows = people_queryset(organization)
+
+    observers = Counter()
+    owners = Counter()
+    managers = Counter()
+
+    for row in rows:
+        count = row["count"]
+        if row["observer_email"] is not None:
+            observers[row["observer_email"]] += count
+        if row["owner_email"] is not None:
+            owners[row["owner_email"]] += count
+        if row["status"] == CLOSED_STATUS:
+            managers[row["owner_email"]] += count
+
+    stats.observers = Series.from_counter(observers)
+    stats.owners = Series.from_counter(owners)
+    stats.managers = Series.from_counter(managers)
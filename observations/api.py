@@ -0,0 +1,438 @@
+# observations/api.py
+"""
+JSON API endpoints for observations and locations (see core/api.py).
+
+Lists are read with ``values()`` over just the columns behind the requested
+``?fields=``, paginated by keyset cursor. Observation responses carry an
+ETag made from the organization's data version (bumped on every
+observation write and when a location or user they show is renamed, see
+observations/cache.py), so a poll with a matching ``If-None-Match`` is
+answered with 304 after one single-row query.
+
+Offline clients use ``sync/``: GET returns what changed since a cursor,
+POST applies a batch of offline creates and edits (see observations/sync.py).
+"""
+from django.db import IntegrityError, transaction
+from django.forms.models import model_to_dict
+from django.http import HttpResponse
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from core import quota
+from core.api import (
+    ApiError,
+    api_view,
+    etag_matches,
+    json_response,
+    make_etag,
+    not_modified,
+    paginate,
+    read_json,
+    select_fields,
+)
+
+from . import bulk, sync
+from .cache import current_data_version
+from .exports import filter_observations
+from .forms import LocationForm, ObservationApiForm
+from .models import Location, Observation
+from .storage import photo_storage
+
+# API field -> values() column
+OBSERVATION_FIELDS = {
+    "id": "id",
+    "title": "title",
+    "description": "description",
+    "severity": "severity",
+    "status": "status",
+    "location": "location_id",
+    "location_name": "location__name",
+    "observer": "observer__email",
+    "assigned_to": "assigned_to_id",
+    "assigned_to_email": "assigned_to__email",
+    "date_observed": "date_observed",
+    "target_date": "target_date",
+    "date_closed": "date_closed",
+    "rectification_details": "rectification_details",
+    "verification_comment": "verification_comment",
+    "photo_before": "photo_before",
+    "photo_after": "photo_after",
+    "updated_at": "updated_at",
+}
+PHOTO_FIELDS = ("photo_before", "photo_after")
+OBSERVATION_ORDERING = ("-date_observed", "-id")
+
+LOCATION_FIELDS = ("id", "name", "area", "facility", "updated_at")
+
+# query parameter -> (lookup, parser)
+DATE_FILTERS = {
+    "observed_after": ("date_observed__gte", "datetime"),
+    "observed_before": ("date_observed__lt", "datetime"),
+    "closed_after": ("date_closed__gte", "datetime"),
+    "closed_before": ("date_closed__lt", "datetime"),
+    "target_after": ("target_date__gte", "date"),
+    "target_before": ("target_date__lt", "date"),
+}
+
+
+def _parse(value, kind):
+    if kind == "date":
+        return parse_date(value)
+    parsed = parse_datetime(value)
+    if parsed is None:
+        day = parse_date(value)
+        if day is None:
+            return None
+        parsed = timezone.datetime(day.year, day.month, day.day)
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+def filter_queryset(queryset, organization, params):
+    """Apply the ``status``, ``severity``, date range and ``q`` filters in ``params``."""
+    status = params.get("status")
+    if status and status not in dict(Observation.STATUS_CHOICES):
+        raise ApiError(400, f"Unknown status {status!r}.")
+    severity = params.get("severity")
+    if severity:
+        if severity not in dict(Observation.SEVERITY_CHOICES):
+            raise ApiError(400, f"Unknown severity {severity!r}.")
+        queryset = queryset.filter(severity=severity)
+    if params.get("assigned_to"):
+        try:
+            assigned_to = int(params["assigned_to"])
+        except ValueError:
+            raise ApiError(400, "assigned_to must be a user id.")
+        queryset = queryset.filter(assigned_to_id=assigned_to)
+    for name, (lookup, kind) in DATE_FILTERS.items():
+        if params.get(name):
+            value = _parse(params[name], kind)
+            if value is None:
+                raise ApiError(400, f"{name} must be an ISO 8601 {kind}.")
+            queryset = queryset.filter(**{lookup: value})
+    # Search and status work the same as on the list page.
+    return filter_observations(queryset, organization, params)
+
+
+def observation_serializer(fields):
+    def serialize(row):
+        data = {}
+        for name in fields:
+            value = row[OBSERVATION_FIELDS[name]]
+            if name in PHOTO_FIELDS:
+                value = photo_storage().url(value) if value else None
+            data[name] = value
+        return data
+    return serialize
+
+
+def observation_rows(queryset, fields):
+    # The ordering columns are always selected: the paginator's cursor holds them.
+    columns = {name.lstrip("-") for name in OBSERVATION_ORDERING}
+    return queryset.values(*columns, *{OBSERVATION_FIELDS[name] for name in fields} - columns)
+
+
+def _observations(request):
+    return Observation.objects.for_organization(request.organization)
+
+
+def _observation_etag(request):
+    return make_etag(
+        "observations", request.organization.pk,
+        current_data_version(request.organization.pk), request.get_full_path(),
+    )
+
+
+def _form_errors(form):
+    return {field: list(errors) for field, errors in form.errors.items()}
+
+
+def _serialize_one(observation_id, fields=None):
+    fields = fields or list(OBSERVATION_FIELDS)
+    row = observation_rows(Observation.objects.filter(pk=observation_id), fields).get()
+    return observation_serializer(fields)(row)
+
+
+@api_view("GET", "POST")
+def observation_list(request):
+    if request.method == "POST":
+        return _create_observation(request)
+
+    fields = select_fields(request, OBSERVATION_FIELDS)
+    etag = _observation_etag(request)
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    queryset = filter_queryset(_observations(request), request.organization, request.GET)
+    data = paginate(
+        request,
+        observation_rows(queryset, fields),
+        observation_serializer(fields),
+        ordering=OBSERVATION_ORDERING,
+    )
+    return json_response(request, data, etag=etag)
+
+
+def _new_observation(request, data):
+    """An unsaved observation built from ``data``; ApiError(400) if invalid."""
+    form = ObservationApiForm(data, organization=request.organization)
+    if not form.is_valid():
+        raise ApiError(400, "Invalid observation.", errors=_form_errors(form))
+    observation = form.save(commit=False)
+    observation.organization = request.organization
+    observation.observer = request.user
+    observation.status = "OPEN"
+    setattr(observation, quota.RESERVED_ATTR, True)
+    return observation
+
+
+def _reserve(request, amount=1):
+    try:
+        quota.reserve(request.organization, quota.OBSERVATIONS, amount)
+    except quota.QuotaExceeded as e:
+        raise ApiError(403, f"Observation limit reached for your current plan. {e}")
+
+
+def _create_observation(request):
+    observation = _new_observation(request, read_json(request))
+    with transaction.atomic():
+        _reserve(request)
+        observation.save()
+    response = json_response(request, _serialize_one(observation.pk), status=201)
+    response["Location"] = reverse("api_v1:observation_detail", args=[observation.pk])
+    return response
+
+
+def _can_edit(user, observation):
+    return (
+        user.is_superuser or user.is_manager or user.is_safety_manager
+        or observation.assigned_to_id == user.pk
+    )
+
+
+def _update_observation(request, observation, changes):
+    """Apply the field values in ``changes`` to ``observation``; ApiError if not allowed or invalid."""
+    if not _can_edit(request.user, observation):
+        raise ApiError(403, "You can't change this observation.")
+    writable = ObservationApiForm._meta.fields
+    unknown = sorted(set(changes) - set(writable))
+    if unknown:
+        raise ApiError(400, f"Fields not writable: {', '.join(unknown)}.", errors={"writable": writable})
+
+    status = changes.get("status", observation.status)
+    if status != observation.status:
+        if status == "CLOSED" and not bulk.can_perform(request.user, bulk.CLOSE):
+            raise ApiError(403, "Only safety managers can close observations.")
+        observation.date_closed = timezone.now() if status == "CLOSED" else None
+
+    data = model_to_dict(observation, fields=writable)
+    data.update(changes)
+    form = ObservationApiForm(data, instance=observation, organization=request.organization)
+    if not form.is_valid():
+        raise ApiError(400, "Invalid observation.", errors=_form_errors(form))
+    return form.save()
+
+
+@api_view("GET", "PATCH", "DELETE")
+def observation_detail(request, pk):
+    observation = _observations(request).filter(pk=pk).first()
+    if observation is None:
+        raise ApiError(404, "Observation not found.")
+
+    if request.method == "GET":
+        fields = select_fields(request, OBSERVATION_FIELDS)
+        etag = _observation_etag(request)
+        if etag_matches(request, etag):
+            return not_modified(etag)
+        return json_response(request, _serialize_one(pk, fields), etag=etag)
+
+    if request.method == "DELETE":
+        if not request.user.is_superuser:
+            raise ApiError(403, "Only administrators can delete observations.")
+        observation.delete()
+        return HttpResponse(status=204)
+
+    _update_observation(request, observation, read_json(request))
+    return json_response(request, _serialize_one(pk))
+
+
+@api_view("GET", "POST")
+def location_list(request):
+    if request.method == "POST":
+        form = LocationForm(read_json(request))
+        if not form.is_valid():
+            raise ApiError(400, "Invalid location.", errors=_form_errors(form))
+        location = form.save()
+        return json_response(
+            request, Location.objects.values(*LOCATION_FIELDS).get(pk=location.pk), status=201
+        )
+
+    fields = select_fields(request, LOCATION_FIELDS)
+    data = paginate(
+        request,
+        Location.objects.values(*{"id", *fields}),
+        lambda row: {name: row[name] for name in fields},
+        ordering=("id",),
+    )
+    return json_response(request, data)
+
+
+def _sync_limit(request):
+    try:
+        limit = int(request.GET.get("limit", sync.SYNC_PAGE_SIZE))
+    except ValueError:
+        raise ApiError(400, "limit must be an integer.")
+    return max(1, min(limit, sync.SYNC_PAGE_SIZE))
+
+
+@api_view("GET", "POST")
+def observation_sync(request):
+    if request.method == "POST":
+        return _sync_upload(request)
+
+    fields = select_fields(request, OBSERVATION_FIELDS)
+    try:
+        page = sync.changes(
+            request.organization,
+            request.GET.get("cursor"),
+            limit=_sync_limit(request),
+            observation_fields=[OBSERVATION_FIELDS[name] for name in {"id", *fields}],
+            location_fields=LOCATION_FIELDS,
+        )
+    except ValueError as e:
+        raise ApiError(400, str(e))
+    except sync.CursorExpired:
+        raise ApiError(410, "The cursor has expired; sync again without one.")
+    serialize = observation_serializer(fields)
+    return json_response(request, {
+        "observations": [serialize(row) for row in page.observations],
+        "locations": [{name: row[name] for name in LOCATION_FIELDS} for row in page.locations],
+        "deleted": {
+            "observations": page.deleted_observations,
+            "locations": page.deleted_locations,
+        },
+        "cursor": page.cursor,
+        "more": page.more,
+    })
+
+
+def _check_item(item):
+    if not isinstance(item, dict):
+        raise ApiError(400, "Each item must be a JSON object.")
+    key = item.get("key")
+    if not isinstance(key, str) or not 0 < len(key) <= 64:
+        raise ApiError(400, "Each item needs a key of 1 to 64 characters.")
+    if isinstance(item.get("observation"), dict):
+        return
+    if isinstance(item.get("id"), int) and isinstance(item.get("changes"), dict):
+        if not isinstance(item.get("base_updated_at"), str) or parse_datetime(item["base_updated_at"]) is None:
+            raise ApiError(400, "An edit needs the base_updated_at it was made on.")
+        return
+    raise ApiError(400, "An item needs an observation to create, or an id and changes.")
+
+
+def _millis(value):
+    # Responses carry timestamps rounded to milliseconds (DjangoJSONEncoder).
+    return value.replace(microsecond=value.microsecond // 1000 * 1000)
+
+
+def _replay(request, item, known):
+    """The result entry of an item whose key was already applied (``known``)."""
+    key = item["key"]
+    if known.fingerprint != sync.fingerprint(item):
+        return {"key": key, "status": "conflict", "reason": "key_reused", "id": known.observation_id}
+    current = _observations(request).filter(pk=known.observation_id).exists()
+    return {
+        "key": key,
+        "status": "duplicate",
+        "id": known.observation_id,
+        "observation": _serialize_one(known.observation_id) if current else None,
+    }
+
+
+def _apply_item(request, item, seen):
+    """Apply one upload item; returns its result entry."""
+    key = item["key"]
+    known = seen.get(key)
+    if known is not None:
+        return _replay(request, item, known)
+    try:
+        with transaction.atomic():
+            return _apply_new_item(request, item, seen)
+    except IntegrityError:
+        # A concurrent upload of the same key committed first; the savepoint
+        # undid our copy, so answer as a retry of theirs.
+        known = sync.seen_keys(request.organization, [key]).get(key)
+        if known is None:
+            raise
+        if "observation" in item:
+            # Give back what _sync_upload reserved for the create.
+            quota.add(request.organization, quota.OBSERVATIONS, -1)
+        seen[key] = known
+        return _replay(request, item, known)
+
+
+def _apply_new_item(request, item, seen):
+    key = item["key"]
+    if "observation" in item:
+        observation = _new_observation(request, item["observation"])
+        observation.save()
+        status = "created"
+    else:
+        observation = _observations(request).select_for_update().filter(pk=item["id"]).first()
+        if observation is None:
+            return {"key": key, "status": "conflict", "reason": "deleted", "id": item["id"]}
+        base = parse_datetime(item["base_updated_at"])
+        if timezone.is_naive(base):
+            base = timezone.make_aware(base)
+        if _millis(observation.updated_at) > base:
+            return {
+                "key": key,
+                "status": "conflict",
+                "reason": "modified",
+                "id": observation.pk,
+                "observation": _serialize_one(observation.pk),
+            }
+        _update_observation(request, observation, item["changes"])
+        status = "updated"
+
+    seen[key] = sync.remember(request.organization, key, item, observation.pk)
+    return {"key": key, "status": status, "id": observation.pk, "observation": _serialize_one(observation.pk)}
+
+
+def _sync_upload(request):
+    """
+    Apply ``{"items": [...]}`` in one transaction. An item is either
+    ``{"key", "observation": {...}}`` (create) or ``{"key", "id", "changes":
+    {...}, "base_updated_at"}`` (edit). Every item gets a result: created,
+    updated, duplicate (key already applied), or conflict (edited or deleted
+    on the server since, or key reused for different data; nothing applied).
+    If any item is invalid the whole batch is rolled back with a 400.
+    """
+    items = read_json(request).get("items")
+    if not isinstance(items, list) or not items:
+        raise ApiError(400, "items must be a non-empty list.")
+    if len(items) > sync.SYNC_BATCH_MAX:
+        raise ApiError(400, f"At most {sync.SYNC_BATCH_MAX} items per upload.")
+    for item in items:
+        _check_item(item)
+
+    seen = sync.seen_keys(request.organization, {item["key"] for item in items})
+    creates = len({item["key"] for item in items if "observation" in item} - set(seen))
+    results = []
+    rejected = False
+    with transaction.atomic():
+        if creates:
+            _reserve(request, creates)
+        for item in items:
+            try:
+                results.append(_apply_item(request, item, seen))
+            except ApiError as e:
+                rejected = True
+                results.append({"key": item["key"], "status": "rejected", "error": e.message, "errors": e.errors})
+        if rejected:
+            transaction.set_rollback(True)
+    if rejected:
+        return json_response(request, {"error": "Nothing was applied.", "results": results}, status=400)
+    return json_response(request, {"results": results})
@@ -0,0 +1,154 @@
+# observations/bulk.py
+"""
+Bulk actions on the observation list.
+
+Each action changes every selected observation it applies to with one
+``QuerySet.update()`` scoped to the organization (archive moves the rows to
+the archive tier instead, see observations/tiers.py):
+
+* assign   - give unassigned, open observations an action owner
+* reassign - hand assigned, open observations to another action owner
+* close    - approve observations awaiting verification (as verify does)
+* archive  - move closed observations to the archive
+
+Observations an action does not apply to (wrong status, already archived,
+not in the organization) are skipped and counted, never changed. Because
+``update()`` skips the model signals, the rollups and the dashboard data
+version are updated here (see observations.rollups); the search index holds
+none of the fields an action changes.
+"""
+from dataclasses import dataclass
+
+from django.core.exceptions import PermissionDenied, ValidationError
+from django.db import transaction
+from django.utils import timezone
+
+from . import rollups, tiers
+from .cache import bump_data_version
+from .models import Observation
+
+ASSIGN = "assign"
+REASSIGN = "reassign"
+CLOSE = "close"
+ARCHIVE = "archive"
+
+ACTION_CHOICES = [
+    (ASSIGN, "Assign to"),
+    (REASSIGN, "Reassign to"),
+    (CLOSE, "Verify and close"),
+    (ARCHIVE, "Archive"),
+]
+
+# Actions that take an action owner.
+NEEDS_ASSIGNEE = {ASSIGN, REASSIGN}
+
+# Most observations one request may act on.
+BULK_ACTION_MAX = 5000
+
+OPEN_STATUSES = ("OPEN", "IN_PROGRESS", "AWAITING_VERIFICATION")
+
+NOT_ALLOWED = "you are not allowed to do that"
+
+SKIP_REASONS = {
+    ASSIGN: "already assigned, closed or archived",
+    REASSIGN: "unassigned, already with that owner, closed or archived",
+    CLOSE: "not awaiting verification",
+    ARCHIVE: "not closed or already archived",
+}
+
+
+@dataclass
+class BulkResult:
+    action: str
+    requested: int
+    updated: int
+    # The user may not perform the action at all (perform raised PermissionDenied).
+    refused: bool = False
+
+    @property
+    def skipped(self):
+        return self.requested - self.updated
+
+    @property
+    def verb(self):
+        return {
+            ASSIGN: "Assigned",
+            REASSIGN: "Reassigned",
+            CLOSE: "Closed",
+            ARCHIVE: "Archived",
+        }[self.action]
+
+    def summary(self):
+        message = f"{self.verb} {self.updated} of {self.requested} observation(s)."
+        if self.skipped:
+            reason = NOT_ALLOWED if self.refused else SKIP_REASONS[self.action]
+            message += f" {self.skipped} skipped: {reason}."
+        return message
+
+
+def can_perform(user, action):
+    if user.is_superuser:
+        return True
+    if action == CLOSE:
+        # Closing is verification, which is the safety manager's call.
+        return user.is_safety_manager
+    return user.is_manager
+
+
+def eligible(queryset, action, assignee=None):
+    """The part of ``queryset`` that ``action`` applies to."""
+    if action == ASSIGN:
+        return queryset.filter(assigned_to__isnull=True, status__in=OPEN_STATUSES)
+    if action == REASSIGN:
+        return (
+            queryset
+            .filter(assigned_to__isnull=False, status__in=OPEN_STATUSES)
+            .exclude(assigned_to=assignee)
+        )
+    if action == CLOSE:
+        return queryset.filter(status="AWAITING_VERIFICATION")
+    if action == ARCHIVE:
+        return queryset.filter(status="CLOSED")
+    raise ValueError(f"Unknown bulk action {action!r}")
+
+
+def changes(action, assignee=None):
+    # update() leaves auto_now alone; offline sync goes by updated_at.
+    now = timezone.now()
+    if action in NEEDS_ASSIGNEE:
+        return {"assigned_to": assignee, "updated_at": now}
+    return {"status": "CLOSED", "date_closed": now, "updated_at": now}
+
+
+def perform(organization, user, action, queryset, assignee=None):
+    """
+    Apply ``action`` to the observations of ``queryset`` that belong to
+    ``organization`` and are eligible for it; ``assignee`` is the action
+    owner of assign/reassign. Returns a BulkResult.
+    """
+    if not can_perform(user, action):
+        raise PermissionDenied(NOT_ALLOWED)
+    if action in NEEDS_ASSIGNEE and assignee is None:
+        raise ValidationError("Choose an action owner.")
+
+    scope = queryset.filter(organization=organization).order_by()
+    requested = scope.count()
+    if requested > BULK_ACTION_MAX:
+        raise ValidationError(
+            f"At most {BULK_ACTION_MAX} observations can be changed at once; narrow the filter."
+        )
+
+    with transaction.atomic():
+        # Lock the rows so the rollup snapshots match what the update changes.
+        ids = list(eligible(scope, action, assignee).select_for_update().values_list("pk", flat=True))
+        if not ids:
+            return BulkResult(action, requested, 0)
+        targets = Observation.objects.filter(pk__in=ids)
+        if action == ARCHIVE:
+            return BulkResult(action, requested, tiers.archive(targets))
+        before = rollups.snapshot(targets)
+        updated = targets.update(**changes(action, assignee))
+        rollups.record_change(before, rollups.snapshot(targets))
+        bump_data_version(organization.pk)
+    return BulkResult(action, requested, updated)
+
@@ -0,0 +1,68 @@
+# observations/cache.py
+"""
+Versioned per-organization cache for dashboard data.
+
+Every observation write bumps ``Organization.data_version``, and so does
+renaming a location or user the organization's observations show. Cache keys embed
+the version, so a write makes the previous entries unreachable instead of
+having to delete them, and stale data is never served. Old entries simply
+expire.
+"""
+from datetime import date
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models import F
+
+from core.models import Organization
+
+from .analytics import compute_dashboard_stats, normalize_trend
+from .charts import dashboard_payload
+
+DASHBOARD_CACHE_ALIAS = getattr(settings, "DASHBOARD_CACHE_ALIAS", "dashboard")
+
+
+def bump_data_version(organization_id):
+    """Invalidate every cached entry of the organization."""
+    Organization.objects.filter(pk=organization_id).update(
+        data_version=F("data_version") + 1
+    )
+
+
+def bump_data_versions(organization_ids):
+    """bump_data_version for several organizations (ids or a values_list queryset)."""
+    Organization.objects.filter(pk__in=organization_ids).update(
+        data_version=F("data_version") + 1
+    )
+
+
+def current_data_version(organization_id):
+    # Always read from the database: request.organization may be stale.
+    version = (
+        Organization.objects
+        .filter(pk=organization_id)
+        .values_list("data_version", flat=True)
+        .first()
+    )
+    return version or 0
+
+
+def dashboard_cache_key(organization_id, version, trend, today):
+    # ``today`` is part of the key because the overdue KPI depends on it.
+    return f"dashboard:{organization_id}:v{version}:{trend}:{today.isoformat()}"
+
+
+def get_dashboard_payload(organization, trend):
+    """
+    Return the dashboard chart payload, computing and caching it on a miss.
+    """
+    trend = normalize_trend(trend)
+    today = date.today()
+    cache = caches[DASHBOARD_CACHE_ALIAS]
+    key = dashboard_cache_key(organization.pk, current_data_version(organization.pk), trend, today)
+
+    payload = cache.get(key)
+    if payload is None:
+        payload = dashboard_payload(compute_dashboard_stats(organization, trend, today))
+        cache.set(key, payload)
+    return payload
@@ -0,0 +1,91 @@
+# observations/charts.py
+"""
+Plotly chart specs for the observations dashboard.
+
+The dashboard used to build figures with plotly.express and inline each one
+with ``to_html``, which embedded the whole plotly.js library several times in
+every response. The charts are now plain ``{"data": [...], "layout": {...}}``
+dicts serialized to JSON and drawn in the browser by one static plotly bundle
+(see ``PLOTLY_STATIC_PATH``).
+"""
+
+PLOTLY_STATIC_PATH = "vendor/plotly/plotly.min.js"
+
+# plotly.express uses this scale for continuous ``color=`` values.
+CONTINUOUS_COLORSCALE = "Plasma"
+
+
+def _layout(title, x_title=None, y_title=None):
+    layout = {"title": {"text": title}}
+    if x_title:
+        layout["xaxis"] = {"title": {"text": x_title}}
+    if y_title:
+        layout["yaxis"] = {"title": {"text": y_title}}
+    return layout
+
+
+def line_chart(series, title, x_title, y_title):
+    return {
+        "data": [{
+            "type": "scatter",
+            "mode": "lines+markers",
+            "x": series.labels,
+            "y": series.values,
+        }],
+        "layout": _layout(title, x_title, y_title),
+    }
+
+
+def bar_chart(series, title, x_title, y_title, color_by_value=False):
+    trace = {"type": "bar", "x": series.labels, "y": series.values}
+    if color_by_value:
+        trace["marker"] = {
+            "color": series.values,
+            "colorscale": CONTINUOUS_COLORSCALE,
+            "showscale": bool(series.values),
+        }
+    return {"data": [trace], "layout": _layout(title, x_title, y_title)}
+
+
+def pie_chart(series, title):
+    return {
+        "data": [{"type": "pie", "labels": series.labels, "values": series.values}],
+        "layout": _layout(title),
+    }
+
+
+def dashboard_payload(stats):
+    """
+    Serialize a DashboardStats into the JSON payload returned by the
+    dashboard chart-data endpoint.
+    """
+    return {
+        "trend": stats.trend,
+        "kpis": {
+            "total": stats.total,
+            "open": stats.open,
+            "closed": stats.closed,
+            "overdue": stats.overdue,
+        },
+        "charts": {
+            "trend": line_chart(
+                stats.trend_series,
+                f"{stats.trend.capitalize()} Observation Trend",
+                "Date", "Observations",
+            ),
+            "severity": bar_chart(stats.severity, "Observations by Severity", "Severity", "Count"),
+            "status": pie_chart(stats.status, "Observations by Status"),
+            "observers": bar_chart(
+                stats.observers, "Observers – Observations Reported",
+                "Observer", "Observations", color_by_value=True,
+            ),
+            "owners": bar_chart(
+                stats.owners, "Action Owners – Tasks Assigned",
+                "Action Owner", "Assigned Tasks", color_by_value=True,
+            ),
+            "managers": bar_chart(
+                stats.managers, "Safety Managers – Observations Closed",
+                "Manager", "Closed Observations", color_by_value=True,
+            ),
+        },
+    }
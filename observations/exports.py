@@ -0,0 +1,230 @@
+# observations/exports.py
+"""
+CSV/Excel export of observations.
+
+Rows are read with ``values_list(...).iterator()``: one joined query, fetched
+in chunks, with no model instances kept around, so memory stays flat however
+many rows are exported. Excel files are written with openpyxl's write-only
+mode, which streams rows to disk instead of keeping every cell in memory.
+
+Excel exports above ``EXPORT_BACKGROUND_THRESHOLD`` rows are not built in the
+request: an ObservationExport is recorded and generated by a background
+job (``manage.py run_worker``), and the user downloads the file once it is
+ready.
+"""
+import csv
+import os
+import uuid
+from pathlib import Path
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+
+from core import jobs
+from core.utils.lazy import lazy_import
+
+from . import search
+from .models import Observation, ObservationExport
+
+openpyxl = lazy_import("openpyxl")
+
+XLSX_CONTENT_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+EXPORT_BACKGROUND_THRESHOLD = getattr(settings, "EXPORT_BACKGROUND_THRESHOLD", 5000)
+
+LIST_FILTERS = ("q", "status")
+
+EXPORT_HEADERS = [
+    "ID",
+    "Title",
+    "Description",
+    "Location",
+    "Status",
+    "Observer",
+    "Created At",
+]
+
+EXPORT_FIELDS = (
+    "id",
+    "title",
+    "description",
+    "location__name",
+    "location__area",
+    "status",
+    "observer__email",
+    "date_observed",
+)
+
+EXPORT_CHUNK_SIZE = 2000
+
+# Rows are streamed in blocks of roughly this many bytes.
+STREAM_BLOCK_SIZE = 64 * 1024
+
+
+def export_queryset(organization):
+    """Observations included in the CSV/Excel downloads."""
+    return (
+        Observation.objects
+        .for_organization(organization)
+        .order_by("-date_observed", "-id")
+    )
+
+
+def list_filters(params):
+    """The observation list filters present in ``params`` (e.g. request.GET), as a dict."""
+    return {key: params[key] for key in LIST_FILTERS if params.get(key)}
+
+
+def filter_observations(queryset, organization, params):
+    """
+    Apply the observation list filters (``q`` search, ``status``) in
+    ``params`` to ``queryset``. Shared by the list page and the exports; the
+    search is matched in SQL with no result cap, so an export gets every
+    matching row.
+    """
+    q = params.get("q", "").strip()
+    if q:
+        queryset = search.get_backend().filter(queryset, organization, q)
+    status = params.get("status", "")
+    if status in dict(Observation.STATUS_CHOICES):
+        queryset = queryset.filter(status=status)
+    return queryset
+
+
+def export_rows(queryset, chunk_size=EXPORT_CHUNK_SIZE):
+    """Yield one list of cell values per observation, in EXPORT_HEADERS order."""
+    rows = queryset.values_list(*EXPORT_FIELDS).iterator(chunk_size=chunk_size)
+    for pk, title, description, location, area, status, observer, observed in rows:
+        yield [
+            pk,
+            title,
+            description,
+            f"{location} ({area})" if area else location,
+            status,
+            observer or "",
+            timezone.localtime(observed).strftime("%Y-%m-%d %H:%M"),
+        ]
+
+
+class Echo:
+    """File-like object whose write() hands the line back to csv.writer's caller."""
+
+    def write(self, value):
+        return value
+
+
+def stream_csv(rows):
+    """
+    Yield the CSV text of ``rows``: the header line right away (so the client
+    gets its first byte before the query runs), then ~64 KB blocks.
+    """
+    writer = csv.writer(Echo())
+    yield writer.writerow(EXPORT_HEADERS)
+    block, size = [], 0
+    for row in rows:
+        line = writer.writerow(row)
+        block.append(line)
+        size += len(line)
+        if size >= STREAM_BLOCK_SIZE:
+            yield "".join(block)
+            block, size = [], 0
+    if block:
+        yield "".join(block)
+
+
+def write_xlsx(rows, fileobj):
+    """Write ``rows`` (with a header row) to ``fileobj`` as a write-only workbook."""
+    wb = openpyxl.Workbook(write_only=True)
+    ws = wb.create_sheet("Observations")
+    ws.append(EXPORT_HEADERS)
+    for row in rows:
+        ws.append(row)
+    wb.save(fileobj)
+
+
+def needs_background(queryset, threshold=None):
+    """True when ``queryset`` has more rows than the background threshold."""
+    threshold = EXPORT_BACKGROUND_THRESHOLD if threshold is None else threshold
+    return queryset.order_by()[:threshold + 1].count() > threshold
+
+
+# ---------------------------------------------------------------------------
+# Background generation (job type "observations.export_xlsx", see tasks.py)
+# ---------------------------------------------------------------------------
+
+PROGRESS_EVERY = 5000  # rows
+
+
+def submit_export(export):
+    """Queue ``export`` for generation by a background worker."""
+    export.job = jobs.enqueue(
+        "observations.export_xlsx",
+        {"export_id": export.pk},
+        organization=export.organization,
+        created_by=export.requested_by,
+    )
+    export.save(update_fields=["job"])
+
+
+def export_path(export):
+    return Path(settings.EXPORT_ROOT) / export.file_path
+
+
+def run_export(export_id, progress=None, job_id=None):
+    """
+    Generate the file of a pending export. Does nothing if the export is not
+    pending, unless it is RUNNING for ``job_id``: the job is being retried
+    after its worker died. On error the export is put back to pending and
+    the error raised so that the job can be retried.
+    """
+    claimable = Q(status="PENDING")
+    if job_id is not None:
+        claimable |= Q(status="RUNNING", job_id=job_id)
+    claimed = ObservationExport.objects.filter(claimable, pk=export_id).update(status="RUNNING")
+    if not claimed:
+        return 0
+
+    try:
+        export = ObservationExport.objects.select_related("organization").get(pk=export_id)
+        queryset = filter_observations(
+            export_queryset(export.organization), export.organization, export.filters
+        )
+        total = queryset.order_by().count() if progress else 0
+
+        relative = Path(str(export.organization_id)) / f"{uuid.uuid4().hex}.{export.format}"
+        target = Path(settings.EXPORT_ROOT) / relative
+        target.parent.mkdir(parents=True, exist_ok=True)
+        partial = target.with_suffix(".part")
+
+        row_count = 0
+
+        def counted(rows):
+            nonlocal row_count
+            for row in rows:
+                row_count += 1
+                if progress and row_count % PROGRESS_EVERY == 0:
+                    progress(row_count * 100 // max(total, 1), f"{row_count} of {total} rows")
+                yield row
+
+        with open(partial, "wb") as fileobj:
+            write_xlsx(counted(export_rows(queryset)), fileobj)
+        os.replace(partial, target)
+    except Exception as exc:
+        ObservationExport.objects.filter(pk=export_id).update(status="PENDING", error=str(exc))
+        raise
+
+    ObservationExport.objects.filter(pk=export_id).update(
+        status="DONE",
+        file_path=str(relative),
+        row_count=row_count,
+        error="",
+        finished_at=timezone.now(),
+    )
+    return row_count
+
+
+def fail_export(export_id, error):
+    ObservationExport.objects.filter(pk=export_id).update(
+        status="FAILED", error=error, finished_at=timezone.now()
+    )
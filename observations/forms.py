@@ -1,8 +1,59 @@
 # observations/forms.py
 from django import forms
-from .models import Observation, Location
+from users.models import CustomUser
+from . import bulk, imports, uploads
+from .models import Observation, Location, PhotoUpload
 
-class ObservationCreateForm(forms.ModelForm):
+
+class ChunkedPhotoMixin:
+    """
+    Lets the photo fields be filled from a complete PhotoUpload (sent in
+    chunks, see observations/uploads.py) instead of the multipart file: the
+    form gets a hidden ``<field>_upload`` id field per photo field. A file
+    posted the usual way still wins.
+
+    Pass ``uploader=request.user`` and call ``release_uploads()`` once the
+    observation is saved, and ``close_uploads()`` in any case (see
+    ChunkedPhotoViewMixin in observations/views.py).
+    """
+    photo_fields = ('photo_before', 'photo_after')
+
+    def __init__(self, *args, uploader=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.uploader = uploader
+        self.used_uploads = []
+        for name in self.photo_fields:
+            if name in self.fields:
+                self.fields[f'{name}_upload'] = forms.UUIDField(required=False, widget=forms.HiddenInput)
+
+    def clean(self):
+        cleaned = super().clean()
+        for name in self.photo_fields:
+            upload_id = cleaned.get(f'{name}_upload')
+            if not upload_id or self.files.get(name):
+                continue
+            upload = PhotoUpload.objects.filter(
+                pk=upload_id, uploaded_by=self.uploader, status='COMPLETE'
+            ).first()
+            if upload is None:
+                self.add_error(name, "The photo upload is missing or incomplete. Please upload it again.")
+                continue
+            cleaned[name] = uploads.open_upload(upload)
+            self.used_uploads.append((upload, cleaned[name]))
+        return cleaned
+
+    def close_uploads(self):
+        """Close the files opened by clean(); the uploads can be used again."""
+        for _, fileobj in self.used_uploads:
+            fileobj.close()
+
+    def release_uploads(self):
+        self.close_uploads()
+        for upload, _ in self.used_uploads:
+            uploads.release(upload)
+
+
+class ObservationCreateForm(ChunkedPhotoMixin, forms.ModelForm):
     target_date = forms.DateField(
             widget=forms.DateInput(attrs={'type': 'date', 'class': 'form-control'}) )
     class Meta:
@@ -16,7 +67,7 @@ class ObservationCreateForm(forms.ModelForm):
         # widgets = {
         #     'target_date': forms.DateInput(attrs={'type': 'date', 'class': 'form-control'})},
 
-class RectificationForm(forms.ModelForm):
+class RectificationForm(ChunkedPhotoMixin, forms.ModelForm):
     class Meta:
         model = Observation
         fields = ['description','photo_before','rectification_details','photo_after','target_date', 'location']
@@ -48,3 +99,80 @@ class LocationForm(forms.ModelForm):
     class Meta:
         model = Location
         fields = ['name','area', 'facility']
+
+
+class BulkActionForm(forms.Form):
+    """
+    A bulk action on the observation list: the ticked ``ids``, or with
+    ``select_all`` every observation matching the list filters posted along.
+    """
+    action = forms.ChoiceField(choices=bulk.ACTION_CHOICES)
+    assigned_to = forms.ModelChoiceField(
+        queryset=CustomUser.objects.none(), required=False, label="Action owner"
+    )
+    ids = forms.Field(required=False, widget=forms.MultipleHiddenInput)
+    select_all = forms.BooleanField(required=False)
+
+    def __init__(self, *args, organization=None, user=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if user is not None:
+            self.fields['action'].choices = [
+                (action, label) for action, label in bulk.ACTION_CHOICES if bulk.can_perform(user, action)
+            ]
+        self.fields['assigned_to'].queryset = (
+            CustomUser.objects.filter(organization=organization, is_active=True).order_by('email')
+        )
+
+    def clean_ids(self):
+        try:
+            return [int(pk) for pk in self.cleaned_data.get('ids') or []]
+        except (TypeError, ValueError):
+            raise forms.ValidationError("Invalid selection.")
+
+    def clean(self):
+        cleaned = super().clean()
+        needs_assignee = cleaned.get('action') in bulk.NEEDS_ASSIGNEE
+        if needs_assignee and not cleaned.get('assigned_to') and 'assigned_to' not in self.errors:
+            self.add_error('assigned_to', "Choose an action owner.")
+        if not cleaned.get('select_all') and not cleaned.get('ids'):
+            raise forms.ValidationError("Select at least one observation.")
+        return cleaned
+
+
+class ObservationApiForm(forms.ModelForm):
+    """Observation fields writable through the JSON API (core/api.py)."""
+    class Meta:
+        model = Observation
+        fields = ['title', 'location', 'description', 'severity', 'assigned_to', 'target_date',
+                  'status', 'rectification_details', 'verification_comment']
+
+    def __init__(self, *args, organization=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fields['assigned_to'].queryset = CustomUser.objects.filter(
+            organization=organization, is_active=True
+        )
+        self.fields['severity'].required = False
+        self.fields['status'].required = False
+
+    def clean_severity(self):
+        return self.cleaned_data.get('severity') or self.instance.severity or 'LOW'
+
+    def clean_status(self):
+        return self.cleaned_data.get('status') or self.instance.status or 'OPEN'
+
+
+class ObservationImportForm(forms.Form):
+    file = forms.FileField(
+        help_text="CSV or Excel file with a header row. Required columns: "
+                  "title, location, date observed.",
+    )
+
+    def clean_file(self):
+        upload = self.cleaned_data['file']
+        if not upload.name.lower().endswith(imports.IMPORT_EXTENSIONS):
+            raise forms.ValidationError("Upload a .csv or .xlsx file.")
+        if upload.size > imports.IMPORT_MAX_BYTES:
+            raise forms.ValidationError(
+                f"The file is larger than {imports.IMPORT_MAX_BYTES // (1024 * 1024)} MB; split it up."
+            )
+        return upload
@@ -0,0 +1,194 @@
+# observations/images.py
+"""
+Resized derivatives of observation photos.
+
+Phones upload 4-8 MB photos; the pages only ever show them at thumbnail or
+modal size. For every photo a JPEG and a WebP rendition is written per
+VARIANTS width, rotated upright from the EXIF orientation tag and saved
+without any EXIF (so no GPS position or device details leak).
+
+The paths are kept in ``Observation.photo_variants``:
+
+    {"photo_before": {
+        "source": "observations/before/pump.jpg",
+        "thumb":  {"width": 320, "height": 240, "jpeg": "...", "webp": "..."},
+        "medium": {...}},
+     "photo_after": {...}}
+
+``source`` is the photo the variants were made from, so a replaced photo is
+detected and reprocessed. Photos processed before a variant was added lack
+it; ``largest`` (the "full size" link, instead of the upload and its EXIF)
+falls back to the biggest one there is.
+
+Processing runs as the ``observations.photo_variants`` job when
+PHOTO_VARIANTS_ASYNC is on (the default), otherwise inline; until it has
+run, templates fall back to the original (see templatetags/photos.py).
+Existing photos are processed with ``manage.py generate_photo_variants``.
+"""
+import io
+import logging
+from pathlib import PurePosixPath
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+
+from core import jobs
+from core.utils.lazy import lazy_import
+
+from .models import Observation
+
+Image = lazy_import("PIL.Image")
+ImageOps = lazy_import("PIL.ImageOps")
+features = lazy_import("PIL.features")
+
+logger = logging.getLogger(__name__)
+
+PHOTO_FIELDS = ("photo_before", "photo_after")
+
+# name -> longest side in pixels
+VARIANTS = {
+    "thumb": 320,
+    "medium": 1280,
+    # Linked as the full-size photo instead of the upload, which has EXIF.
+    "large": 2560,
+}
+
+JPEG_QUALITY = 80
+WEBP_QUALITY = 75
+
+VARIANT_ROOT = "observations/variants"
+
+
+def is_current(observation, field):
+    """True when the stored variants of ``field`` were made from its current photo."""
+    photo = getattr(observation, field)
+    entry = (observation.photo_variants or {}).get(field)
+    if not photo:
+        return not entry
+    return bool(entry) and entry.get("source") == photo.name
+
+
+def largest(observation, field):
+    """The biggest current variant of ``field``, or None until it is processed."""
+    if not is_current(observation, field):
+        return None
+    entry = (observation.photo_variants or {}).get(field) or {}
+    for name in reversed(VARIANTS):
+        if "jpeg" in entry.get(name, {}):
+            return entry[name]
+    return None
+
+
+def stale_fields(observation):
+    return [field for field in PHOTO_FIELDS if not is_current(observation, field)]
+
+
+def _encode(image, fmt, quality):
+    buffer = io.BytesIO()
+    if fmt == "webp":
+        image.save(buffer, "WEBP", quality=quality, method=4)
+    else:
+        image.save(buffer, "JPEG", quality=quality, optimize=True, progressive=True)
+    return buffer.getvalue()
+
+
+def render_variants(fileobj, stem):
+    """
+    Make every variant of the image in ``fileobj`` and save it to the default
+    storage under ``stem``. Returns the variant dict (without "source").
+    """
+    formats = ["jpeg"] + (["webp"] if features.check("webp") else [])
+    with Image.open(fileobj) as original:
+        # Apply the EXIF orientation to the pixels, then drop all metadata by
+        # re-encoding without it.
+        upright = ImageOps.exif_transpose(original)
+        if upright.mode not in ("RGB", "L"):
+            upright = upright.convert("RGB")
+
+        entry = {}
+        for name, size in VARIANTS.items():
+            image = upright.copy()
+            image.thumbnail((size, size), Image.Resampling.LANCZOS)
+            variant = {"width": image.width, "height": image.height}
+            for fmt in formats:
+                quality = WEBP_QUALITY if fmt == "webp" else JPEG_QUALITY
+                ext = "jpg" if fmt == "jpeg" else fmt
+                variant[fmt] = default_storage.save(
+                    f"{stem}-{name}.{ext}", ContentFile(_encode(image, fmt, quality))
+                )
+            entry[name] = variant
+    return entry
+
+
+def variant_paths(entry):
+    return [
+        path
+        for name in VARIANTS
+        for key, path in (entry or {}).get(name, {}).items()
+        if key not in ("width", "height")
+    ]
+
+
+def delete_variant_files(entry):
+    for path in variant_paths(entry):
+        try:
+            default_storage.delete(path)
+        except OSError:
+            logger.warning("Could not delete photo variant %s", path)
+
+
+def process_observation(observation_id):
+    """
+    (Re)build the variants of the photos of one observation that changed
+    since they were last processed. Returns the fields processed.
+    """
+    observation = Observation.objects.filter(pk=observation_id).first()
+    if observation is None:
+        return []
+
+    variants = dict(observation.photo_variants or {})
+    done = []
+    for field in stale_fields(observation):
+        old = variants.pop(field, None)
+        photo = getattr(observation, field)
+        if photo:
+            # Photos are shared between observations (see storage.py), but
+            # variants are not: they are named after the observation.
+            stem = f"{VARIANT_ROOT}/{field}/{observation_id}-{PurePosixPath(photo.name).stem}"
+            try:
+                with photo.open("rb") as fileobj:
+                    entry = render_variants(fileobj, stem)
+            except FileNotFoundError:
+                logger.warning("Photo %s of observation %s is missing", photo.name, observation_id)
+                if old is not None:
+                    variants[field] = old
+                continue
+            except (Image.UnidentifiedImageError, Image.DecompressionBombError):
+                logger.warning("Photo %s of observation %s is not an image", photo.name, observation_id)
+                entry = {}
+            entry["source"] = photo.name
+            variants[field] = entry
+        delete_variant_files(old)
+        done.append(field)
+
+    if done:
+        # A plain UPDATE: no save() signals, and the photo fields written
+        # meanwhile by a newer request are left alone.
+        Observation.objects.filter(pk=observation_id).update(photo_variants=variants)
+    return done
+
+
+def schedule(observation):
+    """Build the variants of ``observation``'s changed photos, in a job if enabled."""
+    if not stale_fields(observation):
+        return
+    if getattr(settings, "PHOTO_VARIANTS_ASYNC", True):
+        transaction.on_commit(lambda: jobs.enqueue(
+            "observations.photo_variants",
+            {"observation_id": observation.pk},
+            organization=observation.organization,
+        ))
+    else:
+        transaction.on_commit(lambda: process_observation(observation.pk))
@@ -0,0 +1,504 @@
+# observations/imports.py
+"""
+Bulk import of observations from CSV or Excel files.
+
+The file is read in chunks of IMPORT_CHUNK_SIZE rows (pandas for CSV,
+openpyxl's read-only mode for Excel), so memory stays flat however long it
+is. Each chunk is validated column by column with pandas - required values,
+severity/status choices, dates, known locations and users - instead of row
+by row through a form. Locations and the organization's users are looked up
+once per import, one query each. The valid rows of a chunk are written with
+``bulk_create`` in one transaction that also reserves them against the plan
+quota (core/quota.py) and records how far the file has been read, so a
+retried job resumes after the last committed chunk.
+
+``bulk_create`` skips the model signals: the rollups, the search index and
+the dashboard data version are updated here once per chunk. Photos are not
+imported.
+
+Rows that cannot be imported are written, with the reasons, to a CSV error
+report the user downloads, fixes and imports again. Files larger than
+IMPORT_BACKGROUND_BYTES are imported by a background job (``manage.py
+run_worker``).
+"""
+import csv
+import os
+import re
+import uuid
+import zipfile
+from collections import Counter
+from dataclasses import dataclass
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from core import jobs, quota
+from core.utils.lazy import lazy_import
+
+from . import rollups, search
+from .cache import bump_data_version
+from .models import Location, Observation, ObservationImport
+
+openpyxl = lazy_import("openpyxl")
+pandas = lazy_import("pandas")
+
+IMPORT_BACKGROUND_BYTES = getattr(settings, "IMPORT_BACKGROUND_BYTES", 256 * 1024)
+IMPORT_MAX_BYTES = 50 * 1024 * 1024
+IMPORT_CHUNK_SIZE = 5000
+IMPORT_BATCH_SIZE = 1000
+
+IMPORT_EXTENSIONS = (".csv", ".xlsx", ".xlsm")
+
+# Column -> accepted headers, compared lower-cased with spaces and dashes as
+# underscores. The export headers are among them, so an export imports back.
+COLUMNS = {
+    "title": ("title",),
+    "description": ("description",),
+    "location": ("location",),
+    "severity": ("severity",),
+    "status": ("status",),
+    "observer": ("observer", "observer_email"),
+    "assigned_to": ("assigned_to", "assigned_to_email", "action_owner"),
+    "date_observed": ("date_observed", "observed_at", "created_at", "date"),
+    "target_date": ("target_date",),
+    "date_closed": ("date_closed", "closed_at"),
+    "rectification_details": ("rectification_details",),
+    "verification_comment": ("verification_comment",),
+}
+REQUIRED_COLUMNS = ("title", "location", "date_observed")
+
+TITLE_MAX_LENGTH = Observation._meta.get_field("title").max_length
+
+# A location name shared by several locations (with different areas).
+AMBIGUOUS = -1
+
+_OFFSET = r"(?:Z|[+-]\d{2}:?\d{2})$"
+
+
+class ImportFileError(Exception):
+    """The file as a whole cannot be imported (unreadable, columns missing)."""
+
+
+@dataclass
+class ImportContext:
+    organization_id: int
+    user_id: int
+    columns: dict
+    locations: dict
+    users: dict
+
+
+# ---------------------------------------------------------------------------
+# Reading
+# ---------------------------------------------------------------------------
+
+def import_path(relative):
+    return Path(settings.IMPORT_ROOT) / relative
+
+
+def save_upload(organization, user, uploaded_file):
+    """Store an uploaded file and record a pending ObservationImport for it."""
+    suffix = Path(uploaded_file.name).suffix.lower()
+    relative = Path(str(organization.pk)) / f"{uuid.uuid4().hex}{suffix}"
+    target = import_path(relative)
+    target.parent.mkdir(parents=True, exist_ok=True)
+    with open(target, "wb") as fileobj:
+        for chunk in uploaded_file.chunks():
+            fileobj.write(chunk)
+    return ObservationImport.objects.create(
+        organization=organization,
+        requested_by=user,
+        filename=Path(uploaded_file.name).name[:255],
+        file_path=str(relative),
+    )
+
+
+def _is_csv(path):
+    return Path(path).suffix.lower() == ".csv"
+
+
+def read_chunks(path, chunk_size=IMPORT_CHUNK_SIZE):
+    """Yield the data rows of the file as DataFrames of ``chunk_size`` rows, with the file's headers."""
+    if _is_csv(path):
+        yield from pandas.read_csv(
+            path,
+            dtype=str,
+            keep_default_na=False,
+            encoding="utf-8-sig",
+            chunksize=chunk_size,
+        )
+        return
+
+    wb = openpyxl.load_workbook(path, read_only=True, data_only=True)
+    try:
+        rows = wb.worksheets[0].iter_rows(values_only=True)
+        header = [("" if value is None else str(value)) for value in next(rows, ())]
+        width = len(header)
+        block = []
+        for row in rows:
+            row = tuple(row[:width]) + (None,) * (width - len(row))
+            if all(value is None or value == "" for value in row):
+                continue
+            block.append(row)
+            if len(block) == chunk_size:
+                yield pandas.DataFrame(block, columns=header, dtype=object)
+                block = []
+        if block:
+            yield pandas.DataFrame(block, columns=header, dtype=object)
+    finally:
+        wb.close()
+
+
+def count_rows(path):
+    """Number of data rows in the file (for progress; Excel's may be an overestimate)."""
+    if _is_csv(path):
+        with open(path, "rb") as fileobj:
+            return max(sum(1 for line in fileobj if line.strip()) - 1, 0)
+    wb = openpyxl.load_workbook(path, read_only=True)
+    try:
+        return max((wb.worksheets[0].max_row or 1) - 1, 0)
+    finally:
+        wb.close()
+
+
+def _normalize_header(header):
+    return re.sub(r"[\s\-]+", "_", str(header).strip().lower())
+
+
+def map_columns(headers):
+    """``{column: header}`` for the headers that are recognised; ImportFileError if a required one is missing."""
+    by_name = {}
+    for header in headers:
+        by_name.setdefault(_normalize_header(header), header)
+    columns = {}
+    for column, spellings in COLUMNS.items():
+        for spelling in spellings:
+            if spelling in by_name:
+                columns[column] = by_name[spelling]
+                break
+    missing = [column for column in REQUIRED_COLUMNS if column not in columns]
+    if missing:
+        raise ImportFileError(f"Missing required column(s): {', '.join(missing)}.")
+    return columns
+
+
+# ---------------------------------------------------------------------------
+# Validation
+# ---------------------------------------------------------------------------
+
+def load_context(observation_import, columns):
+    """The lookups an import validates against: one query for locations, one for users."""
+    locations = {}
+    names = Counter()
+    for pk, name, area in Location.objects.values_list("id", "name", "area"):
+        name = name.strip().lower()
+        names[name] += 1
+        locations[name] = AMBIGUOUS if names[name] > 1 else pk
+        if area:
+            locations[f"{name} ({area.strip().lower()})"] = pk
+    users = {
+        email.lower(): pk
+        for email, pk in get_user_model().objects
+        .filter(organization_id=observation_import.organization_id)
+        .values_list("email", "id")
+    }
+    return ImportContext(
+        organization_id=observation_import.organization_id,
+        user_id=observation_import.requested_by_id,
+        columns=columns,
+        locations=locations,
+        users=users,
+    )
+
+
+def _choice_map(choices):
+    """Accepted spellings (code or label, any case) -> code."""
+    accepted = {}
+    for code, label in choices:
+        accepted[code] = code
+        accepted[_normalize_header(label).upper()] = code
+    return accepted
+
+
+SEVERITIES = _choice_map(Observation.SEVERITY_CHOICES)
+STATUSES = _choice_map(Observation.STATUS_CHOICES)
+
+
+def _parse_datetimes(values):
+    """Aware (UTC) timestamps of ``values``; naive values are in the current time zone. NaT if unparseable."""
+    present = values != ""
+    aware = present & values.str.contains(_OFFSET, regex=True)
+    result = pandas.Series(pandas.NaT, index=values.index, dtype="datetime64[ns, UTC]")
+    if aware.any():
+        result[aware] = pandas.to_datetime(values[aware], errors="coerce", format="ISO8601", utc=True)
+    naive = present & ~aware
+    if naive.any():
+        parsed = pandas.to_datetime(values[naive], errors="coerce", format="ISO8601")
+        retry = parsed.isna()
+        if retry.any():
+            parsed[retry] = pandas.to_datetime(values[naive][retry], errors="coerce", format="mixed")
+        result[naive] = parsed.dt.tz_localize(
+            timezone.get_current_timezone_name(), ambiguous="NaT", nonexistent="NaT"
+        ).dt.tz_convert("UTC")
+    return result
+
+
+def validate(frame, context):
+    """
+    Validate one chunk. Returns ``(clean, errors)``: a DataFrame of the
+    cleaned values of the valid rows, and a Series of the error messages of
+    the invalid ones, both indexed like ``frame``. Blank rows are dropped.
+    """
+    def text(column):
+        header = context.columns.get(column)
+        if header is None:
+            return pandas.Series("", index=frame.index, dtype=object)
+        return frame[header].fillna("").astype(str).str.strip()
+
+    values = {column: text(column) for column in COLUMNS}
+    blank = pandas.concat(values.values(), axis=1).eq("").all(axis=1)
+    errors = pandas.Series("", index=frame.index, dtype=object)
+
+    def fail(mask, message):
+        nonlocal errors
+        errors = errors.mask(mask, errors + message + "; ")
+
+    clean = pandas.DataFrame(index=frame.index)
+    for column in ("title", "description", "rectification_details", "verification_comment"):
+        clean[column] = values[column]
+    fail(values["title"] == "", "title is required")
+    fail(values["title"].str.len() > TITLE_MAX_LENGTH, f"title is longer than {TITLE_MAX_LENGTH} characters")
+
+    location = values["location"]
+    clean["location_id"] = location.str.lower().map(context.locations)
+    fail(location == "", "location is required")
+    fail((location != "") & clean["location_id"].isna(), "unknown location " + location)
+    fail(clean["location_id"] == AMBIGUOUS, "several locations are named " + location + ", use 'Name (Area)'")
+
+    for column, accepted, default in (("severity", SEVERITIES, "LOW"), ("status", STATUSES, "OPEN")):
+        raw = values[column]
+        clean[column] = raw.str.upper().str.replace(r"[\s\-]+", "_", regex=True).map(accepted)
+        clean.loc[raw == "", column] = default
+        fail(clean[column].isna(), f"invalid {column} " + raw)
+
+    for column, default in (("observer", context.user_id), ("assigned_to", None)):
+        email = values[column].str.lower()
+        clean[f"{column}_id"] = email.map(context.users)
+        clean.loc[email == "", f"{column}_id"] = default
+        fail((email != "") & clean[f"{column}_id"].isna(), f"{column} " + email + " is not a user of the organization")
+
+    for column in ("date_observed", "date_closed", "target_date"):
+        clean[column] = _parse_datetimes(values[column])
+        fail((values[column] != "") & clean[column].isna(), f"invalid {column} " + values[column])
+    fail(values["date_observed"] == "", "date_observed is required")
+    closed = clean["status"] == "CLOSED"
+    fail(closed & clean["date_closed"].isna() & (values["date_closed"] == ""), "date_closed is required for closed observations")
+    # As in the app, only closed observations have a closing date.
+    clean.loc[~closed, "date_closed"] = pandas.NaT
+
+    invalid = (errors != "") & ~blank
+    return clean[~invalid & ~blank], errors[invalid].str.rstrip("; ")
+
+
+def _datetimes(series):
+    return [None if pandas.isna(value) else value.to_pydatetime() for value in series]
+
+
+def build_observations(clean, organization_id):
+    """Unsaved Observations for the rows of a validated chunk."""
+    target_dates = [None if pandas.isna(value) else timezone.localdate(value.to_pydatetime()) for value in clean["target_date"]]
+    observers = [None if pandas.isna(value) else int(value) for value in clean["observer_id"]]
+    assigned = [None if pandas.isna(value) else int(value) for value in clean["assigned_to_id"]]
+    rows = zip(
+        clean["title"], clean["description"], clean["location_id"], clean["severity"],
+        clean["status"], observers, assigned, _datetimes(clean["date_observed"]),
+        target_dates, _datetimes(clean["date_closed"]), clean["rectification_details"],
+        clean["verification_comment"],
+    )
+    return [
+        Observation(
+            organization_id=organization_id,
+            title=title,
+            description=description,
+            location_id=int(location_id),
+            severity=severity,
+            status=status,
+            observer_id=observer_id,
+            assigned_to_id=assigned_to_id,
+            date_observed=date_observed,
+            target_date=target_date,
+            date_closed=date_closed,
+            rectification_details=rectification_details,
+            verification_comment=verification_comment or None,
+        )
+        for (title, description, location_id, severity, status, observer_id, assigned_to_id,
+             date_observed, target_date, date_closed, rectification_details, verification_comment) in rows
+    ]
+
+
+# ---------------------------------------------------------------------------
+# Writing
+# ---------------------------------------------------------------------------
+
+def insert(organization_id, observations):
+    """
+    Create ``observations`` within the organization's plan quota. Returns
+    how many were created (the first ones, if the plan cannot take them all).
+    Call inside a transaction.
+    """
+    if not observations:
+        return 0
+    try:
+        quota.reserve(organization_id, quota.OBSERVATIONS, len(observations))
+    except quota.QuotaExceeded:
+        observations = observations[:quota.remaining(organization_id, quota.OBSERVATIONS)]
+        if not observations:
+            return 0
+        quota.reserve(organization_id, quota.OBSERVATIONS, len(observations))
+    created = Observation.objects.bulk_create(observations, batch_size=IMPORT_BATCH_SIZE)
+    rollups.record_change(Counter(), rollups.contributions(rollups.instance_row(obj) for obj in created))
+    search.get_backend().index([obj.pk for obj in created])
+    bump_data_version(organization_id)
+    return len(created)
+
+
+class ErrorReport:
+    """The CSV of rejected rows: row number, reasons, then the row as uploaded."""
+
+    def __init__(self, observation_import):
+        self.relative = observation_import.error_report_path or str(
+            Path(str(observation_import.organization_id)) / f"{observation_import.pk}-errors.csv"
+        )
+        self.path = import_path(self.relative)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.fileobj = None
+        self.writer = None
+
+    def write(self, frame, errors, first_row):
+        if errors.empty:
+            return
+        if self.writer is None:
+            new = not self.path.exists() or self.path.stat().st_size == 0
+            self.fileobj = open(self.path, "a", newline="", encoding="utf-8")
+            self.writer = csv.writer(self.fileobj)
+            if new:
+                self.writer.writerow(["Row", "Errors", *frame.columns])
+        rejected = frame.loc[errors.index]
+        rejected = rejected.where(rejected.notna(), "")
+        positions = frame.index.get_indexer(errors.index)
+        for position, message, values in zip(positions, errors, rejected.itertuples(index=False)):
+            self.writer.writerow([first_row + position, message, *values])
+        self.fileobj.flush()
+
+    def close(self):
+        if self.fileobj is not None:
+            self.fileobj.close()
+
+
+def run_import(import_id, progress=None, job_id=None):
+    """
+    Import the file of a pending ObservationImport. Does nothing if it is
+    not pending, unless it is RUNNING for ``job_id`` (the job is retried
+    after its worker died). On an unexpected error it is put back to
+    pending and the error raised so that the job can be retried. Either way
+    the retry resumes after the last committed chunk. A file that cannot be
+    imported fails the import.
+    """
+    claimable = Q(status="PENDING")
+    if job_id is not None:
+        claimable |= Q(status="RUNNING", job_id=job_id)
+    claimed = ObservationImport.objects.filter(claimable, pk=import_id).update(status="RUNNING")
+    if not claimed:
+        return 0
+
+    observation_import = ObservationImport.objects.get(pk=import_id)
+    path = import_path(observation_import.file_path)
+    report = ErrorReport(observation_import)
+    try:
+        total = count_rows(path) if progress else 0
+        done = observation_import.rows_processed
+        context = None
+        read = 0
+        for frame in read_chunks(path):
+            if context is None:
+                context = load_context(observation_import, map_columns(frame.columns))
+            first_row = read + 1
+            read += len(frame)
+            if read <= done:
+                continue
+            if read - len(frame) < done:
+                # Resuming inside this chunk.
+                skip = done - (read - len(frame))
+                frame = frame.iloc[skip:]
+                first_row += skip
+
+            clean, errors = validate(frame, context)
+            observations = build_observations(clean, context.organization_id)
+            with transaction.atomic():
+                created = insert(context.organization_id, observations)
+                if created < len(observations):
+                    over_quota = clean.index[created:]
+                    errors = pandas.concat([errors, pandas.Series(
+                        "observation limit of the plan reached", index=over_quota, dtype=object
+                    )])
+                ObservationImport.objects.filter(pk=import_id).update(
+                    rows_processed=F("rows_processed") + len(frame),
+                    imported_count=F("imported_count") + created,
+                    error_count=F("error_count") + len(errors),
+                    error_report_path=report.relative,
+                )
+                # Written inside the transaction: if the commit fails the
+                # retry rewrites these rows, which at worst repeats them.
+                report.write(frame, errors.sort_index(), first_row)
+            if progress and total:
+                progress(min(read * 100 // total, 99), f"{read} of {total} rows")
+        if context is None:
+            raise ImportFileError("The file has no rows.")
+    except (ImportFileError, ValueError, OSError, zipfile.BadZipFile) as exc:
+        # Not worth retrying: the file itself is the problem.
+        report.close()
+        message = str(exc) if isinstance(exc, ImportFileError) else f"The file could not be read: {exc}"
+        ObservationImport.objects.filter(pk=import_id).update(
+            status="FAILED", error=message, finished_at=timezone.now()
+        )
+        return 0
+    except Exception as exc:
+        report.close()
+        ObservationImport.objects.filter(pk=import_id).update(status="PENDING", error=str(exc))
+        raise
+    report.close()
+
+    observation_import.refresh_from_db()
+    ObservationImport.objects.filter(pk=import_id).update(
+        status="DONE",
+        error_report_path=report.relative if observation_import.error_count else "",
+        error="",
+        finished_at=timezone.now(),
+    )
+    return observation_import.imported_count
+
+
+def fail_import(import_id, error):
+    ObservationImport.objects.filter(pk=import_id).update(
+        status="FAILED", error=error, finished_at=timezone.now()
+    )
+
+
+def submit_import(observation_import):
+    """Queue ``observation_import`` for a background worker."""
+    observation_import.job = jobs.enqueue(
+        "observations.import_file",
+        {"import_id": observation_import.pk},
+        organization=observation_import.organization,
+        created_by=observation_import.requested_by,
+    )
+    observation_import.save(update_fields=["job"])
+
+
+def needs_background(observation_import, threshold=None):
+    threshold = IMPORT_BACKGROUND_BYTES if threshold is None else threshold
+    return os.path.getsize(import_path(observation_import.file_path)) > threshold
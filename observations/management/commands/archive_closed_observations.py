@@ -0,0 +1,70 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from core.models import Organization
+from observations import retention
+from observations.tasks import schedule_archive_closed
+
+
+class Command(BaseCommand):
+    help = (
+        "Archive closed observations past their organization's retention "
+        "period (Organization.archive_closed_after_days), in pk-range batches."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--organization", type=int, help="Only this organization id.")
+        parser.add_argument("--batch-size", type=int, default=retention.RETENTION_BATCH_SIZE)
+        parser.add_argument(
+            "--pause", type=float, default=0,
+            help="Seconds to sleep between batches, to leave room for other writers.",
+        )
+        parser.add_argument("--dry-run", action="store_true", help="Only count what would be archived.")
+        parser.add_argument(
+            "--schedule", action="store_true",
+            help="Queue the daily observations.archive_closed job for run_worker instead.",
+        )
+
+    def handle(self, *args, **options):
+        if options["schedule"]:
+            job = schedule_archive_closed()
+            if job is None:
+                self.stdout.write("The retention job is already queued.")
+            else:
+                self.stdout.write(self.style.SUCCESS(f"Queued {job}."))
+            return
+
+        organization = None
+        if options["organization"] is not None:
+            organization = Organization.objects.filter(pk=options["organization"]).first()
+            if organization is None:
+                raise CommandError(f"Organization {options['organization']} does not exist.")
+            if organization.archive_closed_after_days is None:
+                raise CommandError(f"{organization} has no retention period set.")
+
+        if options["dry_run"]:
+            organizations = Organization.objects.filter(archive_closed_after_days__isnull=False)
+            if organization is not None:
+                organizations = organizations.filter(pk=organization.pk)
+            total = 0
+            for org in organizations.order_by("pk"):
+                count = retention.due(org)
+                total += count
+                self.stdout.write(f"{org}: {count} to archive (after {org.archive_closed_after_days} days)")
+            self.stdout.write(self.style.SUCCESS(f"Would archive {total} observations."))
+            return
+
+        stats = retention.run(
+            organization,
+            batch_size=options["batch_size"],
+            pause=options["pause"],
+            progress=(
+                (lambda org, archived: self.stdout.write(f"{org}: {archived} archived so far"))
+                if options["verbosity"] > 1 else None
+            ),
+        )
+        for org_id, archived in stats.per_organization.items():
+            self.stdout.write(f"Organization {org_id}: {archived} archived")
+        self.stdout.write(self.style.SUCCESS(
+            f"Archived {stats.archived} observations of {stats.organizations} organization(s) "
+            f"in {stats.batches} batch(es), {stats.seconds:.2f}s ({stats.rate:.0f}/s)."
+        ))
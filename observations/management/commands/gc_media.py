@@ -0,0 +1,39 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.template.defaultfilters import filesizeformat
+
+from observations import storage
+
+
+class Command(BaseCommand):
+    help = "Delete observation photos that are no longer referenced and report the space reclaimed."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--grace-hours", type=int, default=int(storage.GC_GRACE.total_seconds() // 3600),
+            help="Keep files released or written less than this many hours ago.",
+        )
+        parser.add_argument("--batch-size", type=int, default=500)
+        parser.add_argument(
+            "--scan", action="store_true",
+            help="Also walk the photo directories for files nothing refers to (slower).",
+        )
+        parser.add_argument("--dry-run", action="store_true", help="Only report what would be deleted.")
+
+    def handle(self, *args, **options):
+        kwargs = {
+            "grace": timedelta(hours=options["grace_hours"]),
+            "batch_size": options["batch_size"],
+            "dry_run": options["dry_run"],
+        }
+        files, reclaimed = storage.collect_blobs(**kwargs)
+        if options["scan"]:
+            orphans, orphan_bytes = storage.collect_orphan_files(**kwargs)
+            files += orphans
+            reclaimed += orphan_bytes
+
+        verb = "Would delete" if options["dry_run"] else "Deleted"
+        self.stdout.write(self.style.SUCCESS(
+            f"{verb} {files} files, {filesizeformat(reclaimed)} ({reclaimed} bytes) reclaimed."
+        ))
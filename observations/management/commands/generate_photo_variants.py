@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Q
+
+from core.models import Organization
+from observations import images
+from observations.models import Observation
+
+
+class Command(BaseCommand):
+    help = "Build the resized photo variants of observations that don't have current ones."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--organization",
+            type=int,
+            help="Only process the observations of this organization id.",
+        )
+
+    def handle(self, *args, **options):
+        observations = Observation.objects.exclude(
+            Q(photo_before="") | Q(photo_before__isnull=True),
+            Q(photo_after="") | Q(photo_after__isnull=True),
+        )
+        if options["organization"] is not None:
+            try:
+                organization = Organization.objects.get(pk=options["organization"])
+            except Organization.DoesNotExist:
+                raise CommandError(f"Organization {options['organization']} does not exist.")
+            observations = observations.filter(organization=organization)
+
+        processed = photos = 0
+        rows = observations.only("pk", "photo_before", "photo_after", "photo_variants")
+        for observation in rows.iterator(chunk_size=500):
+            if not images.stale_fields(observation):
+                continue
+            photos += len(images.process_observation(observation.pk))
+            processed += 1
+            if processed % 100 == 0:
+                self.stdout.write(f"{processed} observations...")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Processed {photos} photos of {processed} observations."
+        ))
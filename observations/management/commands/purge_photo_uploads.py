@@ -0,0 +1,21 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from observations import uploads
+
+
+class Command(BaseCommand):
+    help = "Delete chunked photo uploads (and their temporary files) that were never used."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--hours",
+            type=int,
+            default=int(uploads.UPLOAD_EXPIRY.total_seconds() // 3600),
+            help="Purge uploads started more than this many hours ago.",
+        )
+
+    def handle(self, *args, **options):
+        count = uploads.purge(timedelta(hours=options["hours"]))
+        self.stdout.write(self.style.SUCCESS(f"Purged {count} uploads."))
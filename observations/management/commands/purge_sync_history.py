@@ -0,0 +1,21 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from observations import sync
+
+
+class Command(BaseCommand):
+    help = "Delete offline sync tombstones and upload keys past the sync retention."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--days",
+            type=int,
+            default=sync.SYNC_RETENTION.days,
+            help="Purge records older than this many days. Sync cursors older than this expire.",
+        )
+
+    def handle(self, *args, **options):
+        count = sync.purge(timedelta(days=options["days"]))
+        self.stdout.write(self.style.SUCCESS(f"Purged {count} sync records."))
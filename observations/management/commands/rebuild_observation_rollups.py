@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from core.models import Organization
+from observations import rollups
+
+
+class Command(BaseCommand):
+    help = "Rebuild the observation daily rollup table from the raw observations."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--organization",
+            type=int,
+            help="Only rebuild the rollups of this organization id.",
+        )
+
+    def handle(self, *args, **options):
+        organization = None
+        if options["organization"] is not None:
+            try:
+                organization = Organization.objects.get(pk=options["organization"])
+            except Organization.DoesNotExist:
+                raise CommandError(f"Organization {options['organization']} does not exist.")
+
+        buckets = rollups.rebuild(organization)
+        scope = organization or "all organizations"
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {buckets} rollup buckets for {scope}."))
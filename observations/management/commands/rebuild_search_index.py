@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from core.models import Organization
+from observations import search
+
+
+class Command(BaseCommand):
+    help = "Rebuild the observation full-text search index."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--organization",
+            type=int,
+            help="Only reindex the observations of this organization id.",
+        )
+
+    def handle(self, *args, **options):
+        organization = None
+        if options["organization"] is not None:
+            try:
+                organization = Organization.objects.get(pk=options["organization"])
+            except Organization.DoesNotExist:
+                raise CommandError(f"Organization {options['organization']} does not exist.")
+
+        backend = search.get_backend()
+        count = backend.rebuild(organization)
+        scope = organization or "all organizations"
+        self.stdout.write(self.style.SUCCESS(
+            f"Indexed {count} observations for {scope} ({type(backend).__name__})."
+        ))
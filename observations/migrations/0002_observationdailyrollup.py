@@ -0,0 +1,31 @@
+# Generated by Django 5.1 on 2026-10-18 10:38
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0002_plan_subscription'),
+        ('observations', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ObservationDailyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('severity', models.CharField(choices=[('LOW', 'Low'), ('MEDIUM', 'Medium'), ('HIGH', 'High')], max_length=10)),
+                ('status', models.CharField(max_length=30)),
+                ('opened', models.IntegerField(default=0)),
+                ('closed', models.IntegerField(default=0)),
+                ('location', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='rollups', to='observations.location')),
+                ('organization', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='observation_rollups', to='core.organization')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('organization', 'day', 'location', 'severity', 'status'), name='observation_rollup_bucket_unique')],
+            },
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.1 on 2026-10-18 10:40
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_organization_data_version'),
+        ('observations', '0002_observationdailyrollup'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='observation',
+            index=models.Index(fields=['organization', 'is_archived', '-date_observed'], name='obs_org_archived_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='observation',
+            index=models.Index(condition=models.Q(('is_archived', False)), fields=['organization', '-date_observed'], name='obs_active_org_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='observation',
+            index=models.Index(condition=models.Q(('is_archived', True)), fields=['organization', '-id'], name='obs_archived_org_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='observation',
+            index=models.Index(condition=models.Q(('is_archived', False)), fields=['organization', 'target_date', 'status'], name='obs_active_org_due_idx'),
+        ),
+    ]
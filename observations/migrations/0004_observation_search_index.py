@@ -0,0 +1,46 @@
+from django.db import migrations
+
+SQLITE_FORWARD = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS observations_observation_fts USING fts5("
+    "organization, title, description, location, observer, "
+    "prefix='2 3', tokenize='unicode61 remove_diacritics 2')",
+]
+SQLITE_BACKWARD = [
+    "DROP TABLE IF EXISTS observations_observation_fts",
+]
+
+POSTGRES_FORWARD = [
+    "CREATE TABLE IF NOT EXISTS observations_observation_search ("
+    "observation_id bigint PRIMARY KEY "
+    "REFERENCES observations_observation (id) ON DELETE CASCADE DEFERRABLE INITIALLY DEFERRED, "
+    "organization_id bigint NOT NULL, "
+    "document tsvector NOT NULL)",
+    "CREATE INDEX IF NOT EXISTS observations_observation_search_document_gin "
+    "ON observations_observation_search USING gin (document)",
+    "CREATE INDEX IF NOT EXISTS observations_observation_search_org "
+    "ON observations_observation_search (organization_id)",
+]
+POSTGRES_BACKWARD = [
+    "DROP TABLE IF EXISTS observations_observation_search",
+]
+
+
+def _run(statements_by_vendor):
+    def run(apps, schema_editor):
+        for statement in statements_by_vendor.get(schema_editor.connection.vendor, []):
+            schema_editor.execute(statement)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('observations', '0003_observation_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            _run({"sqlite": SQLITE_FORWARD, "postgresql": POSTGRES_FORWARD}),
+            _run({"sqlite": SQLITE_BACKWARD, "postgresql": POSTGRES_BACKWARD}),
+        ),
+    ]
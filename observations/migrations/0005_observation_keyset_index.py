@@ -0,0 +1,24 @@
+# Generated by Django 5.1 on 2026-10-18 10:43
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_organization_data_version'),
+        ('observations', '0004_observation_search_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='observation',
+            name='obs_active_org_date_idx',
+        ),
+        migrations.AddIndex(
+            model_name='observation',
+            index=models.Index(condition=models.Q(('is_archived', False)), fields=['organization', '-date_observed', '-id'], name='obs_active_org_date_idx'),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 5.1 on 2026-10-18 10:48
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0004_job'),
+        ('observations', '0006_observationexport'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='observationexport',
+            name='job',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='core.job'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1 on 2026-10-18 10:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('observations', '0007_observationexport_job'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='observation',
+            name='photo_variants',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+    ]
@@ -0,0 +1,62 @@
+# Generated by Django 5.1 on 2026-10-18 10:59
+
+from collections import Counter
+
+import django.utils.timezone
+import observations.storage
+from django.db import migrations, models
+
+
+def count_existing_photos(apps, schema_editor):
+    """Start the reference counts from the photos already stored."""
+    Observation = apps.get_model('observations', 'Observation')
+    MediaBlob = apps.get_model('observations', 'MediaBlob')
+    storage = observations.storage.photo_storage()
+
+    refs = Counter()
+    for before, after in Observation.objects.values_list('photo_before', 'photo_after').iterator():
+        refs.update(path for path in (before, after) if path)
+
+    blobs = []
+    for path, count in refs.items():
+        try:
+            size = storage.size(path)
+        except OSError:
+            size = 0
+        blobs.append(MediaBlob(path=path, size=size, ref_count=count))
+    MediaBlob.objects.bulk_create(blobs, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('observations', '0009_photoupload'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='observation',
+            name='photo_after',
+            field=models.ImageField(blank=True, null=True, storage=observations.storage.photo_storage, upload_to='observations/after/'),
+        ),
+        migrations.AlterField(
+            model_name='observation',
+            name='photo_before',
+            field=models.ImageField(blank=True, null=True, storage=observations.storage.photo_storage, upload_to='observations/before/'),
+        ),
+        migrations.CreateModel(
+            name='MediaBlob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('path', models.CharField(max_length=255, unique=True)),
+                ('size', models.PositiveBigIntegerField(default=0)),
+                ('ref_count', models.IntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['ref_count', 'updated_at'], name='mediablob_gc_idx')],
+            },
+        ),
+        migrations.RunPython(count_existing_photos, migrations.RunPython.noop),
+    ]
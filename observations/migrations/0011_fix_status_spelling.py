@@ -0,0 +1,42 @@
+from django.db import migrations
+from django.db.models import F
+
+# Statuses the rectify and verify views used to write with a space.
+MISSPELLED = {
+    'IN PROGRESS': 'IN_PROGRESS',
+    'AWAITING VERIFICATION': 'AWAITING_VERIFICATION',
+}
+
+
+def fix_status_spelling(apps, schema_editor):
+    Observation = apps.get_model('observations', 'Observation')
+    ObservationDailyRollup = apps.get_model('observations', 'ObservationDailyRollup')
+
+    for wrong, right in MISSPELLED.items():
+        Observation.objects.filter(status=wrong).update(status=right)
+
+        # Fold the rollup buckets into the correctly spelled ones.
+        for bucket in ObservationDailyRollup.objects.filter(status=wrong).iterator():
+            merged = ObservationDailyRollup.objects.filter(
+                organization_id=bucket.organization_id,
+                day=bucket.day,
+                location_id=bucket.location_id,
+                severity=bucket.severity,
+                status=right,
+            ).update(opened=F('opened') + bucket.opened, closed=F('closed') + bucket.closed)
+            if merged:
+                bucket.delete()
+            else:
+                bucket.status = right
+                bucket.save(update_fields=['status'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('observations', '0010_mediablob'),
+    ]
+
+    operations = [
+        migrations.RunPython(fix_status_spelling, migrations.RunPython.noop),
+    ]
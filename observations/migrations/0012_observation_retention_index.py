@@ -0,0 +1,20 @@
+# Generated by Django 5.1 on 2026-10-18 11:10
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_organization_archive_closed_after_days'),
+        ('observations', '0011_fix_status_spelling'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='observation',
+            index=models.Index(condition=models.Q(('is_archived', False), ('status', 'CLOSED')), fields=['organization', 'date_closed'], name='obs_active_org_closed_idx'),
+        ),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 5.1 on 2026-10-18 11:12
+
+import django.db.models.deletion
+import django.utils.timezone
+import observations.storage
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_organization_archive_closed_after_days'),
+        ('observations', '0012_observation_retention_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedObservation',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('date_observed', models.DateTimeField()),
+                ('title', models.CharField(max_length=255)),
+                ('description', models.TextField()),
+                ('severity', models.CharField(choices=[('LOW', 'Low'), ('MEDIUM', 'Medium'), ('HIGH', 'High')], max_length=10)),
+                ('photo_before', models.ImageField(blank=True, null=True, storage=observations.storage.photo_storage, upload_to='observations/before/')),
+                ('status', models.CharField(choices=[('OPEN', 'Open'), ('IN_PROGRESS', 'In Progress'), ('AWAITING_VERIFICATION', 'Awaiting Verification'), ('CLOSED', 'Closed')], max_length=30)),
+                ('target_date', models.DateField(blank=True, null=True)),
+                ('rectification_details', models.TextField(blank=True)),
+                ('photo_after', models.ImageField(blank=True, null=True, storage=observations.storage.photo_storage, upload_to='observations/after/')),
+                ('date_closed', models.DateTimeField(blank=True, null=True)),
+                ('verification_comment', models.TextField(blank=True, null=True)),
+                ('photo_variants', models.JSONField(blank=True, default=dict, editable=False)),
+                ('archived_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('assigned_to', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('location', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='archived_observations', to='observations.location')),
+                ('observer', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('organization', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_observations', to='core.organization')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['organization', '-id'], name='archived_obs_org_id_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,57 @@
+from django.db import migrations
+from django.utils import timezone
+
+BATCH_SIZE = 1000
+
+
+def move_archived(apps, schema_editor):
+    """
+    Move the rows archived so far to the archive tier. Historical models send
+    no signals, which is what a move between tiers wants: archived rows are
+    not in the rollups, and usage counts and photo references cover both tiers.
+    """
+    Observation = apps.get_model('observations', 'Observation')
+    ArchivedObservation = apps.get_model('observations', 'ArchivedObservation')
+    fields = [
+        field.attname
+        for field in ArchivedObservation._meta.concrete_fields
+        if field.name != 'archived_at'
+    ]
+    now = timezone.now()
+    while True:
+        rows = list(
+            Observation.objects.filter(is_archived=True).order_by('pk').values(*fields)[:BATCH_SIZE]
+        )
+        if not rows:
+            break
+        ArchivedObservation.objects.bulk_create(
+            ArchivedObservation(archived_at=now, **row) for row in rows
+        )
+        Observation.objects.filter(pk__in=[row['id'] for row in rows]).delete()
+
+
+def move_back(apps, schema_editor):
+    Observation = apps.get_model('observations', 'Observation')
+    ArchivedObservation = apps.get_model('observations', 'ArchivedObservation')
+    fields = [
+        field.attname
+        for field in ArchivedObservation._meta.concrete_fields
+        if field.name != 'archived_at'
+    ]
+    while True:
+        rows = list(ArchivedObservation.objects.order_by('pk').values(*fields)[:BATCH_SIZE])
+        if not rows:
+            break
+        Observation.objects.bulk_create(Observation(is_archived=True, **row) for row in rows)
+        ArchivedObservation.objects.filter(pk__in=[row['id'] for row in rows]).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('observations', '0013_archivedobservation'),
+    ]
+
+    operations = [
+        migrations.RunPython(move_archived, move_back),
+    ]
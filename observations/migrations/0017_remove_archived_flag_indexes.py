@@ -0,0 +1,25 @@
+# Generated by Django 5.1 on 2026-10-18 11:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('observations', '0016_observationimport'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='observation',
+            name='obs_org_archived_date_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='observation',
+            name='obs_archived_org_id_idx',
+        ),
+        migrations.AddIndex(
+            model_name='observation',
+            index=models.Index(fields=['organization', '-date_observed'], name='obs_org_date_idx'),
+        ),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 5.1 on 2026-10-18 11:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('observations', '0017_remove_archived_flag_indexes'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='observation',
+            name='obs_active_org_due_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='observation',
+            name='obs_active_org_date_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='observation',
+            name='obs_active_org_closed_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='observation',
+            name='obs_org_date_idx',
+        ),
+        migrations.RemoveField(
+            model_name='observation',
+            name='is_archived',
+        ),
+        migrations.AddIndex(
+            model_name='observation',
+            index=models.Index(fields=['organization', '-date_observed', '-id'], name='obs_org_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='observation',
+            index=models.Index(fields=['organization', 'target_date', 'status'], name='obs_org_due_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='observation',
+            index=models.Index(condition=models.Q(('status', 'CLOSED')), fields=['organization', 'date_closed'], name='obs_org_closed_idx'),
+        ),
+    ]
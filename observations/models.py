@@ -6,15 +6,34 @@ from django.db import models
 from django.conf import settings
 from django.utils import timezone
 from django.contrib.auth.models import User
+import uuid
+
+from .storage import photo_storage
 
 class Location(models.Model):
     name = models.CharField(max_length=200)
     area = models.CharField(max_length=200, blank=True)
     facility = models.CharField(max_length=200, blank=True)
+    # Offline sync cursor (see observations/sync.py).
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
 
     def __str__(self):
         return f"{self.name} ({self.area})" if self.area else self.name
 
+class ObservationQuerySet(models.QuerySet):
+    """
+    Building blocks for the hot observation queries. Views, exports and the
+    dashboard go through these so that the query-plan tests in
+    observations/tests.py cover what production actually runs.
+    """
+
+    def for_organization(self, organization):
+        return self.filter(organization=organization)
+
+    def overdue(self, today):
+        return self.filter(target_date__lt=today).exclude(status='CLOSED')
+
+
 class Observation(models.Model):
     SEVERITY_CHOICES = [
         ('LOW','Low'),
@@ -39,15 +58,41 @@ class Observation(models.Model):
     title = models.CharField(max_length=255)
     description = models.TextField()
     severity = models.CharField(max_length=10, choices=SEVERITY_CHOICES, default='LOW')
-    photo_before = models.ImageField(upload_to='observations/before/', blank=True, null=True)
+    photo_before = models.ImageField(upload_to='observations/before/', storage=photo_storage, blank=True, null=True)
     assigned_to = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True, related_name='assigned_observations')
     status = models.CharField(max_length=30, choices=STATUS_CHOICES, default='OPEN')
     target_date = models.DateField(null=True, blank=True)
     rectification_details = models.TextField(blank=True)
-    photo_after = models.ImageField(upload_to='observations/after/', blank=True, null=True)
+    photo_after = models.ImageField(upload_to='observations/after/', storage=photo_storage, blank=True, null=True)
     date_closed = models.DateTimeField(null=True, blank=True)
     verification_comment = models.TextField(blank=True, null=True)
-    is_archived = models.BooleanField(default=False)
+    # Resized, EXIF-free copies of the photos (see observations/images.py)
+    photo_variants = models.JSONField(default=dict, blank=True, editable=False)
+    # Offline sync cursor (see observations/sync.py). QuerySet.update()
+    # does not touch auto_now fields: code updating synced fields in bulk
+    # sets it itself.
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = ObservationQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Lists and keyset pages: tenant, newest first (archived rows
+            # are in ArchivedObservation).
+            models.Index(fields=['organization', '-date_observed', '-id'],
+                         name='obs_org_date_idx'),
+            # Overdue counts: open items past their target date.
+            models.Index(fields=['organization', 'target_date', 'status'],
+                         name='obs_org_due_idx'),
+            # Retention: closed items by closing date (a partial index,
+            # skipped on backends without support).
+            models.Index(fields=['organization', 'date_closed'],
+                         condition=models.Q(status='CLOSED'),
+                         name='obs_org_closed_idx'),
+            # Offline sync: what changed in the tenant since a cursor.
+            models.Index(fields=['organization', 'updated_at', 'id'],
+                         name='obs_org_updated_idx'),
+        ]
 
     def close(self):
         self.status = 'CLOSED'
@@ -57,3 +102,267 @@ class Observation(models.Model):
     def __str__(self):
         return f"[{self.get_severity_display()}] {self.title} - {self.status}"
 
+
+
+class ArchivedObservation(models.Model):
+    """
+    Cold tier of archived observations (see observations/tiers.py).
+
+    Archived rows are moved out of Observation so the hot table and its
+    indexes only hold what the lists, dashboard and search work on. Rows
+    keep their Observation id, so links and restores stay stable, and the
+    same field names, so templates render either model.
+    """
+    id = models.BigIntegerField(primary_key=True)
+    organization = models.ForeignKey('core.Organization',
+                                        on_delete=models.CASCADE,
+                                        related_name='archived_observations')
+    location = models.ForeignKey(Location, on_delete=models.PROTECT, related_name='archived_observations')
+    observer = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, related_name='+')
+    date_observed = models.DateTimeField()
+    title = models.CharField(max_length=255)
+    description = models.TextField()
+    severity = models.CharField(max_length=10, choices=Observation.SEVERITY_CHOICES)
+    photo_before = models.ImageField(upload_to='observations/before/', storage=photo_storage, blank=True, null=True)
+    assigned_to = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    status = models.CharField(max_length=30, choices=Observation.STATUS_CHOICES)
+    target_date = models.DateField(null=True, blank=True)
+    rectification_details = models.TextField(blank=True)
+    photo_after = models.ImageField(upload_to='observations/after/', storage=photo_storage, blank=True, null=True)
+    date_closed = models.DateTimeField(null=True, blank=True)
+    verification_comment = models.TextField(blank=True, null=True)
+    photo_variants = models.JSONField(default=dict, blank=True, editable=False)
+    archived_at = models.DateTimeField(default=timezone.now)
+
+    is_archived = True
+
+    class Meta:
+        indexes = [
+            # Archived list: tenant, newest first.
+            models.Index(fields=['organization', '-id'], name='archived_obs_org_id_idx'),
+        ]
+
+    def __str__(self):
+        return f"[{self.get_severity_display()}] {self.title} - {self.status} (archived)"
+
+
+class Tombstone(models.Model):
+    """
+    A deleted (or archived) Observation or Location, kept so that clients
+    syncing from a cursor learn to drop their copy (see observations/sync.py).
+    Location tombstones have no organization: locations are shared.
+    """
+    OBSERVATION = 'observation'
+    LOCATION = 'location'
+    MODEL_CHOICES = [
+        (OBSERVATION, 'Observation'),
+        (LOCATION, 'Location'),
+    ]
+
+    model = models.CharField(max_length=20, choices=MODEL_CHOICES)
+    object_id = models.BigIntegerField()
+    # No database constraint: deleting an organization deletes its
+    # observations first, and their tombstones are written meanwhile.
+    organization = models.ForeignKey('core.Organization',
+                                        on_delete=models.CASCADE,
+                                        null=True, blank=True,
+                                        db_constraint=False,
+                                        related_name='+')
+    deleted_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['model', 'organization', 'deleted_at', 'id'],
+                         name='tombstone_model_org_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.model} {self.object_id} deleted {self.deleted_at:%Y-%m-%d %H:%M}"
+
+
+class SyncKey(models.Model):
+    """
+    Idempotency key of an item of an offline sync upload, so a batch the
+    client re-sends after a dropped response is not applied twice.
+    ``fingerprint`` is a hash of the item, to tell a retry from a key reused
+    for different data.
+    """
+    organization = models.ForeignKey('core.Organization',
+                                        on_delete=models.CASCADE,
+                                        related_name='+')
+    key = models.CharField(max_length=64)
+    fingerprint = models.CharField(max_length=64)
+    observation_id = models.BigIntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['organization', 'key'], name='sync_key_unique'),
+        ]
+
+    def __str__(self):
+        return f"{self.key} -> {self.observation_id}"
+
+
+class ObservationDailyRollup(models.Model):
+    """
+    Pre-aggregated counts of active (non-archived) observations, one row per
+    organization x day x location x severity x status.
+
+    ``opened`` counts observations observed on ``day``; ``closed`` counts
+    observations closed on ``day``. Rows are kept in sync incrementally by
+    observations.rollups and can be rebuilt with
+    ``manage.py rebuild_observation_rollups``.
+    """
+    organization = models.ForeignKey('core.Organization',
+                                        on_delete=models.CASCADE,
+                                        related_name='observation_rollups')
+    day = models.DateField()
+    location = models.ForeignKey(Location, on_delete=models.CASCADE, related_name='rollups')
+    severity = models.CharField(max_length=10, choices=Observation.SEVERITY_CHOICES)
+    status = models.CharField(max_length=30)
+    opened = models.IntegerField(default=0)
+    closed = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['organization', 'day', 'location', 'severity', 'status'],
+                name='observation_rollup_bucket_unique',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.organization_id} {self.day} {self.severity}/{self.status}: +{self.opened} -{self.closed}"
+
+
+class ObservationExport(models.Model):
+    """
+    An export file generated in the background for large downloads. The file
+    is written under ``settings.EXPORT_ROOT`` (outside MEDIA_ROOT) and only
+    served through the tenant-checked download view.
+    """
+    STATUS_CHOICES = [
+        ('PENDING', 'Pending'),
+        ('RUNNING', 'Running'),
+        ('DONE', 'Done'),
+        ('FAILED', 'Failed'),
+    ]
+
+    FORMAT_CHOICES = [
+        ('xlsx', 'Excel'),
+    ]
+
+    organization = models.ForeignKey('core.Organization',
+                                        on_delete=models.CASCADE,
+                                        related_name='observation_exports')
+    requested_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, related_name='observation_exports')
+    format = models.CharField(max_length=10, choices=FORMAT_CHOICES, default='xlsx')
+    filters = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='PENDING')
+    file_path = models.CharField(max_length=255, blank=True)
+    row_count = models.PositiveIntegerField(default=0)
+    error = models.TextField(blank=True)
+    job = models.ForeignKey('core.Job', on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    @property
+    def filename(self):
+        return f"observations-{self.pk}.{self.format}"
+
+    def __str__(self):
+        return f"Export #{self.pk} ({self.get_status_display()})"
+
+
+class ObservationImport(models.Model):
+    """
+    A CSV/Excel file of observations being imported (see
+    observations/imports.py). The upload and the error report are kept under
+    ``settings.IMPORT_ROOT`` and only served through tenant-checked views.
+    """
+    STATUS_CHOICES = [
+        ('PENDING', 'Pending'),
+        ('RUNNING', 'Running'),
+        ('DONE', 'Done'),
+        ('FAILED', 'Failed'),
+    ]
+
+    organization = models.ForeignKey('core.Organization',
+                                        on_delete=models.CASCADE,
+                                        related_name='observation_imports')
+    requested_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, related_name='observation_imports')
+    filename = models.CharField(max_length=255)
+    file_path = models.CharField(max_length=255)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='PENDING')
+    # Data rows read so far; a retried job resumes after them.
+    rows_processed = models.PositiveIntegerField(default=0)
+    imported_count = models.PositiveIntegerField(default=0)
+    error_count = models.PositiveIntegerField(default=0)
+    error_report_path = models.CharField(max_length=255, blank=True)
+    error = models.TextField(blank=True)
+    job = models.ForeignKey('core.Job', on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    @property
+    def error_report_filename(self):
+        return f"import-{self.pk}-errors.csv"
+
+    def __str__(self):
+        return f"Import #{self.pk} {self.filename} ({self.get_status_display()})"
+
+
+class PhotoUpload(models.Model):
+    """
+    A photo uploaded in numbered chunks (see observations/uploads.py), so a
+    dropped connection only costs the missing chunks. Forms reference a
+    complete upload by id instead of carrying the file.
+    """
+    STATUS_CHOICES = [
+        ('UPLOADING', 'Uploading'),
+        ('COMPLETE', 'Complete'),
+        ('USED', 'Used'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    organization = models.ForeignKey('core.Organization',
+                                        on_delete=models.CASCADE,
+                                        related_name='photo_uploads')
+    uploaded_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='photo_uploads')
+    filename = models.CharField(max_length=255)
+    size = models.PositiveBigIntegerField()
+    chunk_size = models.PositiveIntegerField()
+    sha256 = models.CharField(max_length=64, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='UPLOADING')
+    created_at = models.DateTimeField(auto_now_add=True)
+    completed_at = models.DateTimeField(null=True, blank=True)
+
+    @property
+    def total_chunks(self):
+        return max(1, -(-self.size // self.chunk_size))
+
+    def __str__(self):
+        return f"{self.filename} ({self.get_status_display()})"
+
+
+class MediaBlob(models.Model):
+    """
+    A content-addressed photo file and the number of Observation photo
+    fields pointing at it (see observations/storage.py). Blobs at zero are
+    deleted by ``manage.py gc_media``.
+    """
+    path = models.CharField(max_length=255, unique=True)
+    size = models.PositiveBigIntegerField(default=0)
+    ref_count = models.IntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            # gc_media: unreferenced blobs
+            models.Index(fields=['ref_count', 'updated_at'], name='mediablob_gc_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.path} ({self.ref_count} refs)"
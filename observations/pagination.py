@@ -0,0 +1,168 @@
+# observations/pagination.py
+"""
+Keyset (cursor) pagination.
+
+``django.core.paginator.Paginator`` runs a COUNT(*) on every page and then an
+OFFSET, which gets slower the deeper you page. KeysetPaginator instead seeks
+past the last row of the previous page using the ordering columns, so every
+page is a single index range scan of ``per_page + 1`` rows.
+
+Cursors are opaque url-safe strings; a broken or tampered cursor just yields
+the first page, the same way ``Paginator.get_page`` treats bad page numbers.
+"""
+import base64
+import binascii
+import datetime
+import json
+
+from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection
+from django.db.models import Q
+
+NEXT = "n"
+PREVIOUS = "p"
+
+
+class CursorEncoder(DjangoJSONEncoder):
+    # DjangoJSONEncoder rounds datetimes to milliseconds; a cursor has to
+    # round-trip the exact value or rows get skipped or repeated.
+    def default(self, o):
+        if isinstance(o, datetime.datetime):
+            return o.isoformat()
+        return super().default(o)
+
+
+def encode_cursor(values, direction):
+    raw = json.dumps({"v": values, "d": direction}, cls=CursorEncoder, separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    padded = cursor + "=" * (-len(cursor) % 4)
+    data = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    return data["v"], data["d"]
+
+
+def estimate_count(queryset, cap=1000):
+    """
+    Cheap row count for display, as ``(count, is_lower_bound)``. On
+    PostgreSQL this is the planner estimate; elsewhere it is an exact count
+    that stops at ``cap`` (``(cap, True)`` when there are more rows).
+    """
+    queryset = queryset.order_by()
+    if connection.vendor == "postgresql":
+        plan = json.loads(queryset.explain(format="json"))
+        return int(plan[0]["Plan"]["Plan Rows"]), False
+    count = queryset[:cap + 1].count()
+    return min(count, cap), count > cap
+
+
+class KeysetPage:
+    def __init__(self, object_list, next_cursor, previous_cursor, estimated_total=None, estimate_is_capped=False):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+        self.estimated_total = estimated_total
+        self.estimate_is_capped = estimate_is_capped
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+
+class KeysetPaginator:
+    """
+    Paginate ``queryset`` by ``ordering``, a sequence of field names with an
+    optional "-" prefix. The last field must be unique (e.g. "-id") so that
+    the ordering is total.
+    """
+
+    def __init__(self, queryset, ordering=("-id",), per_page=10, estimate_total=False, estimate_cap=1000):
+        self.queryset = queryset
+        self.ordering = tuple(ordering)
+        self.per_page = per_page
+        self.estimate_total = estimate_total
+        self.estimate_cap = estimate_cap
+        self.fields = [name.lstrip("-") for name in self.ordering]
+        self.descending = [name.startswith("-") for name in self.ordering]
+
+    def _reversed_ordering(self):
+        return tuple(name[1:] if name.startswith("-") else f"-{name}" for name in self.ordering)
+
+    def _position(self, obj):
+        if isinstance(obj, dict):
+            # A values() queryset; it must select the ordering fields.
+            return [obj[name] for name in self.fields]
+        return [getattr(obj, name) for name in self.fields]
+
+    def _parse(self, cursor):
+        if not cursor:
+            return None, NEXT
+        try:
+            values, direction = decode_cursor(cursor)
+            if direction not in (NEXT, PREVIOUS) or len(values) != len(self.fields):
+                raise ValueError
+            model = self.queryset.model
+            values = [
+                model._meta.get_field(name).to_python(value)
+                for name, value in zip(self.fields, values)
+            ]
+        except (ValueError, TypeError, KeyError, binascii.Error, ValidationError):
+            return None, NEXT
+        return values, direction
+
+    def _seek(self, values, forward):
+        """
+        Rows strictly after ``values`` in the (possibly reversed) ordering:
+        (a, b) > (x, y)  <=>  a > x OR (a = x AND b > y). The first column
+        also gets a plain inclusive bound so the database can turn the seek
+        into an index range scan.
+        """
+        condition = Q()
+        equal = {}
+        for name, value, descending in zip(self.fields, values, self.descending):
+            lookup = "lt" if descending == forward else "gt"
+            condition |= Q(**equal, **{f"{name}__{lookup}": value})
+            equal[name] = value
+        first = self.fields[0]
+        bound = "lte" if self.descending[0] == forward else "gte"
+        return Q(**{f"{first}__{bound}": values[0]}) & condition
+
+    def get_page(self, cursor=None):
+        values, direction = self._parse(cursor)
+        forward = direction == NEXT
+
+        queryset = self.queryset.order_by(*(self.ordering if forward else self._reversed_ordering()))
+        if values is not None:
+            queryset = queryset.filter(self._seek(values, forward))
+
+        rows = list(queryset[:self.per_page + 1])
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if not forward:
+            rows.reverse()
+
+        next_cursor = previous_cursor = None
+        if rows:
+            first, last = self._position(rows[0]), self._position(rows[-1])
+            if (has_more if forward else values is not None):
+                next_cursor = encode_cursor(last, NEXT)
+            if (values is not None if forward else has_more):
+                previous_cursor = encode_cursor(first, PREVIOUS)
+
+        estimated_total, capped = None, False
+        if self.estimate_total:
+            estimated_total, capped = estimate_count(self.queryset, self.estimate_cap)
+        return KeysetPage(rows, next_cursor, previous_cursor, estimated_total, capped)
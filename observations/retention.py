@@ -0,0 +1,136 @@
+# observations/retention.py
+"""
+Retention: archive closed observations some days after they were closed.
+
+Each organization sets ``archive_closed_after_days`` (empty = never). The
+``observations.archive_closed`` job, and ``manage.py
+archive_closed_observations``, archive the observations that are past it
+in batches of RETENTION_BATCH_SIZE: every batch is the next pk range of
+candidates (found through the partial index ``obs_org_closed_idx``),
+moved to the archive tier (observations/tiers.py) in its own short
+transaction, so writers are never blocked for long however large the
+backlog is.
+"""
+import time
+from dataclasses import dataclass, field
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from core.models import Organization
+
+from . import tiers
+from .models import Observation
+
+RETENTION_BATCH_SIZE = getattr(settings, "RETENTION_BATCH_SIZE", 1000)
+
+# How often the archive_closed job schedules itself again.
+RETENTION_INTERVAL = timedelta(days=1)
+
+
+@dataclass
+class RetentionStats:
+    organizations: int = 0
+    archived: int = 0
+    batches: int = 0
+    seconds: float = 0.0
+    per_organization: dict = field(default_factory=dict)
+
+    @property
+    def rate(self):
+        """Observations archived per second."""
+        return self.archived / self.seconds if self.seconds else 0.0
+
+    def as_dict(self):
+        return {
+            "organizations": self.organizations,
+            "archived": self.archived,
+            "batches": self.batches,
+            "seconds": round(self.seconds, 3),
+            "per_second": round(self.rate, 1),
+        }
+
+
+def candidates(organization_id, cutoff):
+    """Observations of the organization closed before ``cutoff``."""
+    return Observation.objects.filter(
+        organization_id=organization_id,
+        status="CLOSED",
+        date_closed__lt=cutoff,
+    )
+
+
+def due(organization, now=None):
+    """How many observations of ``organization`` its policy would archive now."""
+    if organization.archive_closed_after_days is None:
+        return 0
+    cutoff = (now or timezone.now()) - timedelta(days=organization.archive_closed_after_days)
+    return candidates(organization.pk, cutoff).count()
+
+
+def archive_batch(organization_id, cutoff, after_pk=0, batch_size=RETENTION_BATCH_SIZE):
+    """
+    Archive the next ``batch_size`` candidates with a pk above ``after_pk``.
+    Returns ``(archived, last_pk)``; ``last_pk`` is None when none are left.
+    """
+    pks = list(
+        candidates(organization_id, cutoff)
+        .filter(pk__gt=after_pk)
+        .order_by("pk")
+        .values_list("pk", flat=True)[:batch_size]
+    )
+    if not pks:
+        return 0, None
+
+    batch = candidates(organization_id, cutoff).filter(pk__range=(pks[0], pks[-1]))
+    return tiers.archive(batch, batch_size=batch_size), pks[-1]
+
+
+def archive_organization(organization, batch_size=RETENTION_BATCH_SIZE, now=None, pause=0, progress=None):
+    """
+    Archive every candidate of one organization. Returns ``(archived, batches)``.
+    ``progress(archived)`` is called after each batch.
+    """
+    days = organization.archive_closed_after_days
+    if days is None:
+        return 0, 0
+    cutoff = (now or timezone.now()) - timedelta(days=days)
+
+    archived = batches = 0
+    last_pk = 0
+    while True:
+        count, last_pk = archive_batch(organization.pk, cutoff, last_pk, batch_size)
+        if last_pk is None:
+            break
+        archived += count
+        batches += 1
+        if progress:
+            progress(archived)
+        if pause:
+            time.sleep(pause)
+    return archived, batches
+
+
+def run(organization=None, batch_size=RETENTION_BATCH_SIZE, now=None, pause=0, progress=None):
+    """Apply the retention policy of one or every organization. Returns RetentionStats."""
+    organizations = Organization.objects.filter(archive_closed_after_days__isnull=False).order_by("pk")
+    if organization is not None:
+        organizations = organizations.filter(pk=organization.pk)
+
+    stats = RetentionStats()
+    started = time.monotonic()
+    for org in organizations:
+        archived, batches = archive_organization(
+            org,
+            batch_size=batch_size,
+            now=now,
+            pause=pause,
+            progress=(lambda n, org=org: progress(org, n)) if progress else None,
+        )
+        stats.organizations += 1
+        stats.archived += archived
+        stats.batches += batches
+        stats.per_organization[org.pk] = archived
+    stats.seconds = time.monotonic() - started
+    return stats
@@ -0,0 +1,132 @@
+# observations/rollups.py
+"""
+Incremental maintenance of ObservationDailyRollup.
+
+Every active observation contributes +1 ``opened`` to the bucket of the day it
+was observed and, once closed, +1 ``closed`` to the bucket of the day it was
+closed. A write is applied as the difference between the contributions of the
+row before and after the change, so only the touched buckets are updated.
+
+Code that writes with ``QuerySet.update()`` (which skips model signals) should
+take a ``snapshot()`` of the affected rows before and after and pass both to
+``record_change()``.
+"""
+from collections import Counter
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import Observation, ObservationDailyRollup
+
+SOURCE_FIELDS = (
+    "organization_id",
+    "location_id",
+    "severity",
+    "status",
+    "date_observed",
+    "date_closed",
+)
+
+BUCKET_FIELDS = ("organization_id", "day", "location_id", "severity", "status")
+
+
+def _local_day(value):
+    if timezone.is_aware(value):
+        return timezone.localdate(value)
+    return value.date()
+
+
+def contributions(rows):
+    """
+    Return a Counter of ``(bucket, field) -> n`` for observation rows given as
+    dicts holding SOURCE_FIELDS.
+    """
+    counter = Counter()
+    for row in rows:
+        if row["organization_id"] is None:
+            continue
+        key = (row["organization_id"], row["location_id"], row["severity"], row["status"])
+        if row["date_observed"] is not None:
+            counter[(_local_day(row["date_observed"]),) + key, "opened"] += 1
+        if row["date_closed"] is not None:
+            counter[(_local_day(row["date_closed"]),) + key, "closed"] += 1
+    return counter
+
+
+def instance_row(instance):
+    return {name: getattr(instance, name) for name in SOURCE_FIELDS}
+
+
+def snapshot(queryset):
+    """Contributions of every row in ``queryset``."""
+    return contributions(queryset.values(*SOURCE_FIELDS).order_by())
+
+
+def record_change(before, after):
+    """Apply the difference between two contribution Counters."""
+    delta = Counter(after)
+    delta.subtract(before)
+    apply(delta)
+
+
+def apply(delta):
+    """Add ``delta`` (a contributions Counter, may be negative) to the rollup table."""
+    buckets = {}
+    for (bucket, field), n in delta.items():
+        if n:
+            buckets.setdefault(bucket, {})[field] = n
+
+    for (day, organization_id, location_id, severity, status), changes in buckets.items():
+        lookup = {
+            "organization_id": organization_id,
+            "day": day,
+            "location_id": location_id,
+            "severity": severity,
+            "status": status,
+        }
+        updates = {field: F(field) + n for field, n in changes.items()}
+        if ObservationDailyRollup.objects.filter(**lookup).update(**updates):
+            continue
+        try:
+            with transaction.atomic():
+                ObservationDailyRollup.objects.create(**lookup, **changes)
+        except IntegrityError:
+            # Another writer created the bucket first.
+            ObservationDailyRollup.objects.filter(**lookup).update(**updates)
+
+
+def rebuild(organization=None):
+    """
+    Recompute the rollup table from scratch, for one organization or all of
+    them. Returns the number of buckets written.
+    """
+    observations = Observation.objects.all()
+    rollups = ObservationDailyRollup.objects.all()
+    if organization is not None:
+        observations = observations.filter(organization=organization)
+        rollups = rollups.filter(organization=organization)
+
+    buckets = {}
+    for field, source in (("opened", "date_observed"), ("closed", "date_closed")):
+        rows = (
+            observations
+            .filter(**{f"{source}__isnull": False})
+            .annotate(day=TruncDate(source))
+            .values(*BUCKET_FIELDS)
+            .annotate(n=Count("id"))
+            .order_by()
+        )
+        for row in rows:
+            key = tuple(row[name] for name in BUCKET_FIELDS)
+            buckets.setdefault(key, {"opened": 0, "closed": 0})[field] = row["n"]
+
+    objs = [
+        ObservationDailyRollup(**dict(zip(BUCKET_FIELDS, key)), **counts)
+        for key, counts in buckets.items()
+    ]
+    with transaction.atomic():
+        rollups.delete()
+        ObservationDailyRollup.objects.bulk_create(objs, batch_size=1000)
+    return len(objs)
@@ -0,0 +1,198 @@
+# observations/search.py
+"""
+Full-text search over observations.
+
+Each backend keeps its own index table in sync with Observation writes (see
+observations.signals) and matches prefix queries scoped to one organization,
+as a subquery the list, exports and bulk actions filter on. Matches are not
+ranked: the list pages by date and keeps that order while searching.
+
+* SQLite:     an FTS5 virtual table, ``observations_observation_fts``
+* PostgreSQL: ``observations_observation_search`` with a weighted tsvector
+              column and a GIN index
+* others:     no index, falls back to ``icontains`` filters
+
+The backend is picked from the database vendor; set
+``OBSERVATION_SEARCH_BACKEND`` to a dotted path to override it. Both index
+tables are created by migration 0004; fill them with
+``manage.py rebuild_search_index``.
+"""
+import re
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+from django.utils.module_loading import import_string
+
+from .models import Observation
+
+TERM_RE = re.compile(r"\w+", re.UNICODE)
+
+# Fields indexed for every observation, in index column order.
+DOCUMENT_FIELDS = ("title", "description", "location__name", "observer__email")
+
+
+def search_terms(query):
+    """Split a user query into plain word terms, dropping any operators."""
+    return TERM_RE.findall(query.lower())
+
+
+def _documents(ids):
+    return (
+        Observation.objects
+        .filter(pk__in=ids)
+        .values_list("pk", "organization_id", *DOCUMENT_FIELDS)
+        .order_by()
+    )
+
+
+def _chunks(items, size=500):
+    items = list(items)
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+class BaseSearchBackend:
+    def match_sql(self, organization, terms):
+        """``(sql, params)`` selecting the ids of every observation matching ``terms``."""
+        raise NotImplementedError
+
+    def filter(self, queryset, organization, query):
+        """Restrict ``queryset`` to every observation matching ``query`` (no cap)."""
+        terms = search_terms(query)
+        if not terms:
+            return queryset
+        return queryset.filter(pk__in=RawSQL(*self.match_sql(organization, terms)))
+
+    def index(self, ids):
+        """(Re)index the given observations."""
+
+    def remove(self, ids):
+        """Drop the given observations from the index."""
+
+    def rebuild(self, organization=None):
+        """Reindex every observation (of one organization). Returns the count."""
+        observations = Observation.objects.all()
+        if organization is not None:
+            observations = observations.filter(organization=organization)
+        ids = list(observations.values_list("pk", flat=True))
+        for chunk in _chunks(ids):
+            self.remove(chunk)
+            self.index(chunk)
+        return len(ids)
+
+
+class IContainsSearchBackend(BaseSearchBackend):
+    """Unindexed fallback: case-insensitive substring match on every term."""
+
+    def filter(self, queryset, organization, query):
+        for term in search_terms(query):
+            matches = Q()
+            for field in DOCUMENT_FIELDS:
+                matches |= Q(**{f"{field}__icontains": term})
+            queryset = queryset.filter(matches)
+        return queryset
+
+    def rebuild(self, organization=None):
+        return 0
+
+
+class SQLiteFTS5SearchBackend(BaseSearchBackend):
+    table = "observations_observation_fts"
+
+    @staticmethod
+    def organization_token(organization_id):
+        return f"o{organization_id}"
+
+    def match_expression(self, organization_id, terms):
+        # Every term is a quoted prefix query; the organization is matched as
+        # a token in its own column so the index does the tenant filtering.
+        parts = [f'organization : "{self.organization_token(organization_id)}"']
+        parts += [f'"{term}"*' for term in terms]
+        return " AND ".join(parts)
+
+    def match_sql(self, organization, terms):
+        return (
+            f"SELECT rowid FROM {self.table} WHERE {self.table} MATCH %s",
+            [self.match_expression(organization.pk, terms)],
+        )
+
+    def index(self, ids):
+        rows = [
+            (pk, self.organization_token(org_id), title, description, location or "", observer or "")
+            for pk, org_id, title, description, location, observer in _documents(ids)
+        ]
+        if not rows:
+            return
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f"DELETE FROM {self.table} WHERE rowid = %s", [(row[0],) for row in rows]
+            )
+            cursor.executemany(
+                f"INSERT INTO {self.table} "
+                "(rowid, organization, title, description, location, observer) "
+                "VALUES (%s, %s, %s, %s, %s, %s)",
+                rows,
+            )
+
+    def remove(self, ids):
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f"DELETE FROM {self.table} WHERE rowid = %s", [(pk,) for pk in ids]
+            )
+
+
+class PostgresSearchBackend(BaseSearchBackend):
+    table = "observations_observation_search"
+    config = "simple"
+
+    def tsquery(self, terms):
+        return " & ".join(f"{term}:*" for term in terms)
+
+    def match_sql(self, organization, terms):
+        return (
+            f"SELECT observation_id FROM {self.table} "
+            "WHERE organization_id = %s AND document @@ to_tsquery(%s, %s)",
+            [organization.pk, self.config, self.tsquery(terms)],
+        )
+
+    def index(self, ids):
+        rows = [
+            (pk, org_id, self.config, title, self.config, description,
+             self.config, location or "", self.config, observer or "")
+            for pk, org_id, title, description, location, observer in _documents(ids)
+        ]
+        if not rows:
+            return
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f"INSERT INTO {self.table} (observation_id, organization_id, document) "
+                "VALUES (%s, %s, "
+                "setweight(to_tsvector(%s, %s), 'A') || "
+                "setweight(to_tsvector(%s, %s), 'B') || "
+                "setweight(to_tsvector(%s, %s), 'C') || "
+                "setweight(to_tsvector(%s, %s), 'D')) "
+                "ON CONFLICT (observation_id) DO UPDATE SET "
+                "organization_id = EXCLUDED.organization_id, document = EXCLUDED.document",
+                rows,
+            )
+
+    def remove(self, ids):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"DELETE FROM {self.table} WHERE observation_id = ANY(%s)", [list(ids)]
+            )
+
+
+VENDOR_BACKENDS = {
+    "sqlite": SQLiteFTS5SearchBackend,
+    "postgresql": PostgresSearchBackend,
+}
+
+
+def get_backend():
+    path = getattr(settings, "OBSERVATION_SEARCH_BACKEND", None)
+    if path:
+        return import_string(path)()
+    return VENDOR_BACKENDS.get(connection.vendor, IContainsSearchBackend)()
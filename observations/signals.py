@@ -0,0 +1,192 @@
+# observations/signals.py
+from collections import Counter
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from core import quota
+
+from . import images, rollups, search, storage, sync, tiers
+from .cache import bump_data_version, bump_data_versions
+from .models import ArchivedObservation, Location, Observation
+
+
+@receiver(pre_save, sender=Observation)
+def capture_rollup_state(sender, instance, raw=False, **kwargs):
+    """Remember what the row contributed to the rollups before this save."""
+    if raw or instance.pk is None:
+        instance._rollup_before = Counter()
+        return
+    instance._rollup_before = rollups.snapshot(
+        Observation.objects.filter(pk=instance.pk)
+    )
+
+
+@receiver(post_save, sender=Observation)
+def update_rollups_on_save(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    before = getattr(instance, "_rollup_before", Counter())
+    rollups.record_change(before, rollups.contributions([rollups.instance_row(instance)]))
+    instance._rollup_before = None
+
+
+@receiver(post_delete, sender=Observation)
+def update_rollups_on_delete(sender, instance, **kwargs):
+    if tiers.is_moving():
+        return
+    rollups.record_change(rollups.contributions([rollups.instance_row(instance)]), Counter())
+
+
+@receiver(post_save, sender=Observation)
+@receiver(post_delete, sender=Observation)
+def bump_organization_data_version(sender, instance, raw=False, **kwargs):
+    if raw or instance.organization_id is None or tiers.is_moving():
+        return
+    bump_data_version(instance.organization_id)
+
+
+@receiver(post_save, sender=Location)
+def bump_location_data_versions(sender, instance, created=False, raw=False, **kwargs):
+    """The observations at a location show its name; their ETags must change with it."""
+    if raw or created:
+        return
+    bump_data_versions(instance.observations.values_list("organization_id", flat=True).order_by())
+
+
+@receiver(pre_save, sender=settings.AUTH_USER_MODEL)
+def capture_user_email(sender, instance, raw=False, update_fields=None, **kwargs):
+    if raw or instance.pk is None:
+        instance._email_before = None
+        return
+    if update_fields is not None and "email" not in update_fields:
+        # e.g. the last_login update on every login
+        instance._email_before = instance.email
+        return
+    instance._email_before = sender.objects.filter(pk=instance.pk).values_list("email", flat=True).first()
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+@receiver(post_delete, sender=settings.AUTH_USER_MODEL)
+def bump_user_data_version(sender, instance, raw=False, created=False, **kwargs):
+    """Observations show the email of their observer and assignee."""
+    if raw or created or instance.organization_id is None:
+        return
+    if kwargs["signal"] is post_save and getattr(instance, "_email_before", None) == instance.email:
+        return
+    bump_data_version(instance.organization_id)
+
+
+@receiver(post_save, sender=Observation)
+def index_observation(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    search.get_backend().index([instance.pk])
+
+
+@receiver(post_delete, sender=Observation)
+def unindex_observation(sender, instance, **kwargs):
+    if tiers.is_moving():
+        return
+    search.get_backend().remove([instance.pk])
+
+
+@receiver(post_delete, sender=Observation)
+def bury_observation(sender, instance, **kwargs):
+    if tiers.is_moving():
+        # tiers.archive buries the batch, tiers.restore unburies it.
+        return
+    sync.bury_observations([{"id": instance.pk, "organization_id": instance.organization_id}])
+
+
+@receiver(post_delete, sender=Location)
+def bury_location(sender, instance, **kwargs):
+    sync.bury_location(instance.pk)
+
+
+def _reindex(observations):
+    backend = search.get_backend()
+    ids = list(observations.values_list("pk", flat=True))
+    for start in range(0, len(ids), 500):
+        backend.index(ids[start:start + 500])
+
+
+@receiver(post_save, sender=Location)
+def reindex_location_observations(sender, instance, created=False, raw=False, **kwargs):
+    if raw or created:
+        return
+    _reindex(instance.observations.all())
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def reindex_user_observations(sender, instance, created=False, raw=False, **kwargs):
+    """The observer's email is indexed (search.DOCUMENT_FIELDS)."""
+    if raw or created or getattr(instance, "_email_before", None) == instance.email:
+        return
+    _reindex(Observation.objects.filter(observer=instance))
+
+
+@receiver(post_save, sender=Observation)
+def process_photos(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    images.schedule(instance)
+
+
+@receiver(post_delete, sender=Observation)
+@receiver(post_delete, sender=ArchivedObservation)
+def delete_photo_variants(sender, instance, **kwargs):
+    if tiers.is_moving():
+        # The variants move along with the row.
+        return
+    entries = list((instance.photo_variants or {}).values())
+    transaction.on_commit(lambda: [images.delete_variant_files(entry) for entry in entries])
+
+
+def _photo_paths(observation):
+    return [observation.photo_before.name, observation.photo_after.name]
+
+
+@receiver(pre_save, sender=Observation)
+def capture_photo_refs(sender, instance, raw=False, **kwargs):
+    """Remember which stored photos the row pointed at before this save."""
+    if raw or instance.pk is None:
+        instance._photos_before = []
+        return
+    instance._photos_before = list(
+        Observation.objects.filter(pk=instance.pk).values_list("photo_before", "photo_after").first() or []
+    )
+
+
+@receiver(post_save, sender=Observation)
+def update_photo_refs(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    storage.record_change(getattr(instance, "_photos_before", []), _photo_paths(instance))
+    instance._photos_before = _photo_paths(instance)
+
+
+@receiver(post_delete, sender=Observation)
+@receiver(post_delete, sender=ArchivedObservation)
+def release_photo_refs(sender, instance, **kwargs):
+    if tiers.is_moving():
+        return
+    storage.record_change(_photo_paths(instance), [])
+
+
+@receiver(post_save, sender=Observation)
+def count_observation(sender, instance, created=False, raw=False, **kwargs):
+    if raw or not created or getattr(instance, quota.RESERVED_ATTR, False):
+        return
+    quota.add(instance.organization_id, quota.OBSERVATIONS, 1)
+
+
+@receiver(post_delete, sender=Observation)
+@receiver(post_delete, sender=ArchivedObservation)
+def uncount_observation(sender, instance, **kwargs):
+    # Archived observations still count against the plan.
+    if tiers.is_moving():
+        return
+    quota.add(instance.organization_id, quota.OBSERVATIONS, -1)
@@ -0,0 +1,253 @@
+# observations/storage.py
+"""
+Content-addressed storage for observation photos.
+
+Photos are stored under the SHA-256 of their bytes
+(``observations/blobs/ab/ab12...ef.jpg``), so the same photo uploaded twice
+- resubmitted forms, the same picture used as before and after, re-sent
+field uploads - is kept on disk once.
+
+Because one file can now back several observations, files are never deleted
+directly: every reference held by an observation photo field (active or
+archived, see observations/tiers.py) is counted in a MediaBlob row (see
+observations.signals), and ``manage.py gc_media`` deletes the blobs nobody
+references any more.
+
+Reusing a stored file races with gc_media deleting it. Both go through the
+file's MediaBlob row: an upload touches the row (``hold``) before it relies
+on an existing file, and gc_media locks the row and checks it is still
+unused before deleting. Whichever comes second sees the other's work: the
+upload writes the file again, or gc_media leaves it alone.
+"""
+import hashlib
+import os
+import posixpath
+from collections import Counter
+from datetime import timedelta
+
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+BLOB_ROOT = "observations/blobs"
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    def content_name(self, name, content):
+        digest = hashlib.sha256()
+        for chunk in content.chunks():
+            digest.update(chunk)
+        if hasattr(content, "seek"):
+            content.seek(0)
+        ext = os.path.splitext(name)[1].lower()[:6]
+        hexdigest = digest.hexdigest()
+        return posixpath.join(BLOB_ROOT, hexdigest[:2], f"{hexdigest}{ext}")
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, "chunks"):
+            content = File(content, name)
+        target = self.content_name(name, content)
+        hold(target, content.size)
+        if self.exists(target):
+            return target
+        saved = self._save(target, content)
+        if saved != target:
+            # Another request stored the same content at the same moment and
+            # we got a suffixed name; keep the one content-addressed copy.
+            self.delete(saved)
+        return target
+
+
+_photo_storage = None
+
+
+def photo_storage():
+    """Storage of the Observation photo fields (a callable, so it isn't frozen into migrations)."""
+    global _photo_storage
+    if _photo_storage is None:
+        _photo_storage = ContentAddressedStorage()
+    return _photo_storage
+
+
+# ---------------------------------------------------------------------------
+# Reference counting
+# ---------------------------------------------------------------------------
+
+def acquire(path):
+    """Count one more reference to the blob at ``path``."""
+    from .models import MediaBlob
+
+    now = timezone.now()
+    if MediaBlob.objects.filter(path=path).update(ref_count=F("ref_count") + 1, updated_at=now):
+        return
+    try:
+        size = photo_storage().size(path)
+    except OSError:
+        size = 0
+    try:
+        with transaction.atomic():
+            MediaBlob.objects.create(path=path, size=size, ref_count=1, updated_at=now)
+    except IntegrityError:
+        MediaBlob.objects.filter(path=path).update(ref_count=F("ref_count") + 1, updated_at=now)
+
+
+def hold(path, size=0):
+    """
+    Mark the blob at ``path`` as just used so gc_media leaves it alone for
+    GC_GRACE, creating its row (with no references yet) if there is none.
+    Waits for a gc_media run that has the row locked.
+    """
+    from .models import MediaBlob
+
+    now = timezone.now()
+    if MediaBlob.objects.filter(path=path).update(updated_at=now):
+        return
+    try:
+        with transaction.atomic():
+            MediaBlob.objects.create(path=path, size=size, ref_count=0, updated_at=now)
+    except IntegrityError:
+        MediaBlob.objects.filter(path=path).update(updated_at=now)
+
+
+def release(path):
+    """Drop one reference to the blob at ``path``; unreferenced blobs are left for gc_media."""
+    from .models import MediaBlob
+
+    MediaBlob.objects.filter(path=path, ref_count__gt=0).update(
+        ref_count=F("ref_count") - 1, updated_at=timezone.now()
+    )
+
+
+def record_change(before, after):
+    """Apply the difference between two lists of referenced paths."""
+    before = Counter(path for path in before if path)
+    after = Counter(path for path in after if path)
+    for path, count in (after - before).items():
+        for _ in range(count):
+            acquire(path)
+    for path, count in (before - after).items():
+        for _ in range(count):
+            release(path)
+
+
+# ---------------------------------------------------------------------------
+# Garbage collection (manage.py gc_media)
+# ---------------------------------------------------------------------------
+
+# Leave freshly released blobs alone for a while: the request that released
+# one may still be rolled back, and uploads in flight are not counted yet.
+GC_GRACE = timedelta(hours=24)
+
+# Directories whose files are only kept while an observation references them.
+PHOTO_DIRS = (BLOB_ROOT, "observations/before", "observations/after")
+
+
+def _referenced(paths):
+    """The subset of ``paths`` still used by a photo field of an observation in either tier."""
+    from .models import ArchivedObservation, Observation
+
+    paths = list(paths)
+    referenced = set()
+    for model in (Observation, ArchivedObservation):
+        for field in ("photo_before", "photo_after"):
+            referenced.update(
+                model.objects.filter(**{f"{field}__in": paths}).values_list(field, flat=True)
+            )
+    return referenced
+
+
+def _delete_file(path):
+    try:
+        size = photo_storage().size(path)
+        photo_storage().delete(path)
+    except FileNotFoundError:
+        return 0
+    return size
+
+
+def collect_blobs(grace=GC_GRACE, batch_size=500, dry_run=False, now=None):
+    """
+    Delete the blobs whose reference count has been zero for ``grace``, in
+    batches of ``batch_size``. Each batch is locked and selected again, so
+    blobs acquired or held since are skipped, and checked against the photo
+    fields, so a drifted count can't delete a photo in use.
+    Returns ``(files, bytes)``.
+    """
+    from .models import MediaBlob
+
+    cutoff = (now or timezone.now()) - grace
+    unused = MediaBlob.objects.filter(ref_count__lte=0, updated_at__lt=cutoff)
+    files = reclaimed = 0
+    last_pk = 0
+    while True:
+        pks = list(
+            unused.filter(pk__gt=last_pk).order_by("pk").values_list("pk", flat=True)[:batch_size]
+        )
+        if not pks:
+            return files, reclaimed
+        last_pk = pks[-1]
+        with transaction.atomic():
+            batch = list(unused.select_for_update().filter(pk__in=pks).values_list("pk", "path"))
+            in_use = _referenced(path for _, path in batch)
+            dead = [(pk, path) for pk, path in batch if path not in in_use]
+            for _, path in dead:
+                if dry_run:
+                    try:
+                        reclaimed += photo_storage().size(path)
+                    except OSError:
+                        pass
+                else:
+                    reclaimed += _delete_file(path)
+                files += 1
+            if not dry_run:
+                MediaBlob.objects.filter(pk__in=[pk for pk, _ in dead]).delete()
+
+
+def _walk(directory):
+    storage = photo_storage()
+    try:
+        subdirs, filenames = storage.listdir(directory)
+    except FileNotFoundError:
+        return
+    for filename in filenames:
+        yield posixpath.join(directory, filename)
+    for subdir in subdirs:
+        yield from _walk(posixpath.join(directory, subdir))
+
+
+def collect_orphan_files(grace=GC_GRACE, batch_size=500, dry_run=False, now=None):
+    """
+    Delete photo files that no MediaBlob and no observation knows about:
+    uploads of forms that never saved, and files of observations deleted
+    before reference counting existed. Returns ``(files, bytes)``.
+    """
+    from .models import MediaBlob
+
+    cutoff = (now or timezone.now()) - grace
+    storage = photo_storage()
+    files = reclaimed = 0
+    batch = []
+
+    def flush(batch):
+        nonlocal files, reclaimed
+        known = set(MediaBlob.objects.filter(path__in=batch).values_list("path", flat=True))
+        known |= _referenced(batch)
+        for path in batch:
+            if path in known or storage.get_modified_time(path) >= cutoff:
+                continue
+            reclaimed += storage.size(path) if dry_run else _delete_file(path)
+            files += 1
+
+    for directory in PHOTO_DIRS:
+        for path in _walk(directory):
+            batch.append(path)
+            if len(batch) >= batch_size:
+                flush(batch)
+                batch = []
+    if batch:
+        flush(batch)
+    return files, reclaimed
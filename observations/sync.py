@@ -0,0 +1,217 @@
+# observations/sync.py
+"""
+Offline sync: what changed since a client's cursor, and idempotent uploads.
+
+A field client keeps a copy of its organization's observations and the
+locations, and on reconnect asks for the changes since its last cursor
+instead of downloading everything again. Three streams are read, each in
+(timestamp, id) order so a page is one index range scan:
+
+* observations of the organization by ``updated_at`` (obs_org_updated_idx)
+* locations by ``updated_at``
+* tombstones of deleted or archived rows by ``deleted_at``
+
+The cursor holds the position reached in each stream. Rows newer than
+``now - SYNC_SETTLE`` are left for the next sync: a row's timestamp is
+taken when it is saved, not when its transaction commits, so the newest
+rows may still be invisible to this read and must not be skipped past.
+
+Tombstones (and the idempotency keys of uploads) are purged after
+SYNC_RETENTION; a cursor older than that gets CursorExpired and the client
+starts over with a full sync.
+"""
+import base64
+import hashlib
+import json
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from datetime import timezone as dt_timezone
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import Location, Observation, SyncKey, Tombstone
+from .pagination import CursorEncoder
+
+SYNC_PAGE_SIZE = 500
+# Most items one upload may carry.
+SYNC_BATCH_MAX = 200
+SYNC_SETTLE = timedelta(seconds=getattr(settings, "SYNC_SETTLE_SECONDS", 2))
+SYNC_RETENTION = timedelta(days=getattr(settings, "SYNC_RETENTION_DAYS", 90))
+
+OBSERVATIONS = "o"
+LOCATIONS = "l"
+TOMBSTONES = "t"
+
+
+class CursorExpired(Exception):
+    """The cursor predates the oldest kept tombstones."""
+
+
+@dataclass
+class SyncPage:
+    observations: list = field(default_factory=list)
+    locations: list = field(default_factory=list)
+    deleted_observations: list = field(default_factory=list)
+    deleted_locations: list = field(default_factory=list)
+    cursor: str = ""
+    more: bool = False
+
+
+def encode_cursor(positions):
+    raw = json.dumps(positions, cls=CursorEncoder, separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    """The stream positions of ``cursor``; ValueError if it is malformed."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        data = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        positions = {}
+        for stream in (OBSERVATIONS, LOCATIONS, TOMBSTONES):
+            stamp, pk = data[stream]
+            stamp = parse_datetime(stamp)
+            if stamp is None:
+                raise ValueError
+            positions[stream] = (stamp, int(pk))
+        return positions
+    except (KeyError, TypeError, ValueError, UnicodeDecodeError, json.JSONDecodeError) as e:
+        raise ValueError("Invalid sync cursor.") from e
+
+
+def _after(queryset, stamp_field, position, horizon, limit):
+    """Up to ``limit`` rows of ``queryset`` after ``position``, plus whether there are more."""
+    stamp, pk = position
+    rows = list(
+        queryset
+        .filter(Q(**{f"{stamp_field}__gt": stamp}) | Q(**{stamp_field: stamp, "id__gt": pk}))
+        .filter(**{f"{stamp_field}__lte": horizon})
+        .order_by(stamp_field, "id")[:limit + 1]
+    )
+    more = len(rows) > limit
+    rows = rows[:limit]
+    if rows:
+        last = rows[-1]
+        position = (last[stamp_field], last["id"])
+    if not more:
+        # Everything up to the horizon has been seen; moving the position up
+        # keeps a quiet stream from making the cursor look expired.
+        position = max(position, (horizon, 0))
+    return rows, position, more
+
+
+def changes(organization, cursor=None, limit=SYNC_PAGE_SIZE,
+            observation_fields=("id",), location_fields=("id",), now=None):
+    """
+    One page of what changed for ``organization`` since ``cursor`` (None for
+    a full sync), as a SyncPage of ``values()`` rows with the given fields.
+    Keep calling with ``page.cursor`` while ``page.more``.
+    """
+    now = now or timezone.now()
+    horizon = now - SYNC_SETTLE
+    start = datetime.min.replace(tzinfo=dt_timezone.utc)
+    if cursor:
+        positions = decode_cursor(cursor)
+        if positions[TOMBSTONES][0] < now - SYNC_RETENTION:
+            raise CursorExpired()
+    else:
+        # A full sync has nothing to delete; tombstones from now on matter.
+        positions = {OBSERVATIONS: (start, 0), LOCATIONS: (start, 0), TOMBSTONES: (horizon, 0)}
+
+    page = SyncPage()
+    page.observations, positions[OBSERVATIONS], more_observations = _after(
+        Observation.objects.for_organization(organization)
+        .values("updated_at", *(set(observation_fields) - {"updated_at"})),
+        "updated_at", positions[OBSERVATIONS], horizon, limit,
+    )
+    page.locations, positions[LOCATIONS], more_locations = _after(
+        Location.objects.values("updated_at", *(set(location_fields) - {"updated_at"})),
+        "updated_at", positions[LOCATIONS], horizon, limit,
+    )
+    tombstones, positions[TOMBSTONES], more_tombstones = _after(
+        Tombstone.objects.filter(
+            Q(model=Tombstone.OBSERVATION, organization=organization)
+            | Q(model=Tombstone.LOCATION, organization__isnull=True)
+        ).values("id", "model", "object_id", "deleted_at"),
+        "deleted_at", positions[TOMBSTONES], horizon, limit,
+    )
+    for tombstone in tombstones:
+        if tombstone["model"] == Tombstone.OBSERVATION:
+            page.deleted_observations.append(tombstone["object_id"])
+        else:
+            page.deleted_locations.append(tombstone["object_id"])
+
+    page.cursor = encode_cursor(positions)
+    page.more = more_observations or more_locations or more_tombstones
+    return page
+
+
+# ---------------------------------------------------------------------------
+# Tombstones
+# ---------------------------------------------------------------------------
+
+def bury_observations(rows, deleted_at=None):
+    """Record tombstones for observation rows (dicts with id and organization_id)."""
+    deleted_at = deleted_at or timezone.now()
+    Tombstone.objects.bulk_create(
+        Tombstone(
+            model=Tombstone.OBSERVATION,
+            object_id=row["id"],
+            organization_id=row["organization_id"],
+            deleted_at=deleted_at,
+        )
+        for row in rows
+    )
+
+
+def bury_location(location_id):
+    Tombstone.objects.create(model=Tombstone.LOCATION, object_id=location_id)
+
+
+def unbury_observations(ids):
+    """Forget the tombstones of observations that exist again (restored)."""
+    Tombstone.objects.filter(model=Tombstone.OBSERVATION, object_id__in=list(ids)).delete()
+
+
+def purge(older_than=SYNC_RETENTION, now=None):
+    """Delete tombstones and upload keys older than ``older_than``. Returns the number deleted."""
+    cutoff = (now or timezone.now()) - older_than
+    tombstones, _ = Tombstone.objects.filter(deleted_at__lt=cutoff).delete()
+    keys, _ = SyncKey.objects.filter(created_at__lt=cutoff).delete()
+    return tombstones + keys
+
+
+# ---------------------------------------------------------------------------
+# Upload idempotency
+# ---------------------------------------------------------------------------
+
+def fingerprint(item):
+    """Hash of an upload item without its key: the same retry has the same one."""
+    data = {name: value for name, value in item.items() if name != "key"}
+    return hashlib.sha256(
+        json.dumps(data, sort_keys=True, cls=CursorEncoder, separators=(",", ":")).encode()
+    ).hexdigest()
+
+
+def seen_keys(organization, keys):
+    """The SyncKeys of ``organization`` among ``keys``, by key."""
+    return {
+        sync_key.key: sync_key
+        for sync_key in SyncKey.objects.filter(organization=organization, key__in=list(keys))
+    }
+
+
+def remember(organization, key, item, observation_id):
+    """
+    Record that ``key`` was applied. Raises IntegrityError if another upload
+    recorded it first; call it in a savepoint with the change it records.
+    """
+    return SyncKey.objects.create(
+        organization=organization,
+        key=key,
+        fingerprint=fingerprint(item),
+        observation_id=observation_id,
+    )
@@ -0,0 +1,60 @@
+# observations/tasks.py
+from django.utils import timezone
+
+from core.jobs import enqueue, job
+from core.models import Job
+
+from . import retention
+from .exports import fail_export, run_export
+from .imports import fail_import, run_import
+from .images import process_observation
+
+
+def _export_failed(job, exc):
+    fail_export(job.payload["export_id"], str(exc))
+
+
+@job("observations.export_xlsx", concurrency=2, max_attempts=3, backoff=30, on_failure=_export_failed)
+def export_xlsx(job):
+    rows = run_export(job.payload["export_id"], progress=job.set_progress, job_id=job.pk)
+    return {"rows": rows}
+
+
+def _import_failed(job, exc):
+    fail_import(job.payload["import_id"], str(exc))
+
+
+@job("observations.import_file", concurrency=2, max_attempts=3, backoff=30, on_failure=_import_failed)
+def import_file(job):
+    rows = run_import(job.payload["import_id"], progress=job.set_progress, job_id=job.pk)
+    return {"rows": rows}
+
+
+@job("observations.photo_variants", concurrency=2, max_attempts=3, backoff=30)
+def photo_variants(job):
+    return {"fields": process_observation(job.payload["observation_id"])}
+
+
+ARCHIVE_CLOSED = "observations.archive_closed"
+
+
+def schedule_archive_closed(run_after=None):
+    """Queue the retention job unless one is already waiting. Returns the Job or None."""
+    if Job.objects.filter(name=ARCHIVE_CLOSED, status=Job.STATUS_QUEUED).exists():
+        return None
+    return enqueue(ARCHIVE_CLOSED, run_after=run_after)
+
+
+def _archive_closed_failed(job, exc):
+    # Out of retries: keep the daily schedule going anyway.
+    schedule_archive_closed(run_after=timezone.now() + retention.RETENTION_INTERVAL)
+
+
+@job(ARCHIVE_CLOSED, concurrency=1, max_attempts=3, backoff=300, on_failure=_archive_closed_failed)
+def archive_closed(job):
+    """Apply every organization's retention policy, then run again tomorrow."""
+    stats = retention.run(progress=lambda organization, archived: job.set_progress(
+        job.progress, f"{organization}: {archived} archived"
+    ))
+    schedule_archive_closed(run_after=timezone.now() + retention.RETENTION_INTERVAL)
+    return stats.as_dict()
@@ -0,0 +1,70 @@
+# observations/templatetags/photos.py
+from django import template
+from django.core.files.storage import default_storage
+from django.forms.utils import flatatt
+from django.utils.html import format_html
+
+from observations.images import VARIANTS, is_current, largest
+
+register = template.Library()
+
+
+def _srcset(entry, fmt):
+    return ", ".join(
+        f"{default_storage.url(entry[name][fmt])} {entry[name]['width']}w"
+        for name in VARIANTS
+        if fmt in entry.get(name, {})
+    )
+
+
+@register.simple_tag
+def photo(observation, field, size="thumb", sizes=None, **attrs):
+    """
+    Render an observation photo as a <picture> with WebP and JPEG srcsets of
+    its resized variants, so the browser downloads the smallest one that
+    fits. ``size`` is the variant used for ``src``; ``sizes`` defaults to its
+    width. Extra keyword arguments become <img> attributes:
+
+        {% photo object "photo_before" sizes="200px" class="img-thumbnail" alt="before" %}
+
+    Falls back to the original upload until the variants have been built.
+    """
+    image = getattr(observation, field)
+    if not image:
+        return ""
+    attrs.setdefault("loading", "lazy")
+    entry = (observation.photo_variants or {}).get(field) or {}
+    if not is_current(observation, field) or size not in entry:
+        return format_html("<img src=\"{}\"{}>", image.url, flatatt(attrs))
+
+    variant = entry[size]
+    sizes = sizes or f"{variant['width']}px"
+    img = format_html(
+        "<img src=\"{}\" srcset=\"{}\" sizes=\"{}\" width=\"{}\" height=\"{}\"{}>",
+        default_storage.url(variant["jpeg"]),
+        _srcset(entry, "jpeg"),
+        sizes,
+        variant["width"],
+        variant["height"],
+        flatatt(attrs),
+    )
+    if "webp" not in variant:
+        return img
+    return format_html(
+        "<picture><source type=\"image/webp\" srcset=\"{}\" sizes=\"{}\">{}</picture>",
+        _srcset(entry, "webp"),
+        sizes,
+        img,
+    )
+
+
+@register.simple_tag
+def photo_full_url(observation, field):
+    """
+    URL of the full-size rendition of an observation photo, for "open
+    original" links. It is the largest variant, not the upload: that one still
+    has its EXIF data (GPS position, device). Empty until the variants have
+    been built.
+    """
+    variant = largest(observation, field)
+    return default_storage.url(variant["jpeg"]) if variant else ""
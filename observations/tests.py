@@ -1,3 +1,1177 @@
-from django.test import TestCase
+import csv
+import io
+import json
+import os
+import shutil
+import tempfile
+from datetime import date, datetime, timedelta
+from datetime import timezone as dt_timezone
+from unittest import mock, skipUnless
 
-# Create your tests here.
+import openpyxl
+from PIL import ExifTags
+from PIL import Image as PILImage
+from PIL import features as PILFeatures
+
+from django.conf import settings
+from django.contrib.messages import get_messages
+from django.core.exceptions import PermissionDenied
+from django.core.cache import caches
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from core import jobs, quota
+from core.api import create_token
+from core.models import Job, Organization, Plan, Subscription
+from observations import (
+    analytics,
+    bulk,
+    cache,
+    images,
+    imports,
+    retention,
+    rollups,
+    search,
+    storage,
+    sync,
+    tasks,
+    tiers,
+    uploads,
+)
+from observations.models import (
+    ArchivedObservation,
+    Location,
+    MediaBlob,
+    Observation,
+    ObservationDailyRollup,
+    ObservationExport,
+    ObservationImport,
+    PhotoUpload,
+)
+from observations.pagination import KeysetPaginator, encode_cursor
+from observations.templatetags.photos import photo_full_url
+from observations.exports import (
+    EXPORT_FIELDS,
+    export_queryset,
+    export_rows,
+    filter_observations,
+    run_export,
+    submit_export,
+)
+from users.models import CustomUser
+
+
+# The file-based dashboard cache would outlive the test database.
+LOCMEM_DASHBOARD_CACHES = {
+    **settings.CACHES,
+    "dashboard": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": "dashboard-tests"},
+}
+
+
+class QueryPlanTests(TestCase):
+    """
+    Runs EXPLAIN on the queries behind the hot pages and fails if any of them
+    falls back to a full scan of a table that should be reached via an index.
+
+    On PostgreSQL sequential scans are disabled for the duration of the
+    EXPLAIN, so a "Seq Scan" in the plan means no usable index exists (with
+    the empty test tables the planner would otherwise always pick one).
+    """
+
+    INDEXED_TABLES = {
+        "observations_observation",
+        "observations_archivedobservation",
+        "observations_observationdailyrollup",
+    }
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.org = Organization.objects.create(name="Acme", domain="acme.test")
+
+    def plan_scans(self, queryset):
+        """Return (table, scan description) for every full table scan in the plan."""
+        vendor = connection.vendor
+        if vendor == "sqlite":
+            scans = []
+            for line in queryset.explain().splitlines():
+                detail = line.split(" ", 3)[-1].strip()
+                if not detail.startswith("SCAN "):
+                    continue
+                table = detail.split()[1]
+                if "USING" not in detail:
+                    scans.append((table, detail))
+            return scans
+        if vendor == "postgresql":
+            with connection.cursor() as cursor:
+                cursor.execute("SET LOCAL enable_seqscan = off")
+            plan = json.loads(queryset.explain(format="json"))
+            scans = []
+            stack = [plan[0]["Plan"]]
+            while stack:
+                node = stack.pop()
+                if node["Node Type"] == "Seq Scan":
+                    scans.append((node["Relation Name"], "Seq Scan"))
+                stack.extend(node.get("Plans", []))
+            return scans
+        self.skipTest(f"No query plan checks for {vendor}")
+
+    def assertUsesIndexes(self, queryset):
+        scans = [
+            (table, detail) for table, detail in self.plan_scans(queryset)
+            if table in self.INDEXED_TABLES
+        ]
+        self.assertEqual(scans, [], f"Full table scan in plan for:\n{queryset.query}")
+
+    def test_observation_list(self):
+        self.assertUsesIndexes(
+            Observation.objects.for_organization(self.org)
+            .select_related("location", "observer", "assigned_to")
+            .order_by("-date_observed")
+        )
+
+    def test_observation_list_deep_page(self):
+        # A keyset page seeks past the previous page instead of OFFSET-ing.
+        paginator = KeysetPaginator(
+            Observation.objects.for_organization(self.org),
+            ordering=("-date_observed", "-id"),
+        )
+        values, direction = paginator._parse(encode_cursor(["2024-01-01T00:00:00+00:00", 500], "n"))
+        self.assertUsesIndexes(
+            paginator.queryset.order_by(*paginator.ordering).filter(paginator._seek(values, True))
+        )
+
+    def test_archived_observations_list(self):
+        self.assertUsesIndexes(
+            ArchivedObservation.objects.filter(organization=self.org)
+            .select_related("location")
+            .order_by("-id")
+        )
+
+    def test_dashboard(self):
+        self.assertUsesIndexes(analytics.overdue_queryset(self.org, date.today()))
+        self.assertUsesIndexes(analytics.people_queryset(self.org))
+        for trend in analytics.TREND_CHOICES:
+            self.assertUsesIndexes(analytics.activity_queryset(self.org, trend))
+
+    def test_exports(self):
+        self.assertUsesIndexes(export_queryset(self.org).values_list(*EXPORT_FIELDS))
+
+
+class PeopleStatsTests(TestCase):
+    def test_archived_observations_still_count(self):
+        org = Organization.objects.create(name="Acme", domain="acme.test")
+        observer = CustomUser.objects.create_user("obs@acme.test", "pw", organization=org)
+        location = Location.objects.create(name="Yard")
+        for status in ("OPEN", "CLOSED", "CLOSED"):
+            Observation.objects.create(
+                organization=org, location=location, title="Spill", description="",
+                observer=observer, status=status,
+            )
+        tiers.archive(Observation.objects.filter(status="CLOSED"))
+
+        stats = analytics.compute_dashboard_stats(org)
+        self.assertEqual(dict(zip(stats.observers.labels, stats.observers.values)), {"obs@acme.test": 3})
+
+
+
+
+def noon(day):
+    return datetime.combine(day, datetime.min.time().replace(hour=12), tzinfo=dt_timezone.utc)
+
+
+class DashboardStatsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.org = Organization.objects.create(name="Acme", domain="acme.test")
+        cls.other = Organization.objects.create(name="Other", domain="other.test")
+        ann = CustomUser.objects.create_user("ann@acme.test", "pw", organization=cls.org)
+        bob = CustomUser.objects.create_user("bob@acme.test", "pw", organization=cls.org)
+        cat = CustomUser.objects.create_user("cat@acme.test", "pw", organization=cls.org)
+        location = Location.objects.create(name="Yard")
+        rows = [
+            # observed, severity, status, observer, owner, target, closed
+            (date(2024, 1, 10), "HIGH", "OPEN", ann, None, date(2024, 2, 1), None),
+            (date(2024, 1, 20), "LOW", "IN_PROGRESS", ann, bob, date(2024, 4, 1), None),
+            (date(2024, 2, 5), "MEDIUM", "CLOSED", cat, bob, date(2024, 2, 1), date(2024, 2, 10)),
+            (date(2024, 2, 6), "HIGH", "AWAITING_VERIFICATION", cat, None, date(2024, 2, 20), None),
+        ]
+        for observed, severity, status, observer, owner, target, closed in rows:
+            Observation.objects.create(
+                organization=cls.org, location=location, title="Spill", description="",
+                date_observed=noon(observed), severity=severity, status=status, observer=observer,
+                assigned_to=owner, target_date=target, date_closed=closed and noon(closed),
+            )
+        Observation.objects.create(
+            organization=cls.other, location=location, title="Elsewhere", description="",
+            date_observed=noon(date(2024, 1, 10)), target_date=date(2024, 1, 11),
+        )
+        cls.today = date(2024, 3, 1)
+
+    def test_kpis_and_breakdowns(self):
+        stats = analytics.compute_dashboard_stats(self.org, "monthly", self.today)
+        self.assertEqual((stats.total, stats.open, stats.closed, stats.overdue), (4, 2, 1, 2))
+        self.assertEqual(stats.trend_series, analytics.Series(["2024-01-01", "2024-02-01"], [2, 2]))
+        self.assertEqual(stats.severity, analytics.Series(["HIGH", "LOW", "MEDIUM"], [2, 1, 1]))
+        self.assertEqual(
+            stats.status,
+            analytics.Series(["AWAITING_VERIFICATION", "CLOSED", "IN_PROGRESS", "OPEN"], [1, 1, 1, 1]),
+        )
+        self.assertEqual(dict(zip(stats.observers.labels, stats.observers.values)),
+                         {"ann@acme.test": 2, "cat@acme.test": 2})
+        self.assertEqual(stats.owners, analytics.Series(["bob@acme.test"], [2]))
+        self.assertEqual(stats.managers, analytics.Series(["bob@acme.test"], [1]))
+
+    def test_weekly_trend(self):
+        stats = analytics.compute_dashboard_stats(self.org, "weekly", self.today)
+        self.assertEqual(
+            stats.trend_series,
+            analytics.Series(["2024-01-08", "2024-01-15", "2024-02-05"], [1, 1, 2]),
+        )
+
+    def test_unknown_trend_falls_back_to_monthly(self):
+        self.assertEqual(analytics.compute_dashboard_stats(self.org, "hourly", self.today).trend, "monthly")
+
+    def test_empty_organization(self):
+        empty = Organization.objects.create(name="Empty", domain="empty.test")
+        stats = analytics.compute_dashboard_stats(empty, today=self.today)
+        self.assertEqual((stats.total, stats.open, stats.closed, stats.overdue), (0, 0, 0, 0))
+        self.assertEqual(stats.trend_series, analytics.Series())
+
+
+@override_settings(CACHES=LOCMEM_DASHBOARD_CACHES)
+class DashboardChartDataTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.org = Organization.objects.create(name="Acme", domain="acme.test")
+        cls.other = Organization.objects.create(name="Other", domain="other.test")
+        cls.user = CustomUser.objects.create_user("ann@acme.test", "pw", organization=cls.org)
+        location = Location.objects.create(name="Yard")
+        for org, count in ((cls.org, 2), (cls.other, 3)):
+            for i in range(count):
+                Observation.objects.create(organization=org, location=location, title="Spill", description="")
+
+    def setUp(self):
+        self.addCleanup(caches[cache.DASHBOARD_CACHE_ALIAS].clear)
+
+    def get(self, **params):
+        return self.client.get(reverse("observations:dashboard_chart_data"), params)
+
+    def test_payload(self):
+        self.client.force_login(self.user)
+        response = self.get(trend="weekly")
+        self.assertEqual(response.status_code, 200)
+        payload = response.json()
+        self.assertEqual(payload["trend"], "weekly")
+        self.assertEqual(payload["kpis"], {"total": 2, "open": 2, "closed": 0, "overdue": 0})
+        self.assertEqual(
+            set(payload["charts"]), {"trend", "severity", "status", "observers", "owners", "managers"}
+        )
+        for chart in payload["charts"].values():
+            self.assertEqual(set(chart), {"data", "layout"})
+        self.assertEqual(payload["charts"]["status"]["data"][0]["values"], [2])
+
+    def test_scoped_to_the_organization_of_the_user(self):
+        other_user = CustomUser.objects.create_user("otto@other.test", "pw", organization=self.other)
+        self.client.force_login(other_user)
+        self.assertEqual(self.get().json()["kpis"]["total"], 3)
+        self.client.force_login(self.user)
+        self.assertEqual(self.get().json()["kpis"]["total"], 2)
+
+    def test_requires_an_organization(self):
+        self.assertEqual(self.get().status_code, 302)
+        self.client.force_login(CustomUser.objects.create_user("nobody@example.test", "pw"))
+        self.assertEqual(self.get().status_code, 403)
+
+class RollupTests(TestCase):
+    """The incrementally maintained rollups must match a rebuild from scratch."""
+
+    def setUp(self):
+        self.org = Organization.objects.create(name="Acme", domain="acme.test")
+        self.other = Organization.objects.create(name="Other", domain="other.test")
+        self.yard = Location.objects.create(name="Yard")
+        self.dock = Location.objects.create(name="Dock")
+        self.manager = CustomUser.objects.create_user(
+            "manager@acme.test", "pw", organization=self.org, is_manager=True
+        )
+
+    def observation(self, org=None, days_ago=0, **fields):
+        fields.setdefault("location", self.yard)
+        return Observation.objects.create(
+            organization=org or self.org, title="Spill", description="",
+            date_observed=timezone.now() - timedelta(days=days_ago), **fields,
+        )
+
+    def rollup_rows(self):
+        return sorted(
+            ObservationDailyRollup.objects.exclude(opened=0, closed=0).values_list(
+                "organization_id", "day", "location_id", "severity", "status", "opened", "closed"
+            )
+        )
+
+    def assertMatchesRebuild(self):
+        incremental = self.rollup_rows()
+        rollups.rebuild()
+        self.assertEqual(incremental, self.rollup_rows())
+        self.assertTrue(incremental)
+
+    def test_create(self):
+        self.observation(severity="HIGH")
+        self.observation(days_ago=3, location=self.dock)
+        self.observation(org=self.other, days_ago=1)
+        self.assertMatchesRebuild()
+
+    def test_status_change_and_close(self):
+        moving = self.observation(days_ago=2)
+        moving.status = "IN_PROGRESS"
+        moving.save()
+        moving.location = self.dock
+        moving.save(update_fields=["location"])
+        closing = self.observation(days_ago=5, severity="MEDIUM")
+        closing.close()
+        self.assertMatchesRebuild()
+
+    def test_delete(self):
+        self.observation(days_ago=1)
+        doomed = self.observation(days_ago=1)
+        doomed.close()
+        doomed.delete()
+        self.assertMatchesRebuild()
+
+    def test_bulk_action(self):
+        for days_ago in range(3):
+            self.observation(days_ago=days_ago, status="AWAITING_VERIFICATION")
+        self.manager.is_safety_manager = True
+        bulk.perform(self.org, self.manager, bulk.CLOSE, Observation.objects.all())
+        self.assertMatchesRebuild()
+
+    def test_archive_and_restore(self):
+        self.observation()
+        for days_ago in (1, 2, 4):
+            self.observation(days_ago=days_ago).close()
+        tiers.archive(Observation.objects.filter(status="CLOSED"))
+        self.assertMatchesRebuild()
+
+        tiers.restore(ArchivedObservation.objects.filter(date_observed__lt=timezone.now() - timedelta(days=3)))
+        self.assertEqual(Observation.objects.count(), 2)
+        self.assertMatchesRebuild()
+
+        bulk.perform(self.org, self.manager, bulk.ARCHIVE, Observation.objects.all())
+        self.assertMatchesRebuild()
+
+
+@override_settings(CACHES=LOCMEM_DASHBOARD_CACHES)
+class DashboardCacheTests(TestCase):
+    def setUp(self):
+        self.org = Organization.objects.create(name="Acme", domain="acme.test")
+        self.manager = CustomUser.objects.create_user(
+            "boss@acme.test", "pw", organization=self.org, is_manager=True
+        )
+        self.location = Location.objects.create(name="Yard")
+        self.spill = Observation.objects.create(
+            organization=self.org, location=self.location, title="Spill", description="",
+        )
+        self.addCleanup(caches[cache.DASHBOARD_CACHE_ALIAS].clear)
+
+    def version(self):
+        return cache.current_data_version(self.org.pk)
+
+    def payload(self):
+        with mock.patch.object(cache, "compute_dashboard_stats", wraps=cache.compute_dashboard_stats) as compute:
+            payload = cache.get_dashboard_payload(self.org, "monthly")
+        return payload, compute.called
+
+    def assertInvalidatedBy(self, write):
+        self.payload()
+        self.assertFalse(self.payload()[1])  # cached
+        version = self.version()
+        write()
+        self.assertGreater(self.version(), version)
+        payload, computed = self.payload()
+        self.assertTrue(computed)
+        return payload
+
+    def test_save(self):
+        def close():
+            self.spill.close()
+        payload = self.assertInvalidatedBy(close)
+        self.assertEqual(payload["kpis"]["closed"], 1)
+
+    def test_bulk_action(self):
+        def assign():
+            self.client.force_login(self.manager)
+            self.client.post(reverse("observations:bulk_action"), {
+                "ids": [self.spill.pk], "action": bulk.ASSIGN, "assigned_to": self.manager.pk,
+            })
+        payload = self.assertInvalidatedBy(assign)
+        self.assertEqual(Observation.objects.get().assigned_to, self.manager)
+        self.assertEqual(payload["charts"]["owners"]["data"][0]["x"], ["boss@acme.test"])
+
+    def test_location_rename(self):
+        def rename():
+            self.location.name = "Back yard"
+            self.location.save()
+        self.assertInvalidatedBy(rename)
+
+    def test_other_organizations_keep_their_cache(self):
+        other = Organization.objects.create(name="Other", domain="other.test")
+        version = cache.current_data_version(other.pk)
+        self.spill.close()
+        self.assertEqual(cache.current_data_version(other.pk), version)
+
+class SearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.org = Organization.objects.create(name="Acme", domain="acme.test")
+        cls.other = Organization.objects.create(name="Other", domain="other.test")
+        location = Location.objects.create(name="Pump house")
+        for org in (cls.org, cls.other):
+            for i in range(5):
+                Observation.objects.create(
+                    organization=org, location=location, title=f"Oil leak {i}", description="drip"
+                )
+        Observation.objects.create(organization=cls.org, location=location, title="Loose cable", description="")
+
+    def test_filter_is_not_capped(self):
+        backend = search.get_backend()
+        queryset = Observation.objects.for_organization(self.org)
+        matches = backend.filter(queryset, self.org, "leak")
+        self.assertEqual(matches.count(), 5)
+        self.assertEqual(backend.filter(queryset, self.org, "cab").get().title, "Loose cable")
+
+    def test_observer_email_change_is_reindexed(self):
+        observer = CustomUser.objects.create_user("ann@acme.test", "pw", organization=self.org)
+        Observation.objects.create(
+            organization=self.org, location=Location.objects.get(), title="Trip hazard", description="",
+            observer=observer,
+        )
+        queryset = Observation.objects.for_organization(self.org)
+        backend = search.get_backend()
+        self.assertEqual(backend.filter(queryset, self.org, "ann").get().title, "Trip hazard")
+
+        observer.email = "bea@acme.test"
+        observer.save()
+        self.assertFalse(backend.filter(queryset, self.org, "ann").exists())
+        self.assertEqual(backend.filter(queryset, self.org, "bea").get().title, "Trip hazard")
+
+    def test_filter_is_scoped_to_the_organization(self):
+        matches = search.get_backend().filter(Observation.objects.all(), self.org, "oil")
+        self.assertEqual(set(matches.values_list("organization_id", flat=True)), {self.org.pk})
+
+    @skipUnless(connection.vendor == "postgresql", "PostgreSQL search backend")
+    def test_postgres_backend(self):
+        backend = search.PostgresSearchBackend()
+        backend.rebuild()
+        queryset = Observation.objects.for_organization(self.org)
+        self.assertEqual(backend.filter(queryset, self.org, "lea").count(), 5)
+        self.assertEqual(backend.filter(queryset, self.org, "nothing").count(), 0)
+
+
+class ExportSearchTests(TestCase):
+    def test_export_gets_every_search_match(self):
+        org = Organization.objects.create(name="Acme", domain="acme.test")
+        location = Location.objects.create(name="Yard")
+        for i in range(30):
+            Observation.objects.create(organization=org, location=location, title=f"Spill {i}", description="")
+        Observation.objects.create(organization=org, location=location, title="Ladder", description="")
+        rows = list(export_rows(filter_observations(export_queryset(org), org, {"q": "spill"})))
+        self.assertEqual(len(rows), 30)
+
+
+class ApiTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.org = Organization.objects.create(name="Acme", domain="acme.test")
+        cls.user = CustomUser.objects.create_user(
+            "admin@acme.test", "pw", organization=cls.org, is_superuser=True
+        )
+        cls.location = Location.objects.create(name="Yard")
+        cls.observation = Observation.objects.create(
+            organization=cls.org, location=cls.location, title="Spill", description="",
+            assigned_to=cls.user,
+        )
+
+    def setUp(self):
+        _, key = create_token(self.user, "test")
+        self.auth = {"HTTP_AUTHORIZATION": f"Bearer {key}"}
+
+    def get(self, url, **headers):
+        return self.client.get(url, **self.auth, **headers)
+
+    def test_assigned_to_must_be_an_id(self):
+        response = self.get("/api/v1/observations/?assigned_to=me")
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("assigned_to", response.json()["error"])
+        response = self.get(f"/api/v1/observations/?assigned_to={self.user.pk}")
+        self.assertEqual(len(response.json()["results"]), 1)
+
+    def test_delete_has_no_body(self):
+        response = self.client.delete(f"/api/v1/observations/{self.observation.pk}/", **self.auth)
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(response.content, b"")
+        self.assertFalse(Observation.objects.filter(pk=self.observation.pk).exists())
+
+    def test_etag_changes_when_shown_names_change(self):
+        url = "/api/v1/observations/?fields=id,location_name,assigned_to_email"
+        etag = self.get(url)["ETag"]
+        self.assertEqual(self.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        self.location.name = "Loading yard"
+        self.location.save()
+        response = self.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["results"][0]["location_name"], "Loading yard")
+
+        etag = response["ETag"]
+        self.user.last_login = timezone.now()
+        self.user.save(update_fields=["last_login"])
+        self.assertEqual(self.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.user.email = "boss@acme.test"
+        self.user.save()
+        response = self.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["results"][0]["assigned_to_email"], "boss@acme.test")
+
+
+class SyncTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.org = Organization.objects.create(name="Acme", domain="acme.test")
+        plan = Plan.objects.create(name="Pro", price_monthly=10, max_users=10, max_observations=100)
+        Subscription.objects.create(organization=cls.org, plan=plan)
+        cls.user = CustomUser.objects.create_user(
+            "manager@acme.test", "pw", organization=cls.org, is_manager=True
+        )
+        cls.location = Location.objects.create(name="Yard")
+
+    def setUp(self):
+        _, key = create_token(self.user, "test")
+        self.auth = {"HTTP_AUTHORIZATION": f"Bearer {key}"}
+
+    def observation(self, title="Spill"):
+        return Observation.objects.create(
+            organization=self.org, location=self.location, title=title, description=""
+        )
+
+    def later(self):
+        # Past the settle delay, so rows written by the test are visible.
+        return timezone.now() + sync.SYNC_SETTLE + timedelta(seconds=1)
+
+    def upload(self, *items):
+        return self.client.post(
+            "/api/v1/observations/sync/", json.dumps({"items": list(items)}),
+            content_type="application/json", **self.auth,
+        )
+
+    def test_changes_since_a_cursor(self):
+        first = self.observation("First")
+        Observation.objects.filter(pk=first.pk).update(updated_at=timezone.now() - timedelta(minutes=1))
+        page = sync.changes(self.org)
+        self.assertEqual([row["id"] for row in page.observations], [first.pk])
+        self.assertFalse(page.more)
+
+        second = self.observation("Second")
+        page = sync.changes(self.org, page.cursor, now=self.later())
+        self.assertEqual([row["id"] for row in page.observations], [second.pk])
+        self.assertEqual(page.deleted_observations, [])
+
+    def test_archived_and_deleted_rows_are_tombstoned(self):
+        archived, deleted, kept = self.observation(), self.observation(), self.observation()
+        cursor = sync.changes(self.org).cursor
+        tiers.archive(Observation.objects.filter(pk=archived.pk))
+        deleted_pk = deleted.pk
+        deleted.delete()
+
+        page = sync.changes(self.org, cursor, now=self.later())
+        self.assertEqual(sorted(page.deleted_observations), sorted([archived.pk, deleted_pk]))
+        self.assertEqual([row["id"] for row in page.observations], [kept.pk])
+
+    def test_retried_upload_is_replayed(self):
+        item = {"key": "k1", "observation": {"title": "Spill", "location": self.location.pk, "description": "x"}}
+        created = self.upload(item).json()["results"][0]
+        self.assertEqual(created["status"], "created")
+
+        retried = self.upload(item).json()["results"][0]
+        self.assertEqual(retried["status"], "duplicate")
+        self.assertEqual(retried["id"], created["id"])
+        self.assertEqual(Observation.objects.count(), 1)
+
+        reused = self.upload(dict(item, observation=dict(item["observation"], title="Other"))).json()
+        self.assertEqual(reused["results"][0]["reason"], "key_reused")
+
+    def test_concurrent_duplicate_key_is_replayed(self):
+        item = {"key": "k1", "observation": {"title": "Spill", "location": self.location.pk, "description": "x"}}
+        created = self.upload(item).json()["results"][0]
+        used = quota.usage_and_limit(self.org, quota.OBSERVATIONS)[0]
+        # As if the other upload committed between our key lookup and insert.
+        real_seen_keys = sync.seen_keys
+        with mock.patch.object(sync, "seen_keys", side_effect=[{}, real_seen_keys(self.org, ["k1"])]):
+            response = self.upload(item)
+        self.assertEqual(response.status_code, 200)
+        result = response.json()["results"][0]
+        self.assertEqual((result["status"], result["id"]), ("duplicate", created["id"]))
+        self.assertEqual(Observation.objects.count(), 1)
+        self.assertEqual(quota.usage_and_limit(self.org, quota.OBSERVATIONS)[0], used)
+
+    def test_edit_on_a_stale_base_is_a_conflict(self):
+        observation = self.observation()
+        base = observation.updated_at.isoformat()
+        observation.title = "Changed on the server"
+        observation.save()
+
+        result = self.upload(
+            {"key": "e1", "id": observation.pk, "changes": {"title": "Changed offline"}, "base_updated_at": base}
+        ).json()["results"][0]
+        self.assertEqual((result["status"], result["reason"]), ("conflict", "modified"))
+        self.assertEqual(result["observation"]["title"], "Changed on the server")
+        observation.refresh_from_db()
+        self.assertEqual(observation.title, "Changed on the server")
+
+
+class MediaStorageTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.media_root = tempfile.mkdtemp()
+        cls.enterClassContext(override_settings(MEDIA_ROOT=cls.media_root))
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(cls.media_root, ignore_errors=True)
+
+    def setUp(self):
+        self.org = Organization.objects.create(name="Acme", domain="acme.test")
+        self.location = Location.objects.create(name="Yard")
+
+    def observation(self, before=None, after=None):
+        observation = Observation(organization=self.org, location=self.location, title="Spill", description="")
+        if before:
+            observation.photo_before.save("before.jpg", ContentFile(before), save=False)
+        if after:
+            observation.photo_after.save("after.jpg", ContentFile(after), save=False)
+        observation.save()
+        return observation
+
+    def collect(self):
+        return storage.collect_blobs(now=timezone.now() + storage.GC_GRACE + timedelta(minutes=1))
+
+    def test_same_content_is_stored_once_and_counted(self):
+        first = self.observation(before=b"photo", after=b"photo")
+        second = self.observation(before=b"photo")
+        self.assertEqual(first.photo_before.name, first.photo_after.name)
+        self.assertEqual(second.photo_before.name, first.photo_before.name)
+        self.assertEqual(MediaBlob.objects.get().ref_count, 3)
+
+        first.delete()
+        self.assertEqual(MediaBlob.objects.get().ref_count, 1)
+        self.assertEqual(self.collect(), (0, 0))
+        self.assertTrue(storage.photo_storage().exists(second.photo_before.name))
+
+    def test_gc_deletes_unreferenced_blobs(self):
+        observation = self.observation(before=b"photo")
+        path = observation.photo_before.name
+        observation.delete()
+        self.assertEqual(MediaBlob.objects.get().ref_count, 0)
+
+        self.assertEqual(storage.collect_blobs(), (0, 0))  # still in its grace period
+        self.assertEqual(self.collect(), (1, len(b"photo")))
+        self.assertFalse(storage.photo_storage().exists(path))
+        self.assertFalse(MediaBlob.objects.exists())
+
+    def test_gc_keeps_blobs_still_in_use(self):
+        observation = self.observation(before=b"photo")
+        MediaBlob.objects.update(ref_count=0)  # a drifted count
+        self.assertEqual(self.collect(), (0, 0))
+        self.assertTrue(storage.photo_storage().exists(observation.photo_before.name))
+
+    def test_reusing_a_stored_file_holds_its_blob(self):
+        observation = self.observation(before=b"photo")
+        observation.delete()
+        stale = timezone.now() - storage.GC_GRACE - timedelta(minutes=1)
+        MediaBlob.objects.update(updated_at=stale)
+        # An upload of the same content relies on the stored file...
+        path = storage.photo_storage().save("again.jpg", ContentFile(b"photo"))
+        # ...so gc_media must not delete it before the upload is saved.
+        self.assertEqual(storage.collect_blobs(), (0, 0))
+        self.assertTrue(storage.photo_storage().exists(path))
+
+
+
+def jpeg(size=(400, 200), orientation=None):
+    """A JPEG whose left half is red and right half blue, with EXIF like a phone's."""
+    image = PILImage.new("RGB", size, "blue")
+    image.paste("red", (0, 0, size[0] // 2, size[1]))
+    exif = PILImage.Exif()
+    exif[ExifTags.Base.Make] = "PhoneCo"
+    if orientation is not None:
+        exif[ExifTags.Base.Orientation] = orientation
+    exif.get_ifd(ExifTags.IFD.GPSInfo).update({
+        ExifTags.GPS.GPSLatitudeRef: "N",
+        ExifTags.GPS.GPSLatitude: (51.0, 30.0, 0.0),
+    })
+    buffer = io.BytesIO()
+    image.save(buffer, "JPEG", exif=exif)
+    return buffer.getvalue()
+
+
+@override_settings(PHOTO_VARIANTS_ASYNC=False)
+class PhotoVariantTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        self.enterContext(override_settings(MEDIA_ROOT=media_root))
+        self.org = Organization.objects.create(name="Acme", domain="acme.test")
+        self.location = Location.objects.create(name="Yard")
+
+    def observation(self, data, name="pump.jpg"):
+        observation = Observation(organization=self.org, location=self.location, title="Spill", description="")
+        observation.photo_before.save(name, ContentFile(data), save=False)
+        with self.captureOnCommitCallbacks(execute=True):
+            observation.save()
+        observation.refresh_from_db()
+        return observation
+
+    def open_variant(self, path):
+        with default_storage.open(path, "rb") as fileobj:
+            image = PILImage.open(io.BytesIO(fileobj.read()))
+            image.load()
+        return image
+
+    def test_variants_are_resized(self):
+        observation = self.observation(jpeg(size=(3000, 1500)))
+        entry = observation.photo_variants["photo_before"]
+        self.assertEqual(entry["source"], observation.photo_before.name)
+        self.assertEqual(
+            {name: (entry[name]["width"], entry[name]["height"]) for name in images.VARIANTS},
+            {"thumb": (320, 160), "medium": (1280, 640), "large": (2560, 1280)},
+        )
+        formats = {"jpeg", "webp"} if PILFeatures.check("webp") else {"jpeg"}
+        for name in images.VARIANTS:
+            self.assertEqual(set(entry[name]) - {"width", "height"}, formats)
+            self.assertEqual(self.open_variant(entry[name]["jpeg"]).size, (entry[name]["width"], entry[name]["height"]))
+
+    def test_small_photos_are_not_upscaled(self):
+        entry = self.observation(jpeg()).photo_variants["photo_before"]
+        self.assertEqual((entry["large"]["width"], entry["large"]["height"]), (400, 200))
+
+    def test_exif_is_stripped_and_orientation_applied(self):
+        # Orientation 6: the camera was turned, the pixels must be rotated 90 degrees clockwise.
+        entry = self.observation(jpeg(orientation=6)).photo_variants["photo_before"]
+        for name in images.VARIANTS:
+            for fmt in set(entry[name]) - {"width", "height"}:
+                image = self.open_variant(entry[name][fmt])
+                self.assertEqual(dict(image.getexif()), {}, entry[name][fmt])
+                self.assertNotIn("exif", image.info)
+                self.assertEqual(image.height, image.width * 2)  # upright
+                image = image.convert("RGB")
+                # The red left half of the sensor image is on top.
+                self.assertGreater(image.getpixel((image.width // 2, 5))[0], 200)
+                self.assertGreater(image.getpixel((image.width // 2, image.height - 5))[2], 200)
+
+    def test_not_an_image(self):
+        with self.assertLogs("observations.images", "WARNING"):
+            observation = self.observation(b"not a photo", name="notes.jpg")
+        self.assertEqual(observation.photo_variants["photo_before"], {"source": observation.photo_before.name})
+        self.assertEqual(photo_full_url(observation, "photo_before"), "")
+
+    def test_replaced_photo_is_reprocessed(self):
+        observation = self.observation(jpeg())
+        old = observation.photo_variants["photo_before"]
+        observation.photo_before.save("valve.jpg", ContentFile(jpeg(size=(100, 300))), save=False)
+        with self.captureOnCommitCallbacks(execute=True):
+            observation.save()
+        observation.refresh_from_db()
+        entry = observation.photo_variants["photo_before"]
+        self.assertEqual(entry["source"], observation.photo_before.name)
+        self.assertEqual((entry["thumb"]["width"], entry["thumb"]["height"]), (100, 300))
+        for path in images.variant_paths(old):
+            self.assertFalse(default_storage.exists(path))
+
+    def test_full_size_link_is_the_largest_variant(self):
+        observation = self.observation(jpeg())
+        large = observation.photo_variants["photo_before"]["large"]
+        self.assertEqual(photo_full_url(observation, "photo_before"), default_storage.url(large["jpeg"]))
+
+        # Processed before "large" existed: the biggest variant there is.
+        del observation.photo_variants["photo_before"]["large"]
+        medium = observation.photo_variants["photo_before"]["medium"]
+        self.assertEqual(photo_full_url(observation, "photo_before"), default_storage.url(medium["jpeg"]))
+
+        # Never the upload, EXIF and all, while the variants are pending.
+        observation.photo_variants = {}
+        self.assertEqual(photo_full_url(observation, "photo_before"), "")
+
+    def test_detail_page_links_the_variant(self):
+        observation = self.observation(jpeg())
+        user = CustomUser.objects.create_user("ann@acme.test", "pw", organization=self.org)
+        self.client.force_login(user)
+        response = self.client.get(reverse("observations:detail", args=[observation.pk]))
+        self.assertContains(response, photo_full_url(observation, "photo_before"))
+        self.assertNotContains(response, f'href="{observation.photo_before.url}"')
+
+class ChunkedPhotoFormTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.root = tempfile.mkdtemp()
+        cls.enterClassContext(override_settings(MEDIA_ROOT=cls.root, CHUNKED_UPLOAD_ROOT=cls.root))
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(cls.root, ignore_errors=True)
+
+    def setUp(self):
+        org = Organization.objects.create(name="Acme", domain="acme.test")
+        plan = Plan.objects.create(name="Pro", price_monthly=10, max_users=10, max_observations=100)
+        Subscription.objects.create(organization=org, plan=plan)
+        self.user = CustomUser.objects.create_user("obs@acme.test", "pw", organization=org, is_observer=True)
+        self.location = Location.objects.create(name="Yard")
+        self.upload = PhotoUpload.objects.create(
+            organization=org, uploaded_by=self.user, filename="photo.jpg", size=5,
+            chunk_size=uploads.UPLOAD_CHUNK_SIZE, status="COMPLETE",
+        )
+        uploads.upload_dir(self.upload).mkdir(parents=True)
+        uploads.assembled_path(self.upload).write_bytes(b"photo")
+        self.client.force_login(self.user)
+        self.opened = []
+        open_upload = uploads.open_upload
+
+        def record(upload):
+            self.opened.append(open_upload(upload))
+            return self.opened[-1]
+        patcher = mock.patch.object(uploads, "open_upload", side_effect=record)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def post(self, **data):
+        return self.client.post(reverse("observations:create"), {
+            "location": self.location.pk, "description": "drip", "severity": "LOW",
+            "target_date": "2030-01-01", "photo_before_upload": self.upload.pk, **data,
+        })
+
+    def test_files_are_closed_when_the_form_is_invalid(self):
+        response = self.post(title="")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(self.opened), 1)
+        self.assertTrue(self.opened[0].closed)
+        self.upload.refresh_from_db()
+        self.assertEqual(self.upload.status, "COMPLETE")
+
+    def test_files_are_closed_when_the_quota_is_exceeded(self):
+        with mock.patch.object(quota, "reserve", side_effect=quota.QuotaExceeded(quota.OBSERVATIONS, 100)):
+            response = self.post(title="Spill")
+        self.assertEqual(response.status_code, 302)
+        self.assertTrue(self.opened[0].closed)
+        self.assertFalse(Observation.objects.exists())
+
+    def test_upload_is_used_by_a_saved_observation(self):
+        self.post(title="Spill")
+        self.assertTrue(self.opened[0].closed)
+        self.assertTrue(Observation.objects.get().photo_before.name)
+        self.upload.refresh_from_db()
+        self.assertEqual(self.upload.status, "USED")
+
+
+class ImportTests(TestCase):
+    HEADER = ["Title", "Location", "Date observed", "Severity", "Status", "Date closed", "Assigned to"]
+
+    def setUp(self):
+        # Ids are reused after each test's rollback, so are report paths.
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root, ignore_errors=True)
+        self.enterContext(override_settings(IMPORT_ROOT=self.root))
+        self.org = Organization.objects.create(name="Acme", domain="acme.test")
+        self.plan = Plan.objects.create(name="Pro", price_monthly=10, max_users=10, max_observations=100)
+        Subscription.objects.create(organization=self.org, plan=self.plan)
+        self.user = CustomUser.objects.create_user("manager@acme.test", "pw", organization=self.org)
+        Location.objects.create(name="Yard")
+        Location.objects.create(name="Store", area="North")
+        Location.objects.create(name="Store", area="South")
+
+    def make_import(self, rows, suffix=".csv", **fields):
+        path = imports.import_path(f"{len(os.listdir(self.root))}{suffix}")
+        path.parent.mkdir(parents=True, exist_ok=True)
+        if suffix == ".csv":
+            with open(path, "w", newline="", encoding="utf-8") as fileobj:
+                csv.writer(fileobj).writerows([self.HEADER, *rows])
+        else:
+            workbook = openpyxl.Workbook()
+            for row in [self.HEADER, *rows]:
+                workbook.active.append(row)
+            workbook.save(path)
+        return ObservationImport.objects.create(
+            organization=self.org, requested_by=self.user, filename=path.name,
+            file_path=str(path.relative_to(self.root)), **fields,
+        )
+
+    def error_report(self, observation_import):
+        observation_import.refresh_from_db()
+        with open(imports.import_path(observation_import.error_report_path), encoding="utf-8") as fileobj:
+            return list(csv.reader(fileobj))
+
+    def good_row(self, title="Spill", **values):
+        row = dict(zip(self.HEADER, [title, "Yard", "2024-03-01 09:00", "high", "Open", "", ""]))
+        row.update(values)
+        return list(row.values())
+
+    def test_csv_with_good_and_bad_rows(self):
+        observation_import = self.make_import([
+            self.good_row("Spill"),
+            self.good_row("", **{"Location": "Nowhere"}),
+            self.good_row("Leak", **{"Status": "Closed"}),
+            self.good_row("Cable", **{"Assigned to": "MANAGER@acme.test"}),
+        ])
+        self.assertEqual(imports.run_import(observation_import.pk), 2)
+
+        observation_import.refresh_from_db()
+        self.assertEqual(observation_import.status, "DONE")
+        self.assertEqual((observation_import.imported_count, observation_import.error_count), (2, 2))
+        self.assertEqual(observation_import.rows_processed, 4)
+        report = self.error_report(observation_import)
+        self.assertEqual(report[0], ["Row", "Errors", *self.HEADER])
+        self.assertEqual([row[0] for row in report[1:]], ["2", "3"])
+        self.assertIn("title is required", report[1][1])
+        self.assertIn("unknown location Nowhere", report[1][1])
+        self.assertIn("date_closed is required", report[2][1])
+        self.assertEqual(report[2][2], "Leak")
+        cable = Observation.objects.get(title="Cable")
+        self.assertEqual((cable.assigned_to, cable.observer, cable.severity), (self.user, self.user, "HIGH"))
+
+    def test_xlsx(self):
+        observation_import = self.make_import(
+            [self.good_row("Spill"), self.good_row("Bad", **{"Severity": "extreme"})], suffix=".xlsx"
+        )
+        self.assertEqual(imports.run_import(observation_import.pk), 1)
+        report = self.error_report(observation_import)
+        self.assertEqual(report[1][:2], ["2", "invalid severity extreme"])
+        self.assertTrue(Observation.objects.filter(title="Spill").exists())
+
+    def test_naive_datetimes_are_in_the_current_time_zone(self):
+        observation_import = self.make_import([
+            self.good_row("Local", **{"Date observed": "2024-03-01 09:00"}),
+            self.good_row("Offset", **{"Date observed": "2024-03-01T09:00:00+02:00"}),
+        ])
+        with timezone.override("Asia/Singapore"):
+            imports.run_import(observation_import.pk)
+        self.assertEqual(
+            Observation.objects.get(title="Local").date_observed,
+            datetime(2024, 3, 1, 1, 0, tzinfo=dt_timezone.utc),
+        )
+        self.assertEqual(
+            Observation.objects.get(title="Offset").date_observed,
+            datetime(2024, 3, 1, 7, 0, tzinfo=dt_timezone.utc),
+        )
+
+    def test_ambiguous_location_needs_its_area(self):
+        observation_import = self.make_import([
+            self.good_row("Vague", **{"Location": "Store"}),
+            self.good_row("Exact", **{"Location": "store (south)"}),
+        ])
+        imports.run_import(observation_import.pk)
+        self.assertEqual(Observation.objects.get().location.area, "South")
+        self.assertIn("several locations are named Store", self.error_report(observation_import)[1][1])
+
+    def test_rows_over_the_quota_are_reported(self):
+        self.plan.max_observations = 2
+        self.plan.save()
+        observation_import = self.make_import([self.good_row(f"Row {i}") for i in range(4)])
+        self.assertEqual(imports.run_import(observation_import.pk), 2)
+        report = self.error_report(observation_import)
+        self.assertEqual([row[:2] for row in report[1:]], [
+            ["3", "observation limit of the plan reached"],
+            ["4", "observation limit of the plan reached"],
+        ])
+        self.assertEqual(quota.remaining(self.org, quota.OBSERVATIONS), 0)
+
+    def test_resumes_after_the_rows_already_processed(self):
+        observation_import = self.make_import(
+            [self.good_row(f"Row {i}") for i in range(5)], rows_processed=3, imported_count=3
+        )
+        self.assertEqual(imports.run_import(observation_import.pk), 5)
+        self.assertEqual(sorted(Observation.objects.values_list("title", flat=True)), ["Row 3", "Row 4"])
+
+    def test_job_of_a_dead_worker_resumes_after_the_committed_rows(self):
+        observation_import = self.make_import([self.good_row(f"Row {i}") for i in range(5)])
+        imports.submit_import(observation_import)
+        job = jobs.claim_next("worker-1", ["observations.import_file"])
+        # The worker committed the first two rows, then died.
+        ObservationImport.objects.filter(pk=observation_import.pk).update(
+            status="RUNNING", rows_processed=2, imported_count=2
+        )
+        lose_worker(job)
+
+        job = jobs.claim_next("worker-2", ["observations.import_file"])
+        self.assertTrue(jobs.run(job))
+        observation_import.refresh_from_db()
+        self.assertEqual((observation_import.status, observation_import.imported_count), ("DONE", 5))
+        self.assertEqual(
+            sorted(Observation.objects.values_list("title", flat=True)), ["Row 2", "Row 3", "Row 4"]
+        )
+
+    def test_each_chunk_updates_search_and_the_data_version(self):
+        observation_import = self.make_import([self.good_row(f"Leak {i}") for i in range(5)])
+        read_chunks = imports.read_chunks
+        version = self.org.data_version
+        with mock.patch.object(imports, "read_chunks", lambda path: read_chunks(path, chunk_size=2)), \
+                mock.patch.object(imports, "bump_data_version", wraps=imports.bump_data_version) as bump:
+            imports.run_import(observation_import.pk)
+        self.assertEqual(bump.call_count, 3)
+        self.org.refresh_from_db()
+        self.assertEqual(self.org.data_version, version + 3)
+        queryset = Observation.objects.for_organization(self.org)
+        self.assertEqual(search.get_backend().filter(queryset, self.org, "leak").count(), 5)
+
+
+class BulkActionTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.org = Organization.objects.create(name="Acme", domain="acme.test")
+        cls.manager = CustomUser.objects.create_user("boss@acme.test", "pw", organization=cls.org, is_manager=True)
+        cls.observer = CustomUser.objects.create_user("obs@acme.test", "pw", organization=cls.org, is_observer=True)
+        location = Location.objects.create(name="Yard")
+        cls.waiting = [
+            Observation.objects.create(
+                organization=cls.org, location=location, title=f"Spill {i}", description="",
+                status="AWAITING_VERIFICATION",
+            )
+            for i in range(2)
+        ]
+
+    def post(self, user, **data):
+        self.client.force_login(user)
+        response = self.client.post(reverse("observations:bulk_action"), {
+            "ids": [observation.pk for observation in self.waiting], **data,
+        })
+        self.assertEqual(response.status_code, 302)
+        return [str(message) for message in get_messages(response.wsgi_request)]
+
+    def test_can_perform(self):
+        self.assertFalse(bulk.can_perform(self.manager, bulk.CLOSE))
+        self.assertTrue(bulk.can_perform(self.manager, bulk.ARCHIVE))
+        self.assertFalse(bulk.can_perform(self.observer, bulk.ASSIGN))
+        with self.assertRaises(PermissionDenied):
+            bulk.perform(self.org, self.manager, bulk.CLOSE, Observation.objects.all())
+
+    def test_action_the_user_cannot_perform_is_refused(self):
+        messages = self.post(self.manager, action=bulk.CLOSE)
+        self.assertIn("not one of the available choices", messages[0])
+        self.assertFalse(Observation.objects.filter(status="CLOSED").exists())
+
+    def test_permission_denied_is_reported_per_row(self):
+        with mock.patch.object(bulk, "perform", side_effect=PermissionDenied(bulk.NOT_ALLOWED)):
+            messages = self.post(self.manager, action=bulk.ARCHIVE)
+        self.assertEqual(messages, ["Archived 0 of 2 observation(s). 2 skipped: you are not allowed to do that."])
+
+    def test_close_reports_skipped_rows(self):
+        Observation.objects.filter(pk=self.waiting[0].pk).update(status="OPEN")
+        safety_manager = CustomUser.objects.create_user(
+            "safety@acme.test", "pw", organization=self.org, is_safety_manager=True
+        )
+        messages = self.post(safety_manager, action=bulk.CLOSE)
+        self.assertEqual(messages, ["Closed 1 of 2 observation(s). 1 skipped: not awaiting verification."])
+
+
+class RetentionTests(TestCase):
+    def setUp(self):
+        self.location = Location.objects.create(name="Yard")
+        self.now = timezone.now()
+
+    def observation(self, org, status="CLOSED", closed_days_ago=None):
+        return Observation.objects.create(
+            organization=org, location=self.location, title="Spill", description="", status=status,
+            date_closed=self.now - timedelta(days=closed_days_ago) if closed_days_ago is not None else None,
+        )
+
+    def test_only_closed_observations_past_the_period_are_archived(self):
+        org = Organization.objects.create(name="Acme", domain="acme.test", archive_closed_after_days=30)
+        short = Organization.objects.create(name="Short", domain="short.test", archive_closed_after_days=5)
+        never = Organization.objects.create(name="Never", domain="never.test")
+        old = self.observation(org, closed_days_ago=40)
+        kept = [
+            self.observation(org, closed_days_ago=10),
+            self.observation(org, status="OPEN"),
+            self.observation(org, status="AWAITING_VERIFICATION"),
+            self.observation(never, closed_days_ago=400),
+        ]
+        short_old = self.observation(short, closed_days_ago=10)
+
+        stats = retention.run(batch_size=1, now=self.now)
+        self.assertEqual(stats.archived, 2)
+        self.assertEqual(stats.per_organization, {org.pk: 1, short.pk: 1})
+        self.assertEqual(set(ArchivedObservation.objects.values_list("pk", flat=True)), {old.pk, short_old.pk})
+        self.assertEqual(
+            set(Observation.objects.values_list("pk", flat=True)), {observation.pk for observation in kept}
+        )
+        self.assertEqual(retention.due(org, now=self.now), 0)
+
+    def test_job_schedules_itself_again(self):
+        org = Organization.objects.create(name="Acme", domain="acme.test", archive_closed_after_days=30)
+        self.observation(org, closed_days_ago=40)
+        tasks.schedule_archive_closed()
+        self.assertIsNone(tasks.schedule_archive_closed())  # one is already waiting
+
+        job = jobs.claim_next("worker-1", [tasks.ARCHIVE_CLOSED])
+        self.assertTrue(jobs.run(job))
+        job.refresh_from_db()
+        self.assertEqual(job.result["archived"], 1)
+
+        next_run = Job.objects.get(name=tasks.ARCHIVE_CLOSED, status=Job.STATUS_QUEUED)
+        self.assertGreaterEqual(next_run.run_after, self.now + retention.RETENTION_INTERVAL)
+        self.assertIsNone(jobs.claim_next("worker-1", [tasks.ARCHIVE_CLOSED]))
+
+    def test_job_schedules_itself_again_after_failing(self):
+        tasks.schedule_archive_closed()
+        Job.objects.update(max_attempts=1)
+        job = jobs.claim_next("worker-1", [tasks.ARCHIVE_CLOSED])
+        with mock.patch.object(retention, "run", side_effect=RuntimeError("database went away")):
+            self.assertFalse(jobs.run(job))
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.STATUS_FAILED)
+        next_run = Job.objects.get(name=tasks.ARCHIVE_CLOSED, status=Job.STATUS_QUEUED)
+        self.assertGreaterEqual(next_run.run_after, self.now + retention.RETENTION_INTERVAL)
+
+
+def lose_worker(job):
+    """Make ``job`` look like its worker died, then let requeue_stale retry it now."""
+    Job.objects.filter(pk=job.pk).update(locked_at=timezone.now() - jobs.JOB_LOCK_TIMEOUT - timedelta(minutes=1))
+    jobs.requeue_stale()
+    Job.objects.filter(pk=job.pk).update(run_after=timezone.now())
+
+
+class ExportJobTests(TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root, ignore_errors=True)
+        self.enterContext(override_settings(EXPORT_ROOT=self.root))
+        self.org = Organization.objects.create(name="Acme", domain="acme.test")
+        location = Location.objects.create(name="Yard")
+        for i in range(3):
+            Observation.objects.create(organization=self.org, location=location, title=f"Spill {i}", description="")
+
+    def test_export_of_a_dead_worker_is_retried(self):
+        export = ObservationExport.objects.create(organization=self.org)
+        submit_export(export)
+        job = jobs.claim_next("worker-1", ["observations.export_xlsx"])
+        # The worker claimed the export, then died.
+        ObservationExport.objects.filter(pk=export.pk).update(status="RUNNING")
+        lose_worker(job)
+
+        job = jobs.claim_next("worker-2", ["observations.export_xlsx"])
+        self.assertEqual(job.attempts, 2)
+        self.assertTrue(jobs.run(job))
+        export.refresh_from_db()
+        self.assertEqual((export.status, export.row_count), ("DONE", 3))
+        self.assertTrue(os.path.exists(os.path.join(self.root, export.file_path)))
+        self.assertEqual(Job.objects.get(pk=job.pk).result, {"rows": 3})
+
+    def test_running_export_of_another_job_is_left_alone(self):
+        export = ObservationExport.objects.create(organization=self.org, status="RUNNING")
+        self.assertEqual(run_export(export.pk, job_id=12345), 0)
+        export.refresh_from_db()
+        self.assertEqual(export.status, "RUNNING")
@@ -0,0 +1,118 @@
+# observations/tiers.py
+"""
+Moving observations between the hot table (Observation) and the cold
+archive tier (ArchivedObservation).
+
+Archiving moves the rows out of Observation, restoring moves them back,
+both in batches with one INSERT and one DELETE per batch. A row keeps its
+id, photos and photo variants in either table, so a move is not a create
+or a delete for the rest of the app:
+
+* while ``moving()`` is active the per-row delete receivers of both models
+  (plan usage counters, photo reference counts, photo variant files, ...)
+  do nothing; the usage counters and media references count both tiers;
+* what does depend on the tier - the daily rollups and the search index
+  only cover active observations, the dashboard data version, and the
+  offline sync tombstones - is updated here once per batch.
+"""
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.db import transaction
+from django.utils import timezone
+
+from . import rollups, search, sync
+from .cache import bump_data_version
+from .models import ArchivedObservation, Observation
+
+TIER_BATCH_SIZE = 500
+
+# Field values copied between the tiers (both models use the same names).
+TIER_FIELDS = [
+    field.attname
+    for field in ArchivedObservation._meta.concrete_fields
+    if field.name != "archived_at"
+]
+
+_moving = ContextVar("observations_moving_tiers", default=False)
+
+
+@contextmanager
+def moving():
+    """Mark the deletes inside the block as moves between the tiers."""
+    token = _moving.set(True)
+    try:
+        yield
+    finally:
+        _moving.reset(token)
+
+
+def is_moving():
+    return _moving.get()
+
+
+def _batches(ids, size):
+    ids = list(ids)
+    for start in range(0, len(ids), size):
+        yield ids[start:start + size]
+
+
+def archive(queryset, batch_size=TIER_BATCH_SIZE):
+    """
+    Move the observations of ``queryset`` to the archive tier. Returns the
+    number moved.
+    """
+    moved = 0
+    for ids in _batches(queryset.order_by("pk").values_list("pk", flat=True), batch_size):
+        with transaction.atomic(), moving():
+            rows = list(
+                Observation.objects.filter(pk__in=ids)
+                .select_for_update()
+                .values(*TIER_FIELDS)
+            )
+            if not rows:
+                continue
+            now = timezone.now()
+            ArchivedObservation.objects.bulk_create(
+                ArchivedObservation(
+                    archived_at=now, **{name: row[name] for name in TIER_FIELDS}
+                )
+                for row in rows
+            )
+            rollups.record_change(rollups.contributions(rows), Counter())
+            Observation.objects.filter(pk__in=[row["id"] for row in rows]).delete()
+            search.get_backend().remove([row["id"] for row in rows])
+            sync.bury_observations(rows, deleted_at=now)
+            for organization_id in {row["organization_id"] for row in rows}:
+                bump_data_version(organization_id)
+            moved += len(rows)
+    return moved
+
+
+def restore(queryset, batch_size=TIER_BATCH_SIZE):
+    """
+    Move the archived observations of ``queryset`` (ArchivedObservations)
+    back to the hot table. Returns the number moved.
+    """
+    moved = 0
+    for ids in _batches(queryset.order_by("pk").values_list("pk", flat=True), batch_size):
+        with transaction.atomic(), moving():
+            rows = list(
+                ArchivedObservation.objects.filter(pk__in=ids)
+                .select_for_update()
+                .values(*TIER_FIELDS)
+            )
+            if not rows:
+                continue
+            # updated_at is not copied: auto_now stamps the restore, so
+            # syncing clients fetch the rows again.
+            Observation.objects.bulk_create(Observation(**row) for row in rows)
+            sync.unbury_observations(row["id"] for row in rows)
+            ArchivedObservation.objects.filter(pk__in=[row["id"] for row in rows]).delete()
+            rollups.record_change(Counter(), rollups.contributions(rows))
+            search.get_backend().index([row["id"] for row in rows])
+            for organization_id in {row["organization_id"] for row in rows}:
+                bump_data_version(organization_id)
+            moved += len(rows)
+    return moved
@@ -0,0 +1,213 @@
+# observations/uploads.py
+"""
+Resumable, chunked photo uploads.
+
+Field devices on weak connections can't reliably push a multi-MB photo in
+one multipart POST. Instead the client:
+
+1. starts an upload (file name, size, optional SHA-256 of the whole file)
+   and gets back an id and the chunk size to use;
+2. sends the chunks, in any order, each with the SHA-256 of its bytes; a
+   chunk that fails is simply sent again, and after a reconnect the upload
+   status lists the chunks the server already has;
+3. once every chunk is in, the server assembles the file, checks its size
+   and checksum and that it is an image;
+4. submits the observation form with the upload id in place of the file.
+
+Chunks are kept as one file each under CHUNKED_UPLOAD_ROOT/<upload id>/, so
+concurrent chunk requests never write to the same file. Abandoned uploads
+are removed by ``manage.py purge_photo_uploads``.
+"""
+import hashlib
+import os
+import shutil
+import uuid
+from datetime import timedelta
+from pathlib import Path
+
+from django.conf import settings
+from django.core.files import File
+from django.utils import timezone
+from django.utils.text import get_valid_filename
+
+from core.utils.lazy import lazy_import
+
+from .models import PhotoUpload
+
+Image = lazy_import("PIL.Image")
+
+# Chunks are read into memory (request.body), so they have to stay well
+# below DATA_UPLOAD_MAX_MEMORY_SIZE.
+UPLOAD_CHUNK_SIZE = 512 * 1024
+UPLOAD_MAX_CHUNK_SIZE = 1024 * 1024
+UPLOAD_MIN_CHUNK_SIZE = 64 * 1024
+UPLOAD_MAX_SIZE = getattr(settings, "PHOTO_UPLOAD_MAX_SIZE", 25 * 1024 * 1024)
+
+# Uploads not used by a form within this long are purged.
+UPLOAD_EXPIRY = timedelta(hours=24)
+
+ASSEMBLED = "upload.bin"
+LOCK = "assemble.lock"
+
+
+class UploadError(Exception):
+    """The client sent something we can't accept; the message is shown to it."""
+
+
+def upload_dir(upload):
+    return Path(settings.CHUNKED_UPLOAD_ROOT) / str(upload.pk)
+
+
+def assembled_path(upload):
+    return upload_dir(upload) / ASSEMBLED
+
+
+def start_upload(organization, user, filename, size, chunk_size=None, sha256=""):
+    try:
+        size = int(size)
+        chunk_size = int(chunk_size or UPLOAD_CHUNK_SIZE)
+    except (TypeError, ValueError):
+        raise UploadError("size and chunk_size must be integers.")
+    if size <= 0:
+        raise UploadError("The file is empty.")
+    if size > UPLOAD_MAX_SIZE:
+        raise UploadError(f"The file is too large ({UPLOAD_MAX_SIZE // (1024 * 1024)} MB at most).")
+    sha256 = (sha256 or "").lower()
+    if sha256 and len(sha256) != 64:
+        raise UploadError("sha256 must be a hex digest.")
+
+    upload = PhotoUpload.objects.create(
+        organization=organization,
+        uploaded_by=user,
+        filename=get_valid_filename(os.path.basename(filename or "")) or "photo.jpg",
+        size=size,
+        chunk_size=min(max(chunk_size, UPLOAD_MIN_CHUNK_SIZE), UPLOAD_MAX_CHUNK_SIZE),
+        sha256=sha256,
+    )
+    upload_dir(upload).mkdir(parents=True, exist_ok=True)
+    return upload
+
+
+def _chunk_path(upload, index):
+    return upload_dir(upload) / f"{index:06d}.chunk"
+
+
+def received_chunks(upload):
+    directory = upload_dir(upload)
+    if not directory.is_dir():
+        return []
+    return sorted(int(path.stem) for path in directory.glob("*.chunk"))
+
+
+def expected_length(upload, index):
+    if index == upload.total_chunks - 1:
+        return upload.size - index * upload.chunk_size
+    return upload.chunk_size
+
+
+def write_chunk(upload, index, data, checksum):
+    """Store chunk ``index`` after checking its length and SHA-256."""
+    if upload.status != "UPLOADING":
+        raise UploadError("This upload is already complete.")
+    if not 0 <= index < upload.total_chunks:
+        raise UploadError(f"Chunk index must be between 0 and {upload.total_chunks - 1}.")
+    if len(data) != expected_length(upload, index):
+        raise UploadError(
+            f"Chunk {index} should be {expected_length(upload, index)} bytes, got {len(data)}."
+        )
+    if not checksum or hashlib.sha256(data).hexdigest() != checksum.lower():
+        raise UploadError(f"Checksum mismatch for chunk {index}.")
+
+    target = _chunk_path(upload, index)
+    target.parent.mkdir(parents=True, exist_ok=True)
+    partial = target.with_name(f"{target.name}.{uuid.uuid4().hex}.part")
+    partial.write_bytes(data)
+    os.replace(partial, target)
+
+
+def assemble(upload):
+    """
+    Join the chunks once they are all in. Returns True when the upload is
+    complete (now or already), False while chunks are missing or another
+    request is assembling it.
+    """
+    if upload.status != "UPLOADING":
+        return True
+    if len(received_chunks(upload)) < upload.total_chunks:
+        return False
+
+    directory = upload_dir(upload)
+    try:
+        lock = os.open(directory / LOCK, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+    except FileExistsError:
+        return False
+    try:
+        digest = hashlib.sha256()
+        partial = directory / f"{ASSEMBLED}.part"
+        with open(partial, "wb") as out:
+            for index in range(upload.total_chunks):
+                data = _chunk_path(upload, index).read_bytes()
+                digest.update(data)
+                out.write(data)
+
+        if upload.sha256 and digest.hexdigest() != upload.sha256:
+            _reset(upload)
+            raise UploadError("The assembled file does not match its checksum; please upload it again.")
+        try:
+            with Image.open(partial) as image:
+                image.verify()
+        except Exception:
+            _reset(upload)
+            raise UploadError("The uploaded file is not an image.")
+
+        os.replace(partial, directory / ASSEMBLED)
+        for index in range(upload.total_chunks):
+            _chunk_path(upload, index).unlink(missing_ok=True)
+        PhotoUpload.objects.filter(pk=upload.pk, status="UPLOADING").update(
+            status="COMPLETE", completed_at=timezone.now()
+        )
+        upload.status = "COMPLETE"
+        return True
+    finally:
+        os.close(lock)
+        (directory / LOCK).unlink(missing_ok=True)
+
+
+def _reset(upload):
+    """Throw away every chunk so the client starts over."""
+    for path in upload_dir(upload).iterdir():
+        if path.name != LOCK:
+            path.unlink(missing_ok=True)
+
+
+def status(upload):
+    return {
+        "id": str(upload.pk),
+        "filename": upload.filename,
+        "size": upload.size,
+        "chunk_size": upload.chunk_size,
+        "total_chunks": upload.total_chunks,
+        "received": received_chunks(upload) if upload.status == "UPLOADING" else list(range(upload.total_chunks)),
+        "complete": upload.status != "UPLOADING",
+    }
+
+
+def open_upload(upload):
+    """The assembled file as a File to assign to an ImageField."""
+    return File(open(assembled_path(upload), "rb"), name=upload.filename)
+
+
+def release(upload):
+    """Mark ``upload`` used and drop its temporary files."""
+    PhotoUpload.objects.filter(pk=upload.pk).update(status="USED")
+    shutil.rmtree(upload_dir(upload), ignore_errors=True)
+
+
+def purge(older_than=UPLOAD_EXPIRY, now=None):
+    """Delete uploads (and their files) started more than ``older_than`` ago."""
+    cutoff = (now or timezone.now()) - older_than
+    expired = list(PhotoUpload.objects.filter(created_at__lt=cutoff))
+    for upload in expired:
+        shutil.rmtree(upload_dir(upload), ignore_errors=True)
+    PhotoUpload.objects.filter(pk__in=[upload.pk for upload in expired]).delete()
+    return len(expired)
@@ -7,6 +7,7 @@ app_name = 'observations'
 urlpatterns = [
     path('', views.observation_list, name='observation_list'),
     path('new/', views.ObservationCreateView.as_view(), name='create'),
+    path('bulk/', views.bulk_observation_action, name='bulk_action'),
     path('<int:pk>/', views.ObservationDetailView.as_view(), name='detail'),
     path('<int:pk>/rectify/', views.RectificationUpdateView.as_view(), name='rectify'),
     path('<int:pk>/verify/', views.VerificationView.as_view(), name='verify'),
@@ -19,6 +20,14 @@ urlpatterns = [
     # Export URLs
     path('export/csv/', views.export_observations_csv, name='export_observations_csv'),
     path('export/excel/', views.export_observations_excel, name='export_observations_excel'),
+    path('exports/<int:pk>/', views.export_status, name='export_status'),
+    path('exports/<int:pk>/download/', views.export_download, name='export_download'),
+    path('import/', views.import_observations, name='import_observations'),
+    path('imports/<int:pk>/', views.import_status, name='import_status'),
+    path('imports/<int:pk>/errors/', views.import_error_report, name='import_error_report'),
+    path('uploads/', views.photo_upload_start, name='photo_upload_start'),
+    path('uploads/<uuid:pk>/', views.photo_upload_status, name='photo_upload_status'),
+    path('uploads/<uuid:pk>/chunks/<int:index>/', views.photo_upload_chunk, name='photo_upload_chunk'),
     path('ajax/add-location/', views.ajax_add_location, name='ajax_add_location'),
 
     # delete observation
@@ -26,6 +35,7 @@ urlpatterns = [
 
     # Dashboard URL
     path('dashboard/', views.observations_dashboard, name='dashboard'),
+    path('dashboard/charts/', views.dashboard_chart_data, name='dashboard_chart_data'),
 
 
 ]
@@ -1,30 +1,37 @@
-from django.shortcuts import render
-
-# Create your views here.
-
 # observations/views.py
 from django.shortcuts import get_object_or_404, redirect, render
-from django.views.generic import CreateView, UpdateView, ListView, DetailView, FormView
+from django.views.generic import CreateView, UpdateView, DetailView
 from django.urls import reverse_lazy, reverse
 from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
-from .models import Observation
-from .forms import ObservationCreateForm, RectificationForm, VerificationForm
+from .models import ArchivedObservation, Observation, ObservationExport, ObservationImport, PhotoUpload
+from .forms import BulkActionForm, ObservationCreateForm, ObservationImportForm, RectificationForm, VerificationForm
 from django.contrib import messages
-from django.core.paginator import Paginator
-from django.db.models import Q, Count, F
-from django.db.models.functions import TruncMonth, TruncDay, TruncWeek 
-from .models import Location
+from django.db import transaction
 from .forms import LocationForm
-from django.http import JsonResponse
+from django.http import FileResponse, Http404, JsonResponse, QueryDict, StreamingHttpResponse
 from django.views.decorators.http import require_POST
-from django.views.decorators.csrf import csrf_exempt
-from django.middleware.csrf import get_token
 from datetime import date
+import tempfile
 from django.utils import timezone
 from django.contrib.auth.decorators import login_required, user_passes_test
-from django.core.exceptions import PermissionDenied
+from django.core.exceptions import PermissionDenied, ValidationError
+from core import quota
 from core.mixins import OrganizationQuerySetMixin
-import pandas as pd
+from . import bulk, imports, tiers, uploads
+from .pagination import KeysetPaginator
+from .exports import (
+    XLSX_CONTENT_TYPE,
+    export_path,
+    export_queryset,
+    export_rows,
+    filter_observations,
+    list_filters,
+    needs_background,
+    stream_csv,
+    submit_export,
+    write_xlsx,
+)
+
 # Helper mixins
 class OrganizationRequiredMixin:
     def dispatch(self, request, *args, **kwargs):
@@ -36,6 +43,30 @@ class ObserverRequiredMixin(UserPassesTestMixin):
     def test_func(self):
         return self.request.user.is_authenticated and self.request.user.is_observer
 
+class ChunkedPhotoViewMixin:
+    """
+    For views whose form is a ChunkedPhotoMixin form: passes the uploader,
+    and closes the upload files the form opened however the request ends
+    (invalid form, quota refusal, error).
+    """
+    def get_form_kwargs(self):
+        kwargs = super().get_form_kwargs()
+        kwargs["uploader"] = self.request.user
+        return kwargs
+
+    def get_form(self, form_class=None):
+        self.photo_form = super().get_form(form_class)
+        return self.photo_form
+
+    def post(self, request, *args, **kwargs):
+        self.photo_form = None
+        try:
+            return super().post(request, *args, **kwargs)
+        finally:
+            if self.photo_form is not None:
+                self.photo_form.close_uploads()
+
+
 class IsAssignedOrManagerMixin(UserPassesTestMixin):
     def test_func(self):
         obj = self.get_object()
@@ -47,6 +78,7 @@ class IsAssignedOrManagerMixin(UserPassesTestMixin):
 class ObservationCreateView(
     LoginRequiredMixin,
     OrganizationRequiredMixin,
+    ChunkedPhotoViewMixin,
     CreateView
 ):
     model = Observation
@@ -63,16 +95,12 @@ class ObservationCreateView(
             messages.error(request, "No organization associated with your account. Please create or join an organization to proceed.")
             return redirect("core:organization_signup")
         # sub = request.organization.subscription
-        sub = getattr(org, 'subscription', None)
+        sub = request.tenant.subscription
         if not sub:
             messages.error(request, "Your organization does not have an active subscription. Please contact your administrator.")
             return redirect("core:organization_signup")
 
-        count = Observation.objects.filter(
-            organization=org
-        ).count()
-
-        if count >= sub.plan.max_observations:
+        if quota.remaining(org, quota.OBSERVATIONS) <= 0:
             messages.error(
                 request,
                 "Observation limit reached for your current plan. Please upgrade."
@@ -85,7 +113,19 @@ class ObservationCreateView(
         form.instance.organization = self.request.organization
         form.instance.observer = self.request.user
         form.instance.status = "OPEN"
-        return super().form_valid(form)
+        with transaction.atomic():
+            try:
+                quota.reserve(self.request.organization, quota.OBSERVATIONS)
+            except quota.QuotaExceeded:
+                messages.error(
+                    self.request,
+                    "Observation limit reached for your current plan. Please upgrade."
+                )
+                return redirect("observations:observation_list")
+            setattr(form.instance, quota.RESERVED_ATTR, True)
+            response = super().form_valid(form)
+        form.release_uploads()
+        return response
 
 
 def home_view(request):
@@ -93,33 +133,49 @@ def home_view(request):
     return render(request, "home.html", {})
 
 
+def _filter_querystring(request):
+    """The list filters as a query string, to carry them over to links."""
+    return _filter_querystring_from(request.GET)
+
+
+def _filter_querystring_from(data):
+    params = QueryDict(mutable=True)
+    params.update(list_filters(data))
+    return params.urlencode()
+
+
 @login_required
 def observation_list(request):
     if not request.organization:
         raise PermissionDenied("No organization associated with the user.")
-    #----1. handle search query-----
+    #----1. handle search query and status filter-----
     q = request.GET.get('q', '').strip()
-    observations = Observation.objects.filter(
-        is_archived=False,
-        organization=request.organization
-    ).select_related('location','assigned_to').order_by('-date_observed')
-
-    if q:
-        observations = observations.filter(
-            Q(title__icontains=q) | 
-            Q(description__icontains=q) |
-            Q(location__name__icontains=q) |
-            Q(observer__username__icontains=q)
-        )
+    status = request.GET.get('status', '')
+    observations = filter_observations(
+        Observation.objects
+        .for_organization(request.organization)
+        .select_related('location', 'observer', 'assigned_to'),
+        request.organization,
+        request.GET,
+    )
     #----2. handle pagination-----
-    paginator = Paginator(observations, 10)  # Show 10 observations per page
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    paginator = KeysetPaginator(
+        observations,
+        ordering=('-date_observed', '-id'),
+        per_page=10,  # Show 10 observations per page
+        estimate_total=True,
+    )
+    page_obj = paginator.get_page(request.GET.get('cursor'))
     context = {
         'observations': page_obj,
         'page_obj': page_obj,
         'q': q, # to retain search query in template
+        'status': status,
+        'status_choices': Observation.STATUS_CHOICES,
+        'filter_query': _filter_querystring(request),
         'today': date.today(), # to compare target_date in template
+        'can_bulk': _can_bulk(request.user),
+        'bulk_form': BulkActionForm(organization=request.organization, user=request.user),
     }
     
     return render(request, 'observations/observation_list.html', context)
@@ -128,11 +184,64 @@ def observation_list(request):
 
 
 
+def _can_bulk(user):
+    return any(bulk.can_perform(user, action) for action, _ in bulk.ACTION_CHOICES)
+
+
+@login_required
+@require_POST
+def bulk_observation_action(request):
+    """Apply one bulk action to the selected (or all filtered) observations."""
+    if not request.organization:
+        raise PermissionDenied("No organization associated with the user.")
+    list_url = f"{reverse('observations:observation_list')}?{_filter_querystring_from(request.POST)}"
+
+    form = BulkActionForm(request.POST, organization=request.organization, user=request.user)
+    if not form.is_valid():
+        for errors in form.errors.values():
+            for error in errors:
+                messages.error(request, error)
+        return redirect(list_url)
+
+    queryset = Observation.objects.for_organization(request.organization)
+    if form.cleaned_data['select_all']:
+        queryset = filter_observations(queryset, request.organization, request.POST)
+    else:
+        queryset = queryset.filter(pk__in=form.cleaned_data['ids'])
+
+    try:
+        result = bulk.perform(
+            request.organization,
+            request.user,
+            form.cleaned_data['action'],
+            queryset,
+            assignee=form.cleaned_data['assigned_to'],
+        )
+    except ValidationError as e:
+        messages.error(request, e.messages[0])
+    except PermissionDenied:
+        refused = bulk.BulkResult(form.cleaned_data['action'], queryset.count(), 0, refused=True)
+        messages.error(request, refused.summary())
+    else:
+        (messages.success if result.updated else messages.warning)(request, result.summary())
+    return redirect(list_url)
+
+
 class ObservationDetailView(LoginRequiredMixin, OrganizationQuerySetMixin, DetailView):
     model = Observation
     template_name = 'observations/observation_detail.html'
 
-class RectificationUpdateView(LoginRequiredMixin, IsAssignedOrManagerMixin, OrganizationQuerySetMixin, UpdateView):
+    def get_object(self, queryset=None):
+        try:
+            return super().get_object(queryset)
+        except Http404:
+            # Archived observations keep their id in the archive tier.
+            return get_object_or_404(
+                ArchivedObservation, pk=self.kwargs['pk'], organization=self.request.organization
+            )
+
+class RectificationUpdateView(LoginRequiredMixin, IsAssignedOrManagerMixin, OrganizationQuerySetMixin,
+                              ChunkedPhotoViewMixin, UpdateView):
     model = Observation
     form_class = RectificationForm
     template_name = 'observations/observation_form.html'
@@ -141,19 +250,19 @@ class RectificationUpdateView(LoginRequiredMixin, IsAssignedOrManagerMixin, Orga
     # def form_valid(self, form):
     #     form.instance.status = 'IN_PROGRESS'
     #     return super().form_valid(form)
-    
+
     def form_valid(self, form):
         """
         When Action Owner submits the rectification:
         - Update rectification details, photo_after, target_date.
-        - Change status to 'AWAITING VERIFICATION'.
+        - Change status to 'AWAITING_VERIFICATION'.
         - Save the observation and redirect.
         """
-        observation = form.save(commit=False)
-        observation.status = 'AWAITING VERIFICATION'
-        observation.save()
+        form.instance.status = 'AWAITING_VERIFICATION'
         messages.success(self.request, "Rectification details submitted successfully, pending for verification!.")
-        return super().form_valid(form)
+        response = super().form_valid(form)
+        form.release_uploads()
+        return response
 
     def test_func(self):
         """
@@ -191,7 +300,7 @@ class VerificationView(LoginRequiredMixin, UserPassesTestMixin, OrganizationQuer
             observation.date_closed = timezone.now()
             messages.success(self.request, "✅ Observation verified and closed successfully.")
         else:
-            observation.status = 'IN PROGRESS'
+            observation.status = 'IN_PROGRESS'
             messages.warning(self.request, "⚠️ Observation sent back for rework.")
 
         observation.save()
@@ -219,12 +328,16 @@ def delete_observation(request, pk):
 @login_required
 def archived_observations_list(request):
     """List all archived (closed) observations"""
-    archived = Observation.objects.filter(is_archived=True, organization=request.organization).order_by('-id')
+    # Archived rows live in the archive tier (see observations/tiers.py).
+    archived = (
+        ArchivedObservation.objects
+        .filter(organization=request.organization)
+        .select_related('location')
+    )
 
     # Handle pagination
-    paginator = Paginator(archived, 10)  # Show 10 observations per page
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    paginator = KeysetPaginator(archived, ordering=('-id',), per_page=10, estimate_total=True)
+    page_obj = paginator.get_page(request.GET.get('cursor'))
     context = {
         'observations': page_obj,
         'page_obj': page_obj,
@@ -241,343 +354,231 @@ def is_safety_manager(user):
 @user_passes_test(is_safety_manager)
 def archive_observation(request, pk):
     obs = get_object_or_404(Observation, pk=pk, organization=request.organization)
-    obs.is_archived = True
-    obs.save()
+    tiers.archive(Observation.objects.filter(pk=obs.pk))
     return redirect("observations:observation_list")
     # return redirect("observations:archived_list")
 
 
+@login_required
 def restore_observation(request, pk):
-    obs = get_object_or_404(Observation, pk=pk, organization=request.organization)
-    obs.is_archived = False
-    obs.save()
+    obs = get_object_or_404(ArchivedObservation, pk=pk, organization=request.organization)
+    tiers.restore(ArchivedObservation.objects.filter(pk=obs.pk))
     return redirect("observations:archived_list")
     # return redirect("observations:observation_list")
 
-from openpyxl import Workbook
 
+@login_required
 def export_observations_excel(request):
-    """Download all observations as Excel file"""
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "Observations"
-
-    headers = [
-        "ID",
-        "Title",
-        "Description",
-        "Location",
-        "Status",
-        "Observer",
-        "Created At",
-    ]
-    ws.append(headers)
-
-    for obs in Observation.objects.all(organization=request.organization).select_related("observer"):
-        ws.append([
-            obs.id,
-            obs.title,
-            obs.description,
-            str(obs.location),
-            obs.status,
-            obs.observer.username if obs.observer else "",
-            obs.date_observed.strftime("%Y-%m-%d %H:%M"),
-        ])
-
-    response = HttpResponse(
-        content_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-    )
-    response["Content-Disposition"] = 'attachment; filename="observations.xlsx"'
-
-    wb.save(response)
-    return response
-
-    # observations/views.py
+    """Download the observations matching the list page's filters as Excel file"""
+    if not request.organization:
+        raise PermissionDenied("No organization associated with the user.")
 
-import csv
-from django.http import HttpResponse
-from .models import Observation
+    queryset = filter_observations(export_queryset(request.organization), request.organization, request.GET)
 
-def export_observations_csv(request):
-    """Download all observations as CSV"""
-    response = HttpResponse(content_type="text/csv")
-    response["Content-Disposition"] = 'attachment; filename="observations.csv"'
+    if needs_background(queryset):
+        export = ObservationExport.objects.create(
+            organization=request.organization,
+            requested_by=request.user,
+            format='xlsx',
+            filters=list_filters(request.GET),
+        )
+        submit_export(export)
+        messages.info(request, "This export is large, so it is being prepared in the background.")
+        return redirect("observations:export_status", pk=export.pk)
+
+    fileobj = tempfile.TemporaryFile()
+    write_xlsx(export_rows(queryset), fileobj)
+    fileobj.seek(0)
+    return FileResponse(
+        fileobj,
+        as_attachment=True,
+        filename="observations.xlsx",
+        content_type=XLSX_CONTENT_TYPE,
+    )
 
-    writer = csv.writer(response)
-    writer.writerow([
-        "ID",
-        "Title",
-        "Description",
-        "Location",
-        "Status",
-        "Observer",
-        "Created At",
-    ])
-
-    for obs in Observation.objects.all(organization=request.organization).select_related("observer"):
-        writer.writerow([
-            obs.id,
-            obs.title,
-            obs.description,
-            obs.location,
-            obs.status,
-            obs.observer.username if obs.observer else "",
-            obs.date_observed.strftime("%Y-%m-%d %H:%M"),
-        ])
 
-    return response
+@login_required
+def export_status(request, pk):
+    """Progress page of a background export, with the download link once done."""
+    export = get_object_or_404(ObservationExport, pk=pk, organization=request.organization)
+    return render(request, "observations/export_status.html", {"export": export})
 
-# Add API endpoint to create a Location
-@require_POST
-def ajax_add_location(request):
-    form = LocationForm(request.POST)
-    if form.is_valid():
-        location = form.save()
-        return JsonResponse({
-            "success": True,
-            "id": location.id,
-            "name": location.name,
-        })
-    else:
-        return JsonResponse({
-            "success": False,
-            "errors": form.errors,
-        })
 
-# Dashboard view
+@login_required
+def export_download(request, pk):
+    export = get_object_or_404(
+        ObservationExport, pk=pk, organization=request.organization, status='DONE'
+    )
+    try:
+        fileobj = open(export_path(export), "rb")
+    except FileNotFoundError:
+        raise Http404("Export file no longer exists.")
+    return FileResponse(
+        fileobj,
+        as_attachment=True,
+        filename=export.filename,
+        content_type=XLSX_CONTENT_TYPE,
+    )
 
-# import pandas as pd
-import plotly.express as px
-from plotly.io import to_image
-import plotly.io as pio  
-from django.http import HttpResponse
-from django.db.models import Count, Q
-from django.shortcuts import render
-from .models import Observation, Location
-from datetime import datetime
 
 @login_required
-def observations_dashboard(request):
+def export_observations_csv(request):
     """
-    Clean, database-safe dashboard view
+    Stream the observations matching the list page's filters as CSV.
     """
+    if not request.organization:
+        raise PermissionDenied("No organization associated with the user.")
 
-    # -------------------------------
-    # 1. Base queryset (ACTIVE ONLY)
-    # -------------------------------
-    qs = Observation.objects.filter(is_archived=False, organization=request.organization)
-
-    today = date.today()
+    rows = export_rows(filter_observations(export_queryset(request.organization), request.organization, request.GET))
+    response = StreamingHttpResponse(stream_csv(rows), content_type="text/csv")
+    response["Content-Disposition"] = 'attachment; filename="observations.csv"'
+    return response
 
-    # -------------------------------
-    # 2. KPI CARDS (SAFE)
-    # -------------------------------
-    total_obs = qs.count()
+# Spreadsheet imports (see imports.py)
 
-    open_obs = qs.filter(status__in=["OPEN", "IN_PROGRESS"]).count()
+def _require_importer(request):
+    if not request.organization:
+        raise PermissionDenied("No organization associated with the user.")
+    if not (request.user.is_manager or request.user.is_superuser):
+        raise PermissionDenied("Only managers can import observations.")
 
-    closed_obs = qs.filter(status="CLOSED").count()
 
-    overdue_obs = qs.filter(
-        target_date__lt=today
-    ).exclude(status="CLOSED").count()
+@login_required
+def import_observations(request):
+    """Upload a CSV/Excel file of observations; large files are imported in the background."""
+    _require_importer(request)
+    if request.method == 'POST':
+        form = ObservationImportForm(request.POST, request.FILES)
+        if form.is_valid():
+            observation_import = imports.save_upload(request.organization, request.user, form.cleaned_data['file'])
+            if imports.needs_background(observation_import):
+                imports.submit_import(observation_import)
+                messages.info(request, "The file is being imported in the background.")
+            else:
+                imports.run_import(observation_import.pk)
+            return redirect("observations:import_status", pk=observation_import.pk)
+    else:
+        form = ObservationImportForm()
+    recent = ObservationImport.objects.filter(organization=request.organization).order_by('-created_at')[:10]
+    return render(request, "observations/import_form.html", {"form": form, "imports": recent})
 
-    # -------------------------------
-    # 3. Trend selector (GET param)
-    # -------------------------------
-    trend = request.GET.get("trend", "monthly")
 
-    trunc_map = {
-        "daily": TruncDay("date_observed"),
-        "weekly": TruncWeek("date_observed"),
-        "monthly": TruncMonth("date_observed"),
-    }
+@login_required
+def import_status(request, pk):
+    """Progress and outcome of an import, with the error report once done."""
+    _require_importer(request)
+    observation_import = get_object_or_404(ObservationImport, pk=pk, organization=request.organization)
+    return render(request, "observations/import_status.html", {"import": observation_import})
 
-    trunc_func = trunc_map.get(trend, TruncMonth("date_observed"))
 
-    # -------------------------------
-    # 4. Trend aggregation (DB SAFE)
-    # -------------------------------
-    trend_qs = (
-        qs.annotate(period=trunc_func)
-          .values("period")
-          .annotate(count=Count("id"))
-          .order_by("period")
+@login_required
+def import_error_report(request, pk):
+    _require_importer(request)
+    observation_import = get_object_or_404(
+        ObservationImport, pk=pk, organization=request.organization, status='DONE'
     )
-
-    # -------------------------------
-    # 5. Prepare Plotly data
-    # -------------------------------
-    labels = [
-        row["period"].strftime("%Y-%m-%d") for row in trend_qs if row["period"]
-    ]
-    values = [row["count"] for row in trend_qs]
-
-    fig = px.line(
-        x=labels,
-        y=values,
-        markers=True,
-        title=f"{trend.capitalize()} Observation Trend",
-        labels={"x": "Date", "y": "Observations"}
+    if not observation_import.error_report_path:
+        raise Http404("This import has no errors.")
+    try:
+        fileobj = open(imports.import_path(observation_import.error_report_path), "rb")
+    except FileNotFoundError:
+        raise Http404("Error report no longer exists.")
+    return FileResponse(
+        fileobj,
+        as_attachment=True,
+        filename=observation_import.error_report_filename,
+        content_type="text/csv",
     )
-    fig.update_layout(modebar_add=["toImage"])
 
-    chart_html = fig.to_html(full_html=False)
+# Chunked photo uploads (see uploads.py)
 
-    severity_qs = (
-    qs.values("severity")
-      .annotate(count=Count("id"))
-      .order_by("severity")
-    )
-
-    severity_labels = [row["severity"] for row in severity_qs]
-    severity_values = [row["count"] for row in severity_qs]
+@login_required
+@require_POST
+def photo_upload_start(request):
+    if not request.organization:
+        raise PermissionDenied("No organization associated with the user.")
+    try:
+        upload = uploads.start_upload(
+            request.organization,
+            request.user,
+            request.POST.get("filename"),
+            request.POST.get("size"),
+            chunk_size=request.POST.get("chunk_size"),
+            sha256=request.POST.get("sha256", ""),
+        )
+    except uploads.UploadError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+    return JsonResponse(uploads.status(upload), status=201)
 
-    severity_fig = px.bar(
-        x=severity_labels,
-        y=severity_values,
-        title="Observations by Severity",
-        labels={"x": "Severity", "y": "Count"},
-    )
 
-    severity_fig.update_layout(modebar_add=["toImage"])
-    severity_plot = severity_fig.to_html(full_html=False)
+@login_required
+def photo_upload_status(request, pk):
+    upload = get_object_or_404(PhotoUpload, pk=pk, uploaded_by=request.user)
+    return JsonResponse(uploads.status(upload))
 
-    status_qs = (
-    qs.values("status")
-      .annotate(count=Count("id"))
-    )
 
-    status_labels = [row["status"] for row in status_qs]
-    status_values = [row["count"] for row in status_qs]
+@login_required
+@require_POST
+def photo_upload_chunk(request, pk, index):
+    """
+    Store one chunk: the raw request body, with its SHA-256 hex digest in
+    the X-Chunk-SHA256 header. Safe to repeat.
+    """
+    upload = get_object_or_404(PhotoUpload, pk=pk, uploaded_by=request.user)
+    try:
+        if upload.status == "UPLOADING":
+            uploads.write_chunk(upload, index, request.body, request.headers.get("X-Chunk-SHA256"))
+            uploads.assemble(upload)
+    except uploads.UploadError as e:
+        return JsonResponse({"error": str(e), **uploads.status(upload)}, status=400)
+    return JsonResponse(uploads.status(upload))
 
-    status_fig = px.pie(
-        names=status_labels,
-        values=status_values,
-        title="Observations by Status",
-    )
 
-    status_fig.update_layout(modebar_add=["toImage"])
-    status_plot = status_fig.to_html(full_html=False)
-    #-------------------------------
-    # 7. Observer Performance
-    #-------------------------------
-    observer_qs = (
-        Observation.objects
-        .filter(organization=request.organization)
-        .values(Observer=F("observer__email"))
-        .annotate(total=Count("id"))
-        .filter(observer__isnull=False)
-        .order_by("-total")
-        )
-    observer_df = pd.DataFrame(list(observer_qs))
-    # print(observer_df)
-    if not observer_df.empty:
-        observer_fig = px.bar(
-            observer_df,
-            x="Observer",
-            y="total",
-            title="Observers – Observations Reported",
-            labels={"Observer": "Observer", "total": "Observations"},
-            color="total",
-            )
-        observer_plot = observer_fig.to_html(full_html=False)
+# Add API endpoint to create a Location
+@require_POST
+def ajax_add_location(request):
+    form = LocationForm(request.POST)
+    if form.is_valid():
+        location = form.save()
+        return JsonResponse({
+            "success": True,
+            "id": location.id,
+            "name": location.name,
+        })
     else:
-        observer_fig = px.bar(
-            pd.DataFrame(columns=["Observer", "total"]),
-            x="Observer",
-            y="total",
-            title="Observers – Observations Reported",
-            labels={"Observer": "Observer", "total": "Observations"},
-            color=[],
-            )
-        # observer_plot = "<p>No data available</p>"
+        return JsonResponse({
+            "success": False,
+            "errors": form.errors,
+        })
 
-    #---------------------------------
-    # 8. Action Owner Performance
-    #---------------------------------
-    owner_qs = (
-        Observation.objects
-        .filter(organization=request.organization)
-        .values(owner=F("assigned_to__email"))
-        .annotate(total=Count("id"))
-        .filter(assigned_to__isnull=False)
-        .order_by("-total")
-    )
-    owner_df = pd.DataFrame(list(owner_qs))
-    if not owner_df.empty:
-        owner_fig = px.bar(
-            owner_df,
-            x="owner",
-            y="total",
-            title="Action Owners – Tasks Assigned",
-            labels={"owner": "Action Owner", "total": "Assigned Tasks"},
-            color="total",
-        )
-        owner_plot = owner_fig.to_html(full_html=False)
-    else:
-        owner_fig = px.bar(
-            pd.DataFrame(columns=["owner", "total"]),
-            x="owner",
-            y="total",
-            title="Action Owners – Tasks Assigned",
-        labels={"owner": "Action Owner", "total": "Assigned Tasks"},
-        color="total",
-    )
-        # owner_plot = "<p>No data available</p>"
+# Dashboard view
+
+from .analytics import normalize_trend
+from .cache import get_dashboard_payload
+from .charts import PLOTLY_STATIC_PATH
 
-    #--------------------------------
-    # 9. Safety Manager Performance
-    #--------------------------------
-    manager_qs = (
-        Observation.objects
-        .filter(organization=request.organization)
-        .filter(status="CLOSED")
-        .values(safety_manager=F("assigned_to__email"))
-        .annotate(total=Count("id"))
-        .order_by("-total")
-    )
-    safety_manager_df = pd.DataFrame(list(manager_qs))
-    if not safety_manager_df.empty:
-        manager_fig = px.bar(
-            safety_manager_df,
-            x="safety_manager",
-            y="total",
-            title="Safety Managers – Observations Closed",
-            labels={"safety_manager": "Manager", "total": "Closed Observations"},
-            color="total",
-        )
-        # manager_plot = manager_fig.to_html(full_html=False)
-    else:
-        manager_fig = px.bar(
-            pd.DataFrame(columns=["safety_manager", "total"]),
-            x="safety_manager",
-            y="total",
-            title="Safety Managers – Observations Closed",
-            labels={"safety_manager": "Manager", "total": "Closed Observations"},
-            color="total",
-    )
-        
-        # manager_plot = "<p>No data available</p>"
 
-    # -------------------------------
-    # 6. Final context
-    # -------------------------------
+@login_required
+def observations_dashboard(request):
+    """
+    Dashboard page. Only renders the shell; KPIs and charts are fetched from
+    dashboard_chart_data and drawn client-side.
+    """
     context = {
-        "total_obs": total_obs,
-        "open_obs": open_obs,
-        "closed_obs": closed_obs,
-        "overdue_obs": overdue_obs,
-        "chart_html": chart_html,
-        "trend": trend,
-        "severity_plot": severity_plot,
-        "status_plot": status_plot,
-        "observer_plot": pio.to_html(observer_fig, full_html=False),
-        "owner_plot": pio.to_html(owner_fig, full_html=False),
-        "manager_plot": pio.to_html(manager_fig, full_html=False),
+        "trend": normalize_trend(request.GET.get("trend", "monthly")),
+        "plotly_static_path": PLOTLY_STATIC_PATH,
     }
-
     return render(request, "observations/dashboard.html", context)
 
 
+@login_required
+def dashboard_chart_data(request):
+    """JSON KPIs and plotly chart specs for the dashboard (cached per data version)."""
+    if not request.organization:
+        raise PermissionDenied("No organization associated with the user.")
 
+    payload = get_dashboard_payload(
+        request.organization,
+        trend=request.GET.get("trend", "monthly"),
+    )
+    return JsonResponse(payload)
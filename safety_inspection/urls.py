@@ -48,6 +48,9 @@ urlpatterns = [
     
     # Observations app URLs
     path('observations/', include('observations.urls', namespace='observations')),
+
+    # JSON API
+    path('api/v1/', include('core.api_urls')),
     
 
 ]
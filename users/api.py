@@ -0,0 +1,32 @@
+# users/api.py
+"""JSON API endpoint listing the members of the token's organization (see core/api.py)."""
+from django.contrib.auth import get_user_model
+
+from core.api import api_view, json_response, paginate, select_fields
+
+User = get_user_model()
+
+USER_FIELDS = (
+    "id",
+    "email",
+    "is_active",
+    "is_manager",
+    "is_safety_manager",
+    "is_observer",
+    "is_action_owner",
+)
+
+
+@api_view("GET")
+def user_list(request):
+    fields = select_fields(request, USER_FIELDS)
+    queryset = User.objects.filter(organization=request.organization)
+    if request.GET.get("is_active") in ("true", "false"):
+        queryset = queryset.filter(is_active=request.GET["is_active"] == "true")
+    data = paginate(
+        request,
+        queryset.values(*{"id", *fields}),
+        lambda row: {name: row[name] for name in fields},
+        ordering=("id",),
+    )
+    return json_response(request, data)